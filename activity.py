@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Аналитика активности на HyperLogLog
+
+Приблизительное число уникальных пользователей за день, неделю и месяц
+(DAU/WAU/MAU) без сканирования users.last_activity:
+- на каждый день и метрику заводится скетч HyperLogLog фиксированного
+  размера (2^precision байт, по умолчанию 4 КБ, ошибка ~1,6%);
+- отметка активности - хэш и максимум в одном регистре, без обращения к БД;
+- окно любой длины считается объединением дневных скетчей (поэлементный
+  максимум регистров), повторные посещения в разные дни не задваиваются;
+- скетчи хранятся в SQLite как BLOB, изменившиеся пишутся одной транзакцией
+  в фоновой задаче обслуживания и при завершении работы.
+"""
+
+import hashlib
+import logging
+import math
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+METRIC_USERS = 'users'
+METRIC_CALCULATORS = 'calculators'
+
+# Окна отчета, дней
+WINDOWS = {'day': 1, 'week': 7, 'month': 30}
+
+# 2^-r для всех возможных значений регистра
+_INVERSE_POWERS = [2.0 ** -r for r in range(65)]
+
+
+class HyperLogLog:
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        size = len(blob)
+        precision = size.bit_length() - 1
+        if size < 16 or size != 1 << precision:
+            raise ValueError(f"некорректный размер скетча: {size} байт")
+        return cls(precision, bytearray(blob))
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        bits = 64 - self.precision
+        index = hashed >> bits
+        # Ранг - позиция первой единицы в оставшихся битах
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("скетчи разной точности нельзя объединить")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        registers = self.registers
+        size = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(_INVERSE_POWERS[r] for r in registers)
+        if estimate <= 2.5 * size:
+            # Малые значения: линейный счет по пустым регистрам точнее
+            zeros = registers.count(0)
+            if zeros:
+                estimate = size * math.log(size / zeros)
+        return round(estimate)
+
+
+class ActivityTracker:
+    def __init__(self, persistence=None, precision=12, window_days=30):
+        self.persistence = persistence
+        self.precision = precision
+        self.window_days = window_days
+        # (день 'YYYY-MM-DD', метрика) -> HyperLogLog за последние window_days дней
+        self._sketches = {}
+        self._dirty = set()
+        self.recorded = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        if persistence is not None:
+            self._load()
+
+    def _load(self):
+        since = (date.today() - timedelta(days=self.window_days - 1)).isoformat()
+        for day, metric, blob in self.persistence.load_activity_sketches(since):
+            try:
+                self._sketches[(day, metric)] = HyperLogLog.from_bytes(blob)
+            except ValueError as e:
+                logger.warning(f"⚠️ Пропущен скетч активности {day}/{metric}: {e}")
+
+    def _sketch(self, day, metric):
+        sketch = self._sketches.get((day, metric))
+        if sketch is None:
+            sketch = self._sketches[(day, metric)] = HyperLogLog(self.precision)
+        return sketch
+
+    def record(self, user_id, metric=METRIC_USERS):
+        """Отмечает активность пользователя за сегодня"""
+        day = date.today().isoformat()
+        self._sketch(day, metric).add(user_id)
+        if self.persistence is not None:
+            self._dirty.add((day, metric))
+        self.recorded += 1
+
+    def count(self, metric=METRIC_USERS, days=1):
+        """Приблизительное число уникальных пользователей за последние days дней"""
+        today = date.today()
+        union = HyperLogLog(self.precision)
+        for offset in range(days):
+            sketch = self._sketches.get(((today - timedelta(days=offset)).isoformat(), metric))
+            if sketch is not None:
+                union.merge(sketch)
+        return union.count()
+
+    def get_summary(self):
+        """{метрика: {окно: число}} для отчетов админа"""
+        return {
+            metric: {name: self.count(metric, days) for name, days in WINDOWS.items()}
+            for metric in (METRIC_USERS, METRIC_CALCULATORS)
+        }
+
+    def flush(self):
+        """Записывает изменившиеся скетчи в БД и забывает дни за пределами окна
+        
+        Скетчи остаются помеченными, пока БД не подтвердит запись: после
+        ошибки они уйдут при следующем flush и не будут забыты как старые.
+        """
+        if self.persistence is not None and self._dirty:
+            rows = [(day, metric, self._sketches[(day, metric)].to_bytes()) for day, metric in self._dirty]
+            if self.persistence.save_activity_sketches(rows):
+                self._dirty.clear()
+                self.flushes += 1
+            else:
+                self.flush_errors += 1
+        oldest = (date.today() - timedelta(days=self.window_days - 1)).isoformat()
+        for key in [key for key in self._sketches if key[0] < oldest and key not in self._dirty]:
+            del self._sketches[key]
+
+    def get_stats(self):
+        return {
+            'recorded': self.recorded,
+            'sketches': len(self._sketches),
+            'sketch_bytes': len(self._sketches) * (1 << self.precision),
+            'dirty': len(self._dirty),
+            'flushes': self.flushes,
+            'flush_errors': self.flush_errors,
+        }
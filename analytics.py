@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Аналитика использования для админ-панели
+
+Отчет по calculation_history, users и user_calc_daily: вычисления по часам
+и дням недели, распределение числа вычислений на пользователя, ошибки по дням.
+- таблицы читаются пачками (Database.iter_*), каждая пачка превращается
+  в массив NumPy и сворачивается в счетчики фиксированного размера
+  (np.bincount), поэтому память не зависит от числа строк;
+- перцентили считаются по гистограмме: точные значения до COUNT_CAP
+  вычислений на пользователя, все что выше - одной корзиной;
+- отчет строится в отдельном потоке и кэшируется на ttl секунд;
+  вместе с текстом запоминается возраст прочитанных данных (реплика
+  может быть старше основной БД), get_data_age() учитывает и то и другое.
+Без NumPy отчет не строится, остальная статистика админа работает.
+"""
+
+import asyncio
+import logging
+import time
+from itertools import chain
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Предел точной гистограммы вычислений на пользователя
+COUNT_CAP = 10000
+PERCENTILES = (50, 90, 99)
+# Корзины распределения вычислений на пользователя: (от, до включительно)
+COUNT_BUCKETS = ((1, 1), (2, 5), (6, 20), (21, 100), (101, None))
+WEEKDAY_NAMES = ('Вс', 'Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб')
+# Порядок вывода дней недели: с понедельника
+WEEKDAY_ORDER = (1, 2, 3, 4, 5, 6, 0)
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+
+def sparkline(values):
+    """Строка из блоков ▁..█, высота пропорциональна значению"""
+    values = np.asarray(values, dtype=np.float64)
+    if not values.size:
+        return ''
+    bottom, top = values.min(), values.max()
+    if top == bottom:
+        return SPARK_CHARS[0 if top <= 0 else len(SPARK_CHARS) // 2] * values.size
+    # Шкала от минимума до максимума, чтобы были видны колебания, а не только уровень
+    levels = np.minimum(((values - bottom) / (top - bottom) * len(SPARK_CHARS)).astype(np.int64),
+                        len(SPARK_CHARS) - 1)
+    return ''.join(SPARK_CHARS[level] for level in levels)
+
+
+def _chunk_array(rows, columns):
+    """Пачка строк из SQLite -> массив int64 формы (n, columns) без промежуточных списков"""
+    flat = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * columns)
+    return flat.reshape(-1, columns)
+
+
+class UsageReport:
+    """Свернутые счетчики отчета; размер не зависит от числа строк в таблицах"""
+
+    def __init__(self):
+        # Вычисления по часам недели: строка - день недели (0 - воскресенье), столбец - час
+        self.week_hours = np.zeros((7, 24), dtype=np.int64)
+        self.user_counts = np.zeros(COUNT_CAP + 1, dtype=np.int64)
+        self.max_count = 0
+        self.daily = []
+        self.rows_scanned = 0
+
+    @property
+    def hours(self):
+        return self.week_hours.sum(axis=0)
+    
+    @property
+    def weekdays(self):
+        return self.week_hours.sum(axis=1)
+    
+    def add_calculation_times(self, rows):
+        week_hours = _chunk_array(rows, 1)[:, 0]
+        self.week_hours += np.bincount(week_hours, minlength=7 * 24)[:7 * 24].reshape(7, 24)
+        self.rows_scanned += len(rows)
+
+    def add_user_counts(self, rows):
+        counts = _chunk_array(rows, 1)[:, 0]
+        if counts.size:
+            self.max_count = max(self.max_count, int(counts.max()))
+        self.user_counts += np.bincount(np.clip(counts, 0, COUNT_CAP), minlength=COUNT_CAP + 1)
+        self.rows_scanned += len(rows)
+
+    def percentiles(self):
+        """Перцентили вычислений среди пользователей, которые хоть раз считали"""
+        active = self.user_counts[1:]
+        total = int(active.sum())
+        if not total:
+            return {}
+        cumulative = np.cumsum(active)
+        ranks = np.searchsorted(cumulative, [total * q / 100 for q in PERCENTILES])
+        return {q: int(rank) + 1 for q, rank in zip(PERCENTILES, ranks)}
+
+    def render(self):
+        lines = ["📈 **Аналитика использования**", ""]
+
+        hours = self.hours
+        weekdays = self.weekdays
+        total = int(hours.sum())
+        lines.append(f"🕒 Вычисления по часам (история, {total}):")
+        if total:
+            lines.append(f"`{sparkline(hours)}`")
+            lines.append("`0     6     12    18   23`")
+            peaks = np.argsort(hours)[::-1][:3]
+            lines.append("Пик: " + ", ".join(
+                f"{hour:02d}:00 ({hours[hour] / total * 100:.0f}%)" for hour in peaks if hours[hour]))
+            lines.append("📅 " + " · ".join(
+                f"{WEEKDAY_NAMES[day]} {weekdays[day] / total * 100:.0f}%" for day in WEEKDAY_ORDER))
+        else:
+            lines.append("нет данных")
+
+        users_total = int(self.user_counts.sum())
+        lines.append("")
+        lines.append("👥 Вычислений на пользователя:")
+        lines.append(f"• Без вычислений: {int(self.user_counts[0])} из {users_total}")
+        percentiles = self.percentiles()
+        if percentiles:
+            values = " / ".join(
+                f"≥{COUNT_CAP}" if value >= COUNT_CAP else str(value) for value in percentiles.values())
+            names = " / ".join(f"p{q}" for q in percentiles)
+            lines.append(f"• {names} / max: {values} / {self.max_count}")
+            buckets = []
+            for low, high in COUNT_BUCKETS:
+                count = int(self.user_counts[low:(high + 1 if high else None)].sum())
+                label = f"{low}-{high}" if high and high != low else (str(low) if high else f"{low}+")
+                buckets.append(f"{label}: {count}")
+            lines.append("• " + " · ".join(buckets))
+
+        lines.append("")
+        if self.daily:
+            calculations = np.array([row[1] or 0 for row in self.daily], dtype=np.int64)
+            errors = np.array([row[2] or 0 for row in self.daily], dtype=np.int64)
+            attempts = calculations + errors
+            rates = np.divide(errors, attempts, out=np.zeros(len(errors), dtype=np.float64), where=attempts > 0)
+            worst = int(np.argmax(rates))
+            overall = errors.sum() / attempts.sum() * 100 if attempts.sum() else 0.0
+            lines.append(f"❗ Ошибки по дням ({len(self.daily)} дн.): `{sparkline(rates)}`")
+            lines.append(f"• Всего {overall:.1f}%, худший день {self.daily[worst][0]}: {rates[worst] * 100:.1f}%")
+            lines.append(f"🧮 Вычисления по дням: `{sparkline(calculations)}`")
+        else:
+            lines.append("❗ Ошибки по дням: нет данных")
+        return "\n".join(lines)
+
+
+def build_usage_report(database, chunk_size=100000, days=14):
+    """Строит отчет, читая таблицы пачками по chunk_size строк"""
+    report = UsageReport()
+    for rows in database.iter_calculation_times(chunk_size):
+        report.add_calculation_times(rows)
+    for rows in database.iter_user_calculation_counts(chunk_size):
+        report.add_user_counts(rows)
+    report.daily = database.get_daily_calculation_totals(days)
+    return report
+
+
+class UsageAnalytics:
+    def __init__(self, database, ttl=300, chunk_size=100000):
+        self.database = database
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self._cached = None
+        self._lock = None
+        self.builds = 0
+        self.last_build_ms = 0.0
+        self.last_rows = 0
+
+    def _build(self):
+        started = time.perf_counter()
+        # Момент, на который актуальны прочитанные данные
+        data_time = time.monotonic() - self.database.get_read_age()
+        report = build_usage_report(self.database, self.chunk_size)
+        self.last_build_ms = (time.perf_counter() - started) * 1000
+        self.last_rows = report.rows_scanned
+        self.builds += 1
+        return report.render(), data_time
+
+    async def get_report_text(self):
+        """Текст отчета; полные проходы по таблицам не чаще раза в ttl секунд и не в цикле событий"""
+        if np is None:
+            return "📈 Аналитика недоступна: установите numpy"
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            cached = self._cached
+            if cached is None or time.monotonic() - cached[0] > self.ttl:
+                try:
+                    text, data_time = await asyncio.get_running_loop().run_in_executor(None, self._build)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка построения аналитики: {e}")
+                    return "📈 Аналитика временно недоступна"
+                cached = self._cached = (time.monotonic(), text, data_time)
+            return cached[1]
+    
+    def get_data_age(self):
+        """Возраст данных кэшированного отчета в секундах; None - отчета еще нет"""
+        if self._cached is None:
+            return None
+        return time.monotonic() - self._cached[2]
+
+    def get_stats(self):
+        return {
+            'builds': self.builds,
+            'last_build_ms': round(self.last_build_ms, 1),
+            'last_rows_scanned': self.last_rows,
+        }
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Защита от флуда
+
+Outer middleware диспетчера aiogram с token bucket на каждого пользователя.
+Стоит перед фильтрами и обработчиками, поэтому лишние апдейты отбрасываются
+до обращений к БД и Bot API:
+- сообщения и callback-запросы сверх лимита не обрабатываются;
+- на первый отброшенный апдейт пользователь получает одно предупреждение
+  (ответ на callback или сообщение), остальные отбрасываются молча;
+  следующее предупреждение возможно только после паузы, за которую
+  корзина наполнилась целиком, поэтому ровный флуд чуть выше лимита
+  не превращается в sendMessage на каждый отброшенный апдейт;
+  на каждый отброшенный callback отправляется пустой answer(), чтобы
+  у клиента не висели «часики» на кнопке;
+- корзины, простоявшие дольше idle_ttl, удаляются, память не растет
+  с числом пользователей, которые когда-то писали боту;
+- админ лимитам не подчиняется.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+logger = logging.getLogger(__name__)
+
+FLOOD_WARNING = "⏳ Слишком много запросов, подождите пару секунд"
+
+
+class UserBucket:
+    __slots__ = ('tokens', 'updated', 'warned')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+        # Предупреждение уже отправлено; снимается, только когда корзина снова полная
+        self.warned = False
+
+
+class AntiFloodMiddleware(BaseMiddleware):
+    def __init__(self, rate=2.0, burst=10, idle_ttl=60.0, exempt_ids=()):
+        self.rate = rate
+        self.burst = burst
+        self.idle_ttl = idle_ttl
+        self.exempt_ids = frozenset(exempt_ids)
+        # user_id -> UserBucket, порядок - по последнему обращению (в начале самые старые)
+        self._buckets = OrderedDict()
+        self.passed = 0
+        self.dropped = 0
+        self.warnings_sent = 0
+        self.flooders = 0
+        self.evicted = 0
+
+    def _evict(self, now):
+        buckets = self._buckets
+        while buckets:
+            user_id, bucket = next(iter(buckets.items()))
+            if now - bucket.updated < self.idle_ttl:
+                break
+            del buckets[user_id]
+            self.evicted += 1
+
+    def allow(self, user_id, now=None):
+        """Тратит токен пользователя; возвращает корзину, если токенов нет, иначе None"""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            self._evict(now)
+            bucket = self._buckets[user_id] = UserBucket(float(self.burst), now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            self._buckets.move_to_end(user_id)
+            if bucket.tokens >= self.burst:
+                # Пользователь сделал паузу: новая серия флуда снова получит предупреждение
+                bucket.warned = False
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return None
+        return bucket
+
+    async def _warn(self, event):
+        # У сообщения answer отправляет ответ в чат, у callback - всплывающее уведомление
+        try:
+            await event.answer(FLOOD_WARNING)
+            self.warnings_sent += 1
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось предупредить о флуде: {e}")
+    
+    async def _answer_silently(self, query):
+        # Неотвеченный callback держит «часики» на кнопке у клиента
+        try:
+            await query.answer()
+        except Exception as e:
+            logger.debug(f"Не удалось ответить на отброшенный callback: {e}")
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        if user is None or user.id in self.exempt_ids:
+            return await handler(event, data)
+
+        bucket = self.allow(user.id)
+        if bucket is None:
+            self.passed += 1
+            return await handler(event, data)
+
+        self.dropped += 1
+        if not bucket.warned:
+            bucket.warned = True
+            self.flooders += 1
+            logger.warning(f"⚠️ Флуд от пользователя {user.id}, апдейты отбрасываются")
+            await self._warn(event)
+        elif isinstance(event, CallbackQuery):
+            await self._answer_silently(event)
+        return None
+
+    def get_stats(self):
+        total = self.passed + self.dropped
+        return {
+            'passed': self.passed,
+            'dropped': self.dropped,
+            'drop_rate': self.dropped / total if total else 0.0,
+            'flood_episodes': self.flooders,
+            'warnings_sent': self.warnings_sent,
+            'tracked_users': len(self._buckets),
+            'evicted': self.evicted,
+        }
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Повторы исходящих запросов к Bot API
+
+Middleware сессии aiogram оборачивает каждый исходящий вызов бота:
+- 429 (TelegramRetryAfter) закрывает общий для процесса шлюз до момента T,
+  поэтому один ответ 429 приостанавливает всех отправителей сразу;
+- сетевые ошибки и 5xx повторяются с экспоненциальной задержкой и jitter,
+  но только для идемпотентных методов (get*, edit*, answer*, ...): первая
+  попытка sendMessage могла дойти до Telegram, и повтор дал бы дубль;
+- общий бюджет повторов не дает повторам умножить нагрузку при сбоях.
+"""
+
+import asyncio
+import logging
+import random
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import GetUpdates
+
+logger = logging.getLogger(__name__)
+
+# Методы, повтор которых не создает дублей: чтение, правка, ответы и установка значений
+IDEMPOTENT_PREFIXES = ('Get', 'Edit', 'Answer', 'Delete', 'Set')
+
+
+def is_idempotent(method):
+    return type(method).__name__.startswith(IDEMPOTENT_PREFIXES)
+
+
+class RateLimitGate:
+    """Общий для процесса флаг «лимит запросов до момента T»"""
+
+    def __init__(self):
+        self.blocked_until = 0.0
+
+    def block(self, seconds):
+        until = time.monotonic() + seconds
+        if until > self.blocked_until:
+            self.blocked_until = until
+            logger.warning(f"⚠️ Лимит запросов Bot API, все отправки приостановлены на {seconds} сек")
+
+    def remaining(self):
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    async def wait(self):
+        delay = self.remaining()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            # За время ожидания шлюз мог быть продлен новым 429
+            delay = self.remaining()
+
+
+class RetryBudget:
+    """Бюджет повторов: пополняется со временем, каждый повтор тратит одну единицу"""
+
+    def __init__(self, capacity=20, refill_per_second=1.0):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def try_spend(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Экспоненциальная задержка с полным jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RetryMiddleware(BaseRequestMiddleware):
+    def __init__(self, gate=None, budget=None, max_retries=3, base_delay=0.5, max_delay=30.0):
+        self.gate = gate or rate_limit_gate
+        self.budget = budget or retry_budget
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.exhausted = 0
+
+    async def __call__(self, make_request, bot, method):
+        # Long polling не отправитель: у start_polling свой backoff
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+
+        attempt = 0
+        while True:
+            await self.gate.wait()
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.gate.block(e.retry_after)
+                delay = 0.0
+                error = e
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if not is_idempotent(method):
+                    # Запрос мог выполниться до обрыва: повтор sendMessage/sendDocument дал бы дубль
+                    raise
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                error = e
+
+            if attempt >= self.max_retries or not self.budget.try_spend():
+                self.exhausted += 1
+                logger.error(f"❌ {type(method).__name__}: повторы исчерпаны после {attempt + 1} попыток: {error}")
+                raise error
+
+            attempt += 1
+            self.retries += 1
+            if delay:
+                await asyncio.sleep(delay)
+
+
+# Глобальные экземпляры: шлюз и бюджет общие для всех исходящих запросов процесса
+rate_limit_gate = RateLimitGate()
+retry_budget = RetryBudget()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Планировщик исходящих запросов к Bot API
+
+Middleware сессии aiogram ставит каждый исходящий вызов в очередь своего
+класса приоритета и пропускает его, когда есть токены:
+- классы: интерактивные ответы > проверки подписки > админ > массовые
+  рассылки, поэтому рассылка не отнимает лимит у нажатий калькулятора;
+- общий token bucket на все запросы и отдельный на каждый чат для
+  отправок и правок сообщений (лимиты Telegram ~30/с и ~1/с на чат);
+- правка сообщения, которая еще ждет в очереди, заменяется более новой
+  правкой того же сообщения: в Telegram уходит только последняя.
+
+Класс задается контекстом: `with priority(PRIORITY_BULK): ...` вокруг
+кода рассылки. Без контекста запросы интерактивные, кроме getChatMember.
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import AnswerCallbackQuery, AnswerInlineQuery, GetChatMember, GetUpdates
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SUBSCRIPTION = 1
+PRIORITY_ADMIN = 2
+PRIORITY_BULK = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_SUBSCRIPTION: 'subscription',
+    PRIORITY_ADMIN: 'admin',
+    PRIORITY_BULK: 'bulk',
+}
+
+# Ответы на callback и инлайн-запросы должны уйти сразу и не входят в лимиты сообщений
+UNSCHEDULED_METHODS = (GetUpdates, AnswerCallbackQuery, AnswerInlineQuery)
+# Префиксы методов, которые создают или меняют сообщения в чате
+CHAT_MESSAGE_PREFIXES = ('Send', 'Edit', 'Copy', 'Forward')
+
+# Правка, замененная более новой, не отправляется; вызывающему возвращается True
+_SUPERSEDED = object()
+
+_priority = contextvars.ContextVar('outbound_priority', default=None)
+
+
+@contextmanager
+def priority(level):
+    """Задает класс приоритета для всех запросов внутри блока (в том числе после await)"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def with_priority(level):
+    """Декоратор корутины: все ее запросы к Bot API идут с классом level"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with priority(level):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, now):
+        """Через сколько секунд появится токен (0 - есть сейчас)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class Ticket:
+    __slots__ = ('future', 'priority', 'chat_id', 'edit_key', 'enqueued_at')
+
+    def __init__(self, future, priority, chat_id, edit_key):
+        self.future = future
+        self.priority = priority
+        self.chat_id = chat_id
+        self.edit_key = edit_key
+        self.enqueued_at = time.monotonic()
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    def __init__(self, global_rate=30.0, global_burst=30, chat_rate=1.0, chat_burst=5, bucket_idle_cleanup=60.0):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.bucket_idle_cleanup = bucket_idle_cleanup
+        self._chat_buckets = {}
+        self._queues = {level: deque() for level in PRIORITY_NAMES}
+        # (chat_id, message_id) -> ожидающая правка этого сообщения
+        self._pending_edits = {}
+        self._wakeup = None
+        self._pump_task = None
+        self._closed = False
+        self._last_cleanup = time.monotonic()
+        # Метрики
+        self.granted = {level: 0 for level in PRIORITY_NAMES}
+        self.wait_total = {level: 0.0 for level in PRIORITY_NAMES}
+        self.wait_max = {level: 0.0 for level in PRIORITY_NAMES}
+        self.coalesced = 0
+
+    def _classify(self, method):
+        level = _priority.get()
+        if level is not None:
+            return level
+        if isinstance(method, GetChatMember):
+            return PRIORITY_SUBSCRIPTION
+        return PRIORITY_INTERACTIVE
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _wait_time(self, ticket, now):
+        wait = self.global_bucket.wait_time(now)
+        if ticket.chat_id is not None:
+            wait = max(wait, self._chat_bucket(ticket.chat_id).wait_time(now))
+        return wait
+
+    def _grant(self, ticket, now):
+        self.global_bucket.take()
+        if ticket.chat_id is not None:
+            self._chat_bucket(ticket.chat_id).take()
+        if ticket.edit_key is not None and self._pending_edits.get(ticket.edit_key) is ticket:
+            del self._pending_edits[ticket.edit_key]
+        waited = now - ticket.enqueued_at
+        self.granted[ticket.priority] += 1
+        self.wait_total[ticket.priority] += waited
+        if waited > self.wait_max[ticket.priority]:
+            self.wait_max[ticket.priority] = waited
+        if ticket.future is not None and not ticket.future.done():
+            ticket.future.set_result(None)
+
+    def _has_waiting(self):
+        return any(self._queues.values())
+
+    def _schedule(self, now):
+        """Выдает токены ожидающим по приоритету; возвращает время до следующей попытки"""
+        next_wait = None
+        for level in sorted(self._queues):
+            queue = self._queues[level]
+            if not queue:
+                continue
+            for ticket in list(queue):
+                if ticket.future.done():
+                    # Отменен вызывающим или заменен более новой правкой
+                    queue.remove(ticket)
+                    continue
+                wait = self._wait_time(ticket, now)
+                if wait == 0:
+                    queue.remove(ticket)
+                    self._grant(ticket, now)
+                    continue
+                next_wait = wait if next_wait is None else min(next_wait, wait)
+                if self.global_bucket.wait_time(now) > 0:
+                    # Общий лимит исчерпан: младшие классы ждут, пока не обслужены старшие
+                    return next_wait
+        return next_wait
+
+    def _cleanup_buckets(self, now):
+        if now - self._last_cleanup < self.bucket_idle_cleanup:
+            return
+        self._last_cleanup = now
+        waiting = {ticket.chat_id for queue in self._queues.values() for ticket in queue}
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items()
+                        if chat_id not in waiting and bucket.is_idle(now)]:
+            del self._chat_buckets[chat_id]
+
+    async def _pump(self):
+        while True:
+            now = time.monotonic()
+            next_wait = self._schedule(now)
+            self._cleanup_buckets(now)
+            self._wakeup.clear()
+            if not self._has_waiting():
+                await self._wakeup.wait()
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=next_wait or 0.01)
+            except asyncio.TimeoutError:
+                pass
+
+    def _ensure_pump(self):
+        if self._pump_task is None or self._pump_task.done():
+            self._wakeup = asyncio.Event()
+            self._pump_task = asyncio.get_running_loop().create_task(self._pump())
+
+    async def _acquire(self, method):
+        level = self._classify(method)
+        chat_id = None
+        edit_key = None
+        if type(method).__name__.startswith(CHAT_MESSAGE_PREFIXES):
+            chat_id = getattr(method, 'chat_id', None)
+            message_id = getattr(method, 'message_id', None)
+            if type(method).__name__.startswith('Edit') and message_id is not None:
+                edit_key = (chat_id, message_id, type(method).__name__)
+
+        now = time.monotonic()
+        ticket = Ticket(None, level, chat_id, edit_key)
+        # Быстрый путь: очередь пуста и токены есть - без ожидания и без переключения задач
+        if not self._has_waiting() and self._wait_time(ticket, now) == 0:
+            self._grant(ticket, now)
+            return True
+
+        self._ensure_pump()
+        ticket.future = asyncio.get_running_loop().create_future()
+        if edit_key is not None:
+            previous = self._pending_edits.get(edit_key)
+            if previous is not None and not previous.future.done():
+                previous.future.set_result(_SUPERSEDED)
+                self.coalesced += 1
+            self._pending_edits[edit_key] = ticket
+        self._queues[level].append(ticket)
+        self._wakeup.set()
+        try:
+            return (await ticket.future) is not _SUPERSEDED
+        except asyncio.CancelledError:
+            if edit_key is not None and self._pending_edits.get(edit_key) is ticket:
+                del self._pending_edits[edit_key]
+            raise
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, UNSCHEDULED_METHODS) or self._closed:
+            return await make_request(bot, method)
+        if not await self._acquire(method):
+            # Более новая правка того же сообщения уже в очереди
+            return True
+        return await make_request(bot, method)
+
+    def close(self):
+        """Останавливает очередь; ожидающие запросы и все следующие уходят без ожидания токенов
+        
+        Вызывается при остановке бота, когда рассылки уже прерваны: иначе их
+        запросы навсегда остались бы в очереди без работающего _pump.
+        """
+        self._closed = True
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            self._pump_task = None
+        for queue in self._queues.values():
+            while queue:
+                ticket = queue.popleft()
+                if not ticket.future.done():
+                    ticket.future.set_result(None)
+        self._pending_edits.clear()
+
+    def get_stats(self):
+        stats = {}
+        for level, name in PRIORITY_NAMES.items():
+            granted = self.granted[level]
+            stats[f'{name}_queue'] = len(self._queues[level])
+            stats[f'{name}_sent'] = granted
+            stats[f'{name}_wait_avg_ms'] = round(self.wait_total[level] / granted * 1000, 1) if granted else 0
+            stats[f'{name}_wait_max_ms'] = round(self.wait_max[level] * 1000, 1)
+        stats['coalesced_edits'] = self.coalesced
+        stats['chat_buckets'] = len(self._chat_buckets)
+        return stats
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Резервные копии базы данных
+
+Снимок делается через sqlite3.Connection.backup, а не копированием файла:
+копия файла в режиме WAL может не содержать последних транзакций или
+оказаться несогласованной.
+- страницы копируются шагами по pages_per_step с паузой между шагами;
+- на все время копирования открыта одна читающая транзакция: в режиме WAL
+  она не мешает записи, а снимок соответствует одному моменту и не
+  начинается заново после каждой записи из других соединений;
+- копирование идет в отдельном потоке, цикл событий не останавливается;
+- снимок проверяется PRAGMA quick_check, рядом пишется SHA-256,
+  хранятся keep последних снимков.
+Восстановление - restore_backup.py.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from bot_database import snapshot_database
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PREFIX = 'calculator_bot_'
+SNAPSHOT_SUFFIX = '.db'
+CHECKSUM_SUFFIX = '.sha256'
+
+
+def file_checksum(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_checksum(path):
+    """SHA-256 из файла .sha256 рядом со снимком или None"""
+    try:
+        with open(path + CHECKSUM_SUFFIX, encoding='utf-8') as f:
+            return f.read().split()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def verify_snapshot(path):
+    """Проверяет контрольную сумму и целостность снимка; возвращает текст ошибки или None"""
+    expected = read_checksum(path)
+    if expected is None:
+        return "нет файла контрольной суммы"
+    if file_checksum(path) != expected:
+        return "контрольная сумма не совпадает"
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    return None if result == 'ok' else f"quick_check: {result}"
+
+
+def list_snapshots(backup_dir):
+    """Снимки в каталоге, от новых к старым"""
+    try:
+        names = os.listdir(backup_dir)
+    except FileNotFoundError:
+        return []
+    snapshots = [os.path.join(backup_dir, name) for name in names
+                 if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)]
+    return sorted(snapshots, reverse=True)
+
+
+class BackupManager:
+    def __init__(self, db_path, backup_dir='backups', keep=7, interval=86400,
+                 pages_per_step=1024, step_pause=0.001):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.interval = interval
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self._running = threading.Lock()
+        # Метрики
+        self.backups = 0
+        self.failures = 0
+        self.last_duration = 0.0
+        self.last_steps = 0
+        self.last_restarts = 0
+        self.last_size = 0
+        self.last_finished = None
+        self.last_error = None
+
+    def _write_snapshot(self, path):
+        """Копирование, контрольная сумма и проверка; при ошибке файлы снимка удаляются"""
+        partial = path + '.part'
+        try:
+            steps, restarts = snapshot_database(self.db_path, partial, self.pages_per_step, self.step_pause)
+            os.replace(partial, path)
+            with open(path + CHECKSUM_SUFFIX, 'w', encoding='utf-8') as f:
+                f.write(f"{file_checksum(path)}  {os.path.basename(path)}\n")
+            error = verify_snapshot(path)
+            if error:
+                raise RuntimeError(f"снимок не прошел проверку: {error}")
+            return steps, restarts
+        except Exception:
+            for leftover in (partial, path, path + CHECKSUM_SUFFIX):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+
+    def create_snapshot(self):
+        """Делает проверенный снимок и возвращает путь к нему; выполняется в рабочем потоке"""
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("резервное копирование уже выполняется")
+        try:
+            started = time.perf_counter()
+            os.makedirs(self.backup_dir, exist_ok=True)
+            name = f"{SNAPSHOT_PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S')}{SNAPSHOT_SUFFIX}"
+            path = os.path.join(self.backup_dir, name)
+            try:
+                steps, restarts = self._write_snapshot(path)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                raise
+            self._rotate()
+
+            self.backups += 1
+            self.last_duration = time.perf_counter() - started
+            self.last_steps = steps
+            self.last_restarts = restarts
+            self.last_size = os.path.getsize(path)
+            self.last_finished = datetime.now()
+            self.last_error = None
+            logger.info(f"✅ Резервная копия {name}: {self.last_size // 1024} КБ за {self.last_duration:.1f} сек")
+            return path
+        finally:
+            self._running.release()
+
+    def _rotate(self):
+        for old in list_snapshots(self.backup_dir)[self.keep:]:
+            for path in (old, old + CHECKSUM_SUFFIX):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    async def backup(self):
+        """create_snapshot в отдельном потоке"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.create_snapshot)
+
+    async def schedule_loop(self):
+        """Фоновая задача: снимок раз в interval секунд"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.backup()
+            except Exception as e:
+                logger.error(f"❌ Ошибка резервного копирования: {e}")
+
+    def get_stats(self):
+        return {
+            'backups': self.backups,
+            'failures': self.failures,
+            'last_finished': self.last_finished.strftime('%d.%m %H:%M:%S') if self.last_finished else '-',
+            'last_duration_s': round(self.last_duration, 2),
+            'last_steps': self.last_steps,
+            'last_restarts': self.last_restarts,
+            'last_size_kb': self.last_size // 1024,
+            'snapshots': len(list_snapshots(self.backup_dir)),
+            'last_error': self.last_error or '-',
+        }
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк худших случаев калькулятора
+
+Вычисляет и форматирует выражения предельной длины (длинные целые,
+цепочки делений, глубокие скобки, дробные литералы с большой точностью,
+степени и корни на границе модели стоимости)
+без кэша и сравнивает худшее время с бюджетом. Код возврата 1, если
+бюджет превышен, поэтому скрипт можно запускать в CI после изменения
+DECIMAL_PRECISION или числового режима.
+
+Пример:
+    python bench_calculator.py --budget-ms 2 --repeat 200
+"""
+
+import argparse
+import sys
+import time
+
+from calculator import (MAX_EXPONENT, MAX_EXPRESSION_LENGTH, MAX_RESULT_BITS, evaluate, format_result,
+                        normalize_expression)
+from config import DECIMAL_PRECISION, NUMERIC_BACKEND
+
+
+def fit(expression):
+    """Обрезает выражение до MAX_EXPRESSION_LENGTH по границе операнда"""
+    while len(expression) > MAX_EXPRESSION_LENGTH:
+        expression = expression[:max(expression.rfind('*'), expression.rfind('/'), expression.rfind('+'))]
+    return expression
+
+
+def build_cases():
+    half = (MAX_EXPRESSION_LENGTH - 1) // 2
+    depth = (MAX_EXPRESSION_LENGTH - 1) // 2
+    return {
+        'длинные целые': '9' * half + '*' + '9' * half,
+        'цепочка умножений': fit('*'.join(['99999999'] * 20)),
+        'цепочка делений': fit('/'.join(['7'] + ['3'] * 50)),
+        'деление длинных целых': '1' * half + '/' + '7' * half,
+        'дробные литералы': fit('+'.join(['0.123456789012345678901234567'] * 5)),
+        'смешанное': fit('1/3*' + '*'.join(['1.1'] * 40)),
+        'глубокие скобки': '(' * depth + '1' + ')' * depth,
+        'большой порядок': fit('1E+900000*' * 10 + '1'),
+        'степень на пределе': '9^' + str(MAX_RESULT_BITS // 4),
+        'степени в цепочке': fit('*'.join(['(7^1400)'] * 10)),
+        'башня степеней': '9^9^9^9',
+        'дробная степень': '1.0000001^' + str(MAX_EXPONENT),
+        'вложенные корни': fit('√(' * 16 + '2' + ')' * 16),
+        'проценты': fit('+'.join(['12.5%'] * 20)),
+}
+
+
+def measure(expression, repeat):
+    """Худшее и среднее время evaluate + format_result в мкс"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            result = format_result(evaluate(expression))
+        except (ZeroDivisionError, ArithmeticError, RecursionError, ValueError) as e:
+            result = f"ошибка: {type(e).__name__}"
+        timings.append(time.perf_counter() - started)
+    return max(timings) * 1e6, sum(timings) / len(timings) * 1e6, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Худшие случаи калькулятора против бюджета времени')
+    parser.add_argument('--budget-ms', type=float, default=2.0, help='бюджет на одно вычисление')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"📊 Калькулятор: режим {NUMERIC_BACKEND}, точность {DECIMAL_PRECISION}, "
+          f"бюджет {args.budget_ms} мс")
+    over_budget = []
+    for name, expression in build_cases().items():
+        expression = normalize_expression(expression)
+        worst_us, mean_us, result = measure(expression, args.repeat)
+        mark = '✅' if worst_us <= args.budget_ms * 1000 else '❌'
+        if mark == '❌':
+            over_budget.append(name)
+        print(f"  {mark} {name:<22} худшее {worst_us:8.1f} мкс, среднее {mean_us:7.1f} мкс  -> {result[:30]}")
+
+    if over_budget:
+        print(f"❌ Бюджет превышен: {', '.join(over_budget)}")
+        sys.exit(1)
+    print("✅ Все случаи в пределах бюджета")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк стоимости маршрутизации callback-запросов
+
+Сравнивает прежнюю схему (цепочка фильтров F.data в aiogram и
+калькулятор как catch-all) с единой таблицей callbacks.CallbackTable.
+Обработчики пустые, поэтому замеряется только стоимость диспетчеризации.
+
+Пример:
+    python bench_callbacks.py --updates 20000
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import callbacks as cb
+from bench_load import BENCH_TOKEN, FakeTelegramSession, UpdateFactory
+
+LEGACY_DATA = ["check_subscription", "toggle_notifications", "refresh_profile", "admin_stats",
+               "admin_users", "calculation_stats", "whats_new"]
+
+
+async def noop(*args, **kwargs):
+    pass
+
+
+def build_legacy_dispatcher():
+    """Схема до перехода на таблицу: фильтры проверяются по очереди"""
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.callback_query(F.data == "check_subscription")(noop)
+    dp.callback_query(F.data == "toggle_notifications")(noop)
+    dp.callback_query(F.data == "refresh_profile")(noop)
+    dp.callback_query(F.data.startswith("admin_"))(noop)
+    dp.callback_query()(noop)
+    return dp
+
+
+def build_table_dispatcher():
+    """Текущая схема: один обработчик и поиск в словаре"""
+    dp = Dispatcher(storage=MemoryStorage())
+    table = cb.CallbackTable()
+    for code in set(cb.LEGACY_CALLBACKS.values()):
+        table.register(code, noop)
+
+    @dp.callback_query()
+    async def callback_dispatcher(query, state):
+        await table.dispatch(query, state)
+
+    return dp, table
+
+
+def build_updates(factory, count, keys_share, legacy, seed):
+    rng = random.Random(seed)
+    calc_keys = list(cb.CALC_KEY_CODES)
+    other = LEGACY_DATA if legacy else [cb.LEGACY_CALLBACKS[data] for data in LEGACY_DATA]
+    updates = []
+    for i in range(count):
+        if rng.random() < keys_share:
+            key = rng.choice(calc_keys)
+            data = key if legacy else cb.CALC_KEY_CODES[key]
+        else:
+            data = rng.choice(other)
+        updates.append(factory.callback(1000 + i % 500, data, 1))
+    return updates
+
+
+async def time_feed(dp, bot, updates):
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / len(updates) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Стоимость маршрутизации callback-запросов')
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--keys-share', type=float, default=0.9, help='доля нажатий клавиш калькулятора')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    bot = Bot(token=BENCH_TOKEN, session=FakeTelegramSession())
+    factory = UpdateFactory(bot)
+    legacy_updates = build_updates(factory, args.updates, args.keys_share, True, args.seed)
+    table_updates = build_updates(factory, args.updates, args.keys_share, False, args.seed)
+
+    legacy_dp = build_legacy_dispatcher()
+    table_dp, table = build_table_dispatcher()
+
+    async def run():
+        # Прогрев, чтобы не мерить ленивую инициализацию aiogram
+        await time_feed(legacy_dp, bot, legacy_updates[:500])
+        await time_feed(table_dp, bot, table_updates[:500])
+        return (await time_feed(legacy_dp, bot, legacy_updates),
+                await time_feed(table_dp, bot, table_updates))
+
+    legacy_us, table_us = asyncio.run(run())
+
+    codes = [update.callback_query.data for update in table_updates]
+    started = time.perf_counter()
+    for code in codes:
+        table.resolve(code)
+    resolve_us = (time.perf_counter() - started) / len(codes) * 1e6
+
+    print(f"📊 Маршрутизация {args.updates} callback-запросов (доля клавиш {args.keys_share:.0%}):")
+    print(f"  цепочка фильтров F.data:   {legacy_us:8.1f} мкс/апдейт")
+    print(f"  таблица callback_data:     {table_us:8.1f} мкс/апдейт")
+    print(f"  из них поиск в таблице:    {resolve_us:8.3f} мкс")
+
+
+if __name__ == '__main__':
+    main()
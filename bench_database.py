@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк методов bot_database.Database
+
+Заполняет временную БД на 10k/100k/1M пользователей с реалистичной
+историей вычислений, замеряет каждый публичный метод (задержка одиночного
+вызова и устойчивые ops/s в N потоках) и выводит EXPLAIN QUERY PLAN для
+каждого запроса, который метод отправляет в SQLite.
+
+Пример:
+    python bench_database.py --sizes 10000 100000 --threads 1 4 --duration 2
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+# Database импортируется в main(): при импорте bot_database создает глобальный db
+Database = None
+
+# Аргументы для каждого публичного метода; rng и size позволяют попадать в существующих пользователей
+METHOD_ARGS = {
+    'enable_replica': lambda rng, size: (None, 300),
+    'refresh_replica': lambda rng, size: (),
+    'get_replica_age': lambda rng, size: (),
+    'get_read_age': lambda rng, size: (),
+    'get_replica_stats': lambda rng, size: (),
+    'get_user_profile': lambda rng, size: (rng.randrange(size),),
+    'get_user': lambda rng, size: (rng.randrange(size),),
+    'create_user': lambda rng, size: (size + rng.randrange(size), 'bench', 'Bench', 'User'),
+    'update_subscription_status': lambda rng, size: (rng.randrange(size), rng.random() < 0.5),
+    'update_user_activity': lambda rng, size: (rng.randrange(size),),
+    'update_profile_data': lambda rng, size: (rng.randrange(size), 'bench', 'Bench', None),
+    'increment_calculation_count': lambda rng, size: (rng.randrange(size),),
+    'get_calculator_session': lambda rng, size: (rng.randrange(size),),
+    'update_calculator_session': lambda rng, size: (rng.randrange(size), '12+3', '12+', 1),
+    'update_calculator_memory': lambda rng, size: (rng.randrange(size), '42,5'),
+    'set_calculator_mode': lambda rng, size: (rng.randrange(size), rng.random() < 0.5),
+    'reset_calculator_session': lambda rng, size: (rng.randrange(size),),
+    'count_calculator_sessions': lambda rng, size: (),
+    'cleanup_calculator_sessions': lambda rng, size: (7,),
+    'get_user_stats': lambda rng, size: (),
+    'get_stats_snapshot': lambda rng, size: (),
+    'get_users_for_broadcast': lambda rng, size: (),
+    'create_broadcast': lambda rng, size: (1, 'bench broadcast', size),
+    'update_broadcast_stats': lambda rng, size: (rng.randint(1, 50), 10, 1),
+    'get_broadcast_history': lambda rng, size: (5,),
+    'get_recent_users': lambda rng, size: (5,),
+    'get_all_users': lambda rng, size: (),
+    'get_bot_setting': lambda rng, size: ('setting_%d' % rng.randrange(20),),
+    'get_bot_settings': lambda rng, size: (),
+    'set_bot_setting': lambda rng, size: ('setting_%d' % rng.randrange(20), 'value'),
+    'add_update_history': lambda rng, size: ('9.9.9', 'bench changes'),
+    'upsert_update_history': lambda rng, size: ('2.%d.0' % rng.randrange(20), 'bench changes'),
+    'get_update_history': lambda rng, size: (5,),
+    'toggle_user_notifications': lambda rng, size: (rng.randrange(size), rng.random() < 0.5),
+    'get_user_notifications_status': lambda rng, size: (rng.randrange(size),),
+    'add_calculation_history': lambda rng, size: (rng.randrange(size), '2+2', '4'),
+    'record_calculation': lambda rng, size: (rng.randrange(size), '12+3*4', '24'),
+    'get_calculation_stats': lambda rng, size: (rng.randrange(size),),
+    'get_user_calculation_history': lambda rng, size: (rng.randrange(size), 10),
+    'load_fsm_states': lambda rng, size: (time.time(),),
+    'save_fsm_states': lambda rng, size: ([('1:%d:%d::default' % ((rng.randrange(size),) * 2),
+                                            'BroadcastState:waiting_for_message', {'broadcast_text': 'x'},
+                                            time.time() + 3600)], []),
+    'iter_calculation_times': lambda rng, size: (),
+    'iter_user_calculation_counts': lambda rng, size: (),
+    'iter_export_rows': lambda rng, size: ('users',),
+    'get_daily_calculation_totals': lambda rng, size: (14,),
+    'load_activity_sketches': lambda rng, size: ('2000-01-01',),
+    'save_activity_sketches': lambda rng, size: ([('2000-01-%02d' % rng.randint(1, 28), 'users', bytes(4096))],),
+    'cleanup_old_data': lambda rng, size: (7,),
+}
+
+# Методы, которые целиком читают большие таблицы - гоняем только одиночным вызовом
+HEAVY_METHODS = {'get_all_users', 'get_users_for_broadcast', 'cleanup_old_data', 'refresh_replica',
+                 'cleanup_calculator_sessions', 'iter_calculation_times', 'iter_user_calculation_counts', 'iter_export_rows'}
+
+
+def call(func, args):
+    """Вызывает метод; генераторы (iter_*) дочитываются до конца, иначе запрос не выполнится"""
+    result = func(*args)
+    if isinstance(result, types.GeneratorType):
+        for _ in result:
+            pass
+
+
+def public_methods():
+    """Публичные методы Database в порядке объявления"""
+    return [name for name, value in vars(Database).items()
+            if callable(value) and not name.startswith('_')]
+
+
+def populate(db_path, size, history_per_user, seed):
+    """Быстро заполняет БД напрямую через executemany"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    batch = 50000
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    cursor = conn.cursor()
+
+    for start in range(0, size, batch):
+        users = []
+        history = []
+        sessions = []
+        for user_id in range(start, min(start + batch, size)):
+            created = now - timedelta(days=rng.randint(0, 365))
+            last_activity = now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+            count = max(0, int(rng.expovariate(1 / history_per_user))) if history_per_user else 0
+            users.append((user_id, f'user{user_id}', f'User{user_id}', None, rng.random() < 0.7,
+                          created, last_activity, rng.random() < 0.9, count,
+                          last_activity if count else None))
+            for _ in range(count):
+                a, b = rng.randint(1, 999), rng.randint(1, 999)
+                op = rng.choice('+-*/')
+                history.append((user_id, f'{a}{op}{b}', '0',
+                                now - timedelta(minutes=rng.randint(0, 60 * 24 * 14))))
+            if rng.random() < 0.2:
+                sessions.append((user_id, '12+3', '12+', rng.randint(1, 10**6), last_activity))
+
+        cursor.executemany('''
+            INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, subscribed,
+                created_at, last_activity, notifications_enabled, calculations_count, last_calculation)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', users)
+        cursor.executemany('''
+            INSERT INTO calculation_history (user_id, expression, result, calculation_date)
+            VALUES (?, ?, ?, ?)
+        ''', history)
+        cursor.executemany('''
+            INSERT OR REPLACE INTO calculator_sessions (user_id, value, old_value, message_id, last_activity)
+            VALUES (?, ?, ?, ?, ?)
+        ''', sessions)
+        conn.commit()
+
+    cursor.executemany('INSERT INTO broadcasts (admin_id, message_text, sent_count, total_users) VALUES (?, ?, ?, ?)',
+                       [(1, f'broadcast {i}', size, size) for i in range(50)])
+    cursor.executemany('INSERT OR REPLACE INTO bot_settings (key, value) VALUES (?, ?)',
+                       [(f'setting_{i}', str(i)) for i in range(20)])
+    cursor.executemany('INSERT INTO update_history (version, changes_text) VALUES (?, ?)',
+                       [(f'2.{i}.0', 'changes') for i in range(20)])
+    conn.commit()
+    conn.close()
+
+
+class StatementRecorder:
+    """Перехватывает SQL, который методы Database отправляют в SQLite"""
+
+    def __init__(self):
+        self.statements = []
+        self.enabled = False
+        self._original_connect = sqlite3.connect
+
+    def _trace(self, statement):
+        if self.enabled:
+            self.statements.append(statement)
+
+    def install(self):
+        original_connect = self._original_connect
+
+        def tracing_connect(*args, **kwargs):
+            conn = original_connect(*args, **kwargs)
+            conn.set_trace_callback(self._trace)
+            return conn
+
+        sqlite3.connect = tracing_connect
+
+    def uninstall(self):
+        sqlite3.connect = self._original_connect
+
+    def capture(self, func, *args):
+        self.statements = []
+        self.enabled = True
+        try:
+            call(func, args)
+        finally:
+            self.enabled = False
+        return [s.strip() for s in self.statements
+                if not s.lstrip().upper().startswith(('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK'))]
+
+
+def explain(db_path, statement):
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(f'EXPLAIN QUERY PLAN {statement}').fetchall()
+        return [row[-1] for row in rows]
+    except sqlite3.Error as e:
+        return [f'ошибка: {e}']
+    finally:
+        conn.close()
+
+
+def time_single(func, args_factory, rng, size, repeat):
+    samples = []
+    for _ in range(repeat):
+        args = args_factory(rng, size)
+        started = time.perf_counter()
+        call(func, args)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        'median_ms': round(statistics.median(samples) * 1000, 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+    }
+
+
+def time_sustained(func, args_factory, size, threads, duration, seed):
+    """Сколько вызовов в секунду выдерживает метод при N потоках"""
+    counts = [0] * threads
+    stop = threading.Event()
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        while not stop.is_set():
+            call(func, args_factory(rng, size))
+            counts[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return round(sum(counts) / elapsed, 1)
+
+
+def bench_size(size, args, recorder):
+    print(f"\n📦 Размер: {size} пользователей")
+    with tempfile.TemporaryDirectory(prefix='bench_db_') as workdir:
+        db_path = os.path.join(workdir, 'bench.db')
+        db = Database(db_name=db_path)
+
+        started = time.perf_counter()
+        populate(db_path, size, args.history, args.seed)
+        print(f"   заполнение: {time.perf_counter() - started:.1f}с")
+
+        rng = random.Random(args.seed)
+        results = {}
+        for name in public_methods():
+            if name not in METHOD_ARGS:
+                print(f"   ⚠️ {name}: нет генератора аргументов, пропускаем")
+                continue
+            func = getattr(db, name)
+            args_factory = METHOD_ARGS[name]
+
+            statements = recorder.capture(func, *args_factory(rng, size))
+            plans = {statement: explain(db_path, statement) for statement in dict.fromkeys(statements)}
+
+            repeat = 1 if name in HEAVY_METHODS else args.repeat
+            entry = time_single(func, args_factory, rng, size, repeat)
+            if name not in HEAVY_METHODS:
+                entry['ops_per_s'] = {
+                    str(threads): time_sustained(func, args_factory, size, threads, args.duration, args.seed)
+                    for threads in args.threads
+                }
+            entry['query_plans'] = plans
+            results[name] = entry
+
+            ops = ', '.join(f"{t}п: {v}" for t, v in entry.get('ops_per_s', {}).items())
+            print(f"   {name:32} {entry['median_ms']:>9.3f} мс  p95 {entry['p95_ms']:>9.3f} мс  {ops}")
+            for statement, plan in plans.items():
+                print(f"      {' '.join(statement.split())[:100]}")
+                for line in plan:
+                    print(f"         └ {line}")
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Микробенчмарк методов Database')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--history', type=float, default=5.0, help='среднее число вычислений на пользователя')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--duration', type=float, default=1.0, help='длительность замера ops/s, сек')
+    parser.add_argument('--repeat', type=int, default=50, help='число одиночных вызовов для медианы')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='сохранить результаты в JSON')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+
+    global Database
+    with tempfile.TemporaryDirectory(prefix='bench_db_') as workdir:
+        # Глобальный db из bot_database создаст свой файл во временном каталоге
+        os.chdir(workdir)
+        from bot_database import Database
+
+        recorder = StatementRecorder()
+        recorder.install()
+        try:
+            report = {str(size): bench_size(size, args, recorder) for size in args.sizes}
+        finally:
+            recorder.uninstall()
+            os.chdir(BASE_DIR)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'timestamp': datetime.now().isoformat(), 'results': report},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {output}")
+
+
+if __name__ == '__main__':
+    main()
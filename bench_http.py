@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк HTTP-сессии Bot API на локальном сервере-заглушке
+
+Поднимает aiohttp-сервер на 127.0.0.1, который отвечает как Bot API, и
+прогоняет через настоящий Bot поток «нажатий» (editMessageText +
+answerCallbackQuery) с заданной параллельностью. Сравниваются:
+- новое соединение на каждый запрос (keep-alive выключен);
+- сессия aiogram по умолчанию;
+- TunedAiohttpSession из http_session.py.
+
+Пример:
+    python bench_http.py --keypresses 5000 --concurrency 50 --server-delay 0.002
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from bench_load import BENCH_TOKEN
+from http_session import TunedAiohttpSession
+
+MESSAGE_RESULT = {
+    "message_id": 1,
+    "date": 0,
+    "chat": {"id": 1, "type": "private"},
+    "text": "0",
+}
+
+
+def build_stub_app(delay):
+    async def handle(request):
+        await request.post()
+        if delay:
+            await asyncio.sleep(delay)
+        method = request.match_info["method"]
+        result = MESSAGE_RESULT if method in ("sendMessage", "editMessageText") else True
+        return web.Response(text=json.dumps({"ok": True, "result": result}), content_type="application/json")
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    return app
+
+
+async def start_stub_server(delay):
+    runner = web.AppRunner(build_stub_app(delay), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, TelegramAPIServer.from_base(f"http://127.0.0.1:{port}")
+
+
+async def run_keypresses(bot, keypresses, concurrency):
+    """Одно нажатие = правка сообщения + ответ на callback; возвращает задержки нажатий в мс"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def keypress(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await bot.edit_message_text(f"🧮 **Калькулятор**\n\n`{i}`", chat_id=1 + i % concurrency, message_id=1)
+            await bot.answer_callback_query(str(i))
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(keypress(i) for i in range(keypresses)))
+    return latencies
+
+
+def make_sessions(api):
+    no_keepalive = AiohttpSession(api=api)
+    no_keepalive._connector_init["force_close"] = True
+    return [
+        ("новое соединение на запрос", no_keepalive),
+        ("aiogram по умолчанию", AiohttpSession(api=api)),
+        ("TunedAiohttpSession", TunedAiohttpSession(api=api)),
+    ]
+
+
+async def run(args):
+    runner, api = await start_stub_server(args.server_delay)
+    results = []
+    try:
+        for name, session in make_sessions(api):
+            bot = Bot(token=BENCH_TOKEN, session=session)
+            # Прогрев: открываем соединения и заполняем ленивые кэши aiogram
+            await run_keypresses(bot, args.concurrency, args.concurrency)
+            started = time.perf_counter()
+            latencies = await run_keypresses(bot, args.keypresses, args.concurrency)
+            elapsed = time.perf_counter() - started
+            stats = session.get_stats() if isinstance(session, TunedAiohttpSession) else None
+            await session.close()
+            latencies.sort()
+            results.append((name, args.keypresses / elapsed, statistics.median(latencies),
+                            latencies[int(len(latencies) * 0.99) - 1], stats))
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP-сессия Bot API против локальной заглушки")
+    parser.add_argument("--keypresses", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--server-delay", type=float, default=0.0, help="задержка ответа заглушки, сек")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"📊 {args.keypresses} нажатий, параллельно {args.concurrency}:")
+    for name, throughput, p50, p99, stats in results:
+        print(f"  {name:<28} {throughput:8.0f} нажатий/с   p50 {p50:6.2f} мс   p99 {p99:6.2f} мс")
+        if stats:
+            print(f"  {'':<28} соединений открыто {stats['connections_created']}, "
+                  f"переиспользовано {stats['connections_reused']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест бота с поддельным Telegram Bot API
+
+Прогоняет синтетические апдейты (/start, /profile, нажатия кнопок
+калькулятора и «=») от тысяч виртуальных пользователей через настоящий
+диспетчер `dp` из main.py. Вместо Bot API используется локальная заглушка
+с настраиваемой задержкой и долей ответов 429/403.
+
+Пример:
+    python bench_load.py --users 2000 --latency 0.02 --retry-after-rate 0.01
+    python bench_load.py --users 2000 --compare bench_results/load_baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Update
+
+import callbacks as cb
+from api_scheduler import TokenBucket
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Токен заглушки: формат валиден, но в сеть он никогда не уходит
+BENCH_TOKEN = "123456789:AAbenchmarkbenchmarkbenchmarkbenchm"
+
+
+class CountingConnection(sqlite3.Connection):
+    """Соединение SQLite, считающее коммиты"""
+    commits = 0
+
+    def commit(self):
+        CountingConnection.commits += 1
+        return super().commit()
+
+
+class FakeTelegramSession(BaseSession):
+    """Заглушка сессии Bot API: отвечает локально, без сети
+
+    Ответ собирается в JSON и проходит через штатный `check_response`,
+    поэтому 429 превращается в TelegramRetryAfter, а 403 в
+    TelegramForbiddenError ровно так же, как с настоящим сервером.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, retry_after_rate=0.0, forbidden_rate=0.0,
+                 retry_after=1, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.retry_after_rate = retry_after_rate
+        self.forbidden_rate = forbidden_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.injected = Counter()
+        self._random = random.Random(seed)
+        self._message_id = 0
+
+    def reset(self):
+        self.calls.clear()
+        self.injected.clear()
+
+    def _fake_message(self, chat_id, text=None):
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    def _fake_result(self, method):
+        name = method.__api_method__
+        if name in ("sendMessage", "editMessageText", "sendDocument"):
+            return self._fake_message(getattr(method, "chat_id", None) or 0, getattr(method, "text", None))
+        if name == "getChatMember":
+            return {
+                "status": "member",
+                "user": {"id": method.user_id, "is_bot": False, "first_name": "bench"},
+            }
+        if name == "getMe":
+            return {"id": 123456789, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        return True
+
+    async def make_request(self, bot, method, timeout=None):
+        name = method.__api_method__
+        self.calls[name] += 1
+
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        roll = self._random.random()
+        if roll < self.retry_after_rate:
+            self.injected["429"] += 1
+            status_code = 429
+            payload = {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        elif roll < self.retry_after_rate + self.forbidden_rate:
+            self.injected["403"] += 1
+            status_code = 403
+            payload = {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+        else:
+            status_code = 200
+            payload = {"ok": True, "result": self._fake_result(method)}
+
+        response = self.check_response(bot, method, status_code, self.json_dumps(payload))
+        return response.result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class UpdateFactory:
+    """Генератор синтетических апдейтов Telegram"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._update_id = 0
+        self._callback_id = 0
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def _chat(self, user_id):
+        return {"id": user_id, "type": "private"}
+
+    def _next_update_id(self):
+        self._update_id += 1
+        return self._update_id
+
+    def message(self, user_id, text):
+        data = {
+            "message_id": self._update_id + 1,
+            "date": int(time.time()),
+            "chat": self._chat(user_id),
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return Update.model_validate(
+            {"update_id": self._next_update_id(), "message": data},
+            context={"bot": self.bot},
+        )
+
+    def inline_query(self, user_id, text):
+        self._callback_id += 1
+        query = {"id": str(self._callback_id), "from": self._user(user_id), "query": text, "offset": ""}
+        return Update.model_validate(
+            {"update_id": self._next_update_id(), "inline_query": query},
+            context={"bot": self.bot},
+        )
+
+    def callback(self, user_id, data, message_id):
+        self._callback_id += 1
+        query = {
+            "id": str(self._callback_id),
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": self._chat(user_id),
+                "from": {"id": 123456789, "is_bot": True, "first_name": "bench"},
+                "text": "🧮 Калькулятор",
+            },
+        }
+        return Update.model_validate(
+            {"update_id": self._next_update_id(), "callback_query": query},
+            context={"bot": self.bot},
+        )
+
+
+def build_inline_script(rng, keypresses):
+    """Сценарий инлайн-режима: запрос на каждый введенный символ выражения"""
+    script = []
+    while keypresses > 0:
+        operands = [str(rng.randint(1, 999)) for _ in range(rng.randint(2, 3))]
+        expression = operands[0]
+        for operand in operands[1:]:
+            expression += rng.choice("+-*/") + operand
+        for i in range(1, len(expression) + 1):
+            script.append(("inline", expression[:i]))
+        keypresses -= len(expression) + 2
+    return script
+
+
+def build_script(rng, keypresses, inline_share=0.0):
+    """Сценарий одного пользователя: список (тип, данные)"""
+    if rng.random() < inline_share:
+        return build_inline_script(rng, keypresses)
+    script = [("message", "/start")]
+    while keypresses > 0:
+        operands = rng.randint(2, 3)
+        for i in range(operands):
+            for digit in str(rng.randint(1, 999)):
+                script.append(("callback", cb.CALC_KEY_CODES[digit]))
+                keypresses -= 1
+            if i < operands - 1:
+                script.append(("callback", cb.CALC_KEY_CODES[rng.choice("+-*/")]))
+                keypresses -= 1
+        script.append(("callback", cb.CALC_KEY_CODES["="]))
+        script.append(("callback", cb.CALC_KEY_CODES["C"]))
+        keypresses -= 2
+    if rng.random() < 0.3:
+        script.append(("message", "/profile"))
+        script.append(("callback", rng.choice([cb.PROFILE_CALCULATION_STATS, cb.PROFILE_WHATS_NEW])))
+    return script
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_load(main_module, session, users, keypresses, concurrency, seed, inline_share=0.0, typing_delay=0.1):
+    """Прогоняет сценарии всех пользователей и собирает сырые метрики"""
+    dp = main_module.dp
+    bot = main_module.bot
+    factory = UpdateFactory(bot)
+    rng = random.Random(seed)
+    latencies = []
+    handler_errors = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def feed(update):
+        started = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            handler_errors[type(e).__name__] += 1
+        latencies.append(time.perf_counter() - started)
+
+    async def simulate_user(user_id, script):
+        async with semaphore:
+            message_id = user_id
+            typing = []
+            for kind, data in script:
+                if kind == "message":
+                    await feed(factory.message(user_id, data))
+                elif kind == "inline":
+                    # Инлайн-запросы приходят по мере набора, не дожидаясь ответа на предыдущий
+                    typing.append(asyncio.ensure_future(feed(factory.inline_query(user_id, data))))
+                    await asyncio.sleep(typing_delay)
+                else:
+                    await feed(factory.callback(user_id, data, message_id))
+            if typing:
+                await asyncio.gather(*typing)
+
+    scripts = [(100000 + i, build_script(rng, keypresses, inline_share)) for i in range(users)]
+    total_updates = sum(len(script) for _, script in scripts)
+
+    session.reset()
+    CountingConnection.commits = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate_user(user_id, script) for user_id, script in scripts))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    api_calls = sum(session.calls.values())
+    return {
+        "users": users,
+        "updates": total_updates,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ups": round(total_updates / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "latency_max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "db_commits": CountingConnection.commits,
+        "db_commits_per_update": round(CountingConnection.commits / total_updates, 3),
+        "api_calls": api_calls,
+        "api_calls_per_update": round(api_calls / total_updates, 3),
+        "api_calls_by_method": dict(session.calls),
+        "injected_errors": dict(session.injected),
+        "handler_errors": dict(handler_errors),
+    }
+
+
+def load_main_module(workdir):
+    """Импортирует main.py во временном каталоге с подсчетом коммитов БД"""
+    original_connect = sqlite3.connect
+
+    def counting_connect(*args, **kwargs):
+        kwargs.setdefault("factory", CountingConnection)
+        return original_connect(*args, **kwargs)
+
+    sqlite3.connect = counting_connect
+    os.chdir(workdir)
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+
+    import config
+    config.BOT_TOKEN = BENCH_TOKEN
+    import main
+    return main
+
+
+def compare_results(current, baseline_path):
+    """Печатает изменения ключевых метрик относительно сохраненного прогона"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+
+    print(f"\n📐 Сравнение с {baseline_path}:")
+    for key in ("throughput_ups", "latency_p50_ms", "latency_p99_ms",
+                "db_commits_per_update", "api_calls_per_update"):
+        old, new = baseline.get(key), current.get(key)
+        if not old:
+            print(f"  {key}: {old} -> {new}")
+            continue
+        delta = (new - old) / old * 100
+        print(f"  {key}: {old} -> {new} ({delta:+.1f}%)")
+
+
+def configure_scheduler(scheduler, global_rate, chat_rate):
+    """По умолчанию лимиты Telegram не моделируются: меряем обработчики, а не 30 запросов/сек"""
+    unlimited = 1e9
+    scheduler.global_bucket = TokenBucket(global_rate or unlimited, global_rate or unlimited)
+    scheduler.chat_rate = chat_rate or unlimited
+    scheduler.chat_burst = scheduler.chat_burst if chat_rate else unlimited
+
+
+def configure_antiflood(antiflood, flood_rate):
+    """Виртуальные пользователи жмут кнопки без пауз, поэтому антифлуд по умолчанию выключен"""
+    if not flood_rate:
+        antiflood.rate = antiflood.burst = 1e9
+    else:
+        antiflood.rate = flood_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест диспетчера бота")
+    parser.add_argument("--users", type=int, default=1000, help="число виртуальных пользователей")
+    parser.add_argument("--keypresses", type=int, default=20, help="нажатий кнопок на пользователя")
+    parser.add_argument("--inline-share", type=float, default=0.0, help="доля пользователей инлайн-режима")
+    parser.add_argument("--typing-delay", type=float, default=0.1, help="пауза между символами инлайн-запроса, сек")
+    parser.add_argument("--concurrency", type=int, default=200, help="одновременно активных пользователей")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа Bot API, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, сек")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, сек")
+    parser.add_argument("--forbidden-rate", type=float, default=0.0, help="доля ответов 403")
+    parser.add_argument("--global-rate", type=float, default=0.0,
+                        help="общий лимит планировщика, запросов/сек (0 - без лимита)")
+    parser.add_argument("--chat-rate", type=float, default=0.0,
+                        help="лимит планировщика на чат, сообщений/сек (0 - без лимита)")
+    parser.add_argument("--flood-rate", type=float, default=0.0,
+                        help="лимит антифлуда на пользователя, апдейтов/сек (0 - без лимита)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="файл результатов (по умолчанию bench_results/load_<время>.json)")
+    parser.add_argument("--compare", help="файл результатов предыдущего прогона для сравнения")
+    parser.add_argument("--log-level", default="WARNING", help="уровень логирования бота во время прогона")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(
+        BASE_DIR, "bench_results", f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output = os.path.abspath(output)
+    compare = os.path.abspath(args.compare) if args.compare else None
+
+    with tempfile.TemporaryDirectory(prefix="bench_load_") as workdir:
+        main_module = load_main_module(workdir)
+
+        import logging
+        logging.getLogger().setLevel(args.log_level)
+        logging.getLogger("aiogram").setLevel(args.log_level)
+
+        session = FakeTelegramSession(
+            latency=args.latency,
+            jitter=args.jitter,
+            retry_after_rate=args.retry_after_rate,
+            forbidden_rate=args.forbidden_rate,
+            retry_after=args.retry_after,
+            seed=args.seed,
+        )
+        # Переносим middleware штатной сессии (повторы и т.п.), чтобы мерить боевой путь запросов
+        for middleware in main_module.bot.session.middleware:
+            session.middleware(middleware)
+        main_module.bot.session = session
+        configure_scheduler(main_module.outbound_scheduler, args.global_rate, args.chat_rate)
+        configure_antiflood(main_module.antiflood, args.flood_rate)
+
+        print(f"🚀 Нагрузочный тест: {args.users} пользователей, {args.keypresses} нажатий на пользователя")
+        results = asyncio.run(run_load(main_module, session, args.users, args.keypresses,
+                                       args.concurrency, args.seed, args.inline_share, args.typing_delay))
+        results["coalesced_edits"] = main_module.outbound_scheduler.coalesced
+        results["flood_dropped"] = main_module.antiflood.dropped
+
+    print("\n📊 Результаты:")
+    for key, value in results.items():
+        print(f"  {key}: {value}")
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"params": vars(args), "timestamp": datetime.now().isoformat(), "results": results},
+                  f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Результаты сохранены в {output}")
+
+    if compare:
+        compare_results(results, compare)
+
+
+if __name__ == "__main__":
+    main()
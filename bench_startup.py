@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк холодного старта бота
+
+Запускает main.py в отдельном интерпретаторе (во временном каталоге, с
+заглушкой Bot API из bench_load.py) и замеряет время до первого
+обработанного апдейта: старт интерпретатора, импорт main и обработку
+/start. С флагом --importtime дополнительно печатает самые дорогие
+импорты по данным `python -X importtime`.
+
+Пример:
+    python bench_startup.py --runs 5 --importtime
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD_SCRIPT = '''
+import time
+started = time.time()
+import asyncio, json, sys
+sys.path.insert(0, {base_dir!r})
+import config
+config.BOT_TOKEN = "123456789:AAbenchmarkbenchmarkbenchmarkbenchm"
+import main
+imported = time.time()
+from bench_load import FakeTelegramSession, UpdateFactory
+main.bot.session = FakeTelegramSession()
+update = UpdateFactory(main.bot).message(1, "/start")
+asyncio.run(main.dp.feed_update(main.bot, update))
+handled = time.time()
+print("BENCH_STARTUP " + json.dumps({{"started": started, "imported": imported, "handled": handled}}))
+'''
+
+
+def run_once(importtime=False):
+    """Один холодный старт; возвращает тайминги и вывод -X importtime"""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', CHILD_SCRIPT.format(base_dir=BASE_DIR)]
+
+    with tempfile.TemporaryDirectory(prefix='bench_startup_') as workdir:
+        spawned = time.time()
+        completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True)
+
+    marker = next((line for line in completed.stdout.splitlines() if line.startswith('BENCH_STARTUP ')), None)
+    if completed.returncode != 0 or marker is None:
+        raise RuntimeError(f"Дочерний процесс завершился с ошибкой:\n{completed.stderr[-2000:]}")
+
+    marks = json.loads(marker.split(' ', 1)[1])
+    timings = {
+        'interpreter_ms': (marks['started'] - spawned) * 1000,
+        'import_main_ms': (marks['imported'] - marks['started']) * 1000,
+        'first_update_ms': (marks['handled'] - marks['imported']) * 1000,
+        'time_to_first_update_ms': (marks['handled'] - spawned) * 1000,
+    }
+    return timings, completed.stderr
+
+
+def top_imports(stderr, limit):
+    """Самые дорогие импорты по накопленному времени"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace('import time:', '|', 1).split('|'))
+        rows.append((int(cumulative_us), int(self_us), name))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк холодного старта бота')
+    parser.add_argument('--runs', type=int, default=5, help='число холодных стартов')
+    parser.add_argument('--importtime', action='store_true', help='показать самые дорогие импорты')
+    parser.add_argument('--top', type=int, default=15, help='сколько импортов показать')
+    args = parser.parse_args()
+
+    samples = [run_once()[0] for _ in range(args.runs)]
+
+    print(f"🚀 Холодный старт, медиана по {args.runs} запускам:")
+    for key in samples[0]:
+        values = [sample[key] for sample in samples]
+        print(f"  {key:26} {statistics.median(values):9.1f} мс  (мин {min(values):.1f}, макс {max(values):.1f})")
+
+    if args.importtime:
+        _, stderr = run_once(importtime=True)
+        print(f"\n📦 Самые дорогие импорты (накопленно / собственное время):")
+        for cumulative_us, self_us, name in top_imports(stderr, args.top):
+            print(f"  {cumulative_us / 1000:9.1f} мс  {self_us / 1000:8.1f} мс  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Проверка и бенчмарк хранилищ из storage_backends.py
+
+Для каждого хранилища (sqlite, memory, dbm) во временном каталоге:
+- прогоняет одну и ту же проверку интерфейса StorageBackend: поведение
+  и типы записей должны совпадать у всех реализаций;
+- замеряет ops/s на типовых нагрузках бота (нажатия калькулятора,
+  чтение настроек, профили, запись вычислений, выборка для рассылки)
+  и отмечает самое быстрое хранилище для каждой нагрузки.
+Код выхода 1, если хоть одно хранилище не прошло проверку.
+
+Пример:
+    python bench_storage.py --backends sqlite dbm --users 5000 --duration 2
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from storage_backends import (BACKENDS, open_backend, UserProfile, CalculatorSession, CalculationRecord,
+                              BroadcastRecord, UpdateRecord)
+
+
+class Conformance:
+    """Собирает расхождения с контрактом StorageBackend"""
+
+    def __init__(self):
+        self.failures = []
+
+    def expect(self, condition, message):
+        if not condition:
+            self.failures.append(message)
+
+
+def check_users(store, c):
+    c.expect(store.get_user_profile(1) is None, "неизвестный пользователь - None")
+    c.expect(store.get_user_notifications_status(1) is True, "уведомления неизвестного пользователя включены")
+    store.create_user(1, 'alice', 'Alice', None)
+    store.create_user(1, 'other', 'Other', 'Name')
+    profile = store.get_user_profile(1)
+    c.expect(isinstance(profile, UserProfile), "get_user_profile возвращает UserProfile")
+    if profile is None:
+        return
+    c.expect((profile.username, profile.first_name, profile.last_name) == ('alice', 'Alice', None),
+             "повторный create_user не меняет пользователя")
+    c.expect(profile.subscribed is False and profile.notifications_enabled is True,
+             "новый пользователь не подписан, уведомления включены")
+    c.expect(profile.calculations_count == 0, "у нового пользователя 0 вычислений")
+
+    store.update_profile_data(1, first_name='Alicia')
+    profile = store.get_user_profile(1)
+    c.expect((profile.username, profile.first_name) == ('alice', 'Alicia'),
+             "update_profile_data меняет только переданные поля")
+
+    store.create_user(2, 'bob', 'Bob', None)
+    store.create_user(3, 'carol', 'Carol', None)
+    store.update_subscription_status(1, True)
+    store.update_subscription_status(2, True)
+    store.toggle_user_notifications(2, False)
+    c.expect(store.get_user_profile(1).subscribed is True, "update_subscription_status сохраняется")
+    c.expect(store.get_user_notifications_status(2) is False, "toggle_user_notifications сохраняется")
+    c.expect(sorted(store.get_users_for_broadcast()) == [1], "рассылка подписанным с уведомлениями")
+    c.expect(sorted(store.get_users_for_broadcast(only_subscribed=False)) == [1, 3],
+             "рассылка всем с уведомлениями")
+
+    recent = store.get_recent_users(limit=2)
+    c.expect(len(recent) == 2 and all(isinstance(user, UserProfile) for user in recent),
+             "get_recent_users возвращает limit записей UserProfile")
+
+
+def check_sessions(store, c):
+    c.expect(store.get_calculator_session(10) is None, "нет сессии - None")
+    store.update_calculator_memory(10, '42')
+    store.set_calculator_mode(10, True)
+    store.update_calculator_session(10, '12+3', '12+', 555)
+    session = store.get_calculator_session(10)
+    c.expect(isinstance(session, CalculatorSession), "get_calculator_session возвращает CalculatorSession")
+    if session is None:
+        return
+    c.expect((session.user_id, session.value, session.old_value, session.message_id) == (10, '12+3', '12+', 555),
+             "update_calculator_session сохраняет ввод")
+    c.expect(session.memory == '42' and session.scientific is True,
+             "update_calculator_session не сбрасывает память и режим")
+    store.set_calculator_mode(10, False)
+    c.expect(store.get_calculator_session(10).scientific is False, "set_calculator_mode выключает режим")
+    store.reset_calculator_session(10)
+    c.expect(store.get_calculator_session(10) is None, "reset_calculator_session удаляет сессию")
+    store.update_calculator_memory(11, '7')
+    session = store.get_calculator_session(11)
+    c.expect(session is not None and (session.value, session.memory, session.scientific) == ('', '7', False),
+             "сессия, созданная записью памяти, пустая и в обычном режиме")
+    store.update_calculator_session(12, '1', '', 1)
+    c.expect(store.count_calculator_sessions() == 2, "count_calculator_sessions считает сессии")
+    c.expect(store.cleanup_calculator_sessions(days=1) == 0 and store.count_calculator_sessions() == 2,
+             "cleanup_calculator_sessions не трогает свежие сессии")
+    time.sleep(0.01)
+    c.expect(store.cleanup_calculator_sessions(days=0) == 2 and store.count_calculator_sessions() == 0,
+             "cleanup_calculator_sessions удаляет неактивные сессии")
+
+
+def check_history(store, c):
+    store.create_user(20, 'dave', 'Dave', None)
+    store.record_calculation(20, '1+1', '2')
+    store.record_calculation(20, '2*3', '6')
+    store.record_calculation(20, '1/0', 'Ошибка', is_error=True)
+    c.expect(store.get_user_profile(20).calculations_count == 2, "ошибки не увеличивают счетчик вычислений")
+    history = store.get_user_calculation_history(20, limit=10)
+    c.expect(all(isinstance(record, CalculationRecord) for record in history),
+             "история - записи CalculationRecord")
+    c.expect([record.expression for record in history] == ['2*3', '1+1'], "история от новых к старым без ошибок")
+    c.expect(len(store.get_user_calculation_history(20, limit=1)) == 1, "история ограничена limit")
+    c.expect(store.get_user_calculation_history(21) == [], "пустая история - пустой список")
+
+
+def check_broadcasts(store, c):
+    c.expect(store.get_broadcast_history() == [], "без рассылок - пустой список")
+    first = store.create_broadcast(1, 'first', total_users=3)
+    second = store.create_broadcast(1, 'second', total_users=5)
+    c.expect(isinstance(first, int) and first != second, "create_broadcast возвращает новый id")
+    store.update_broadcast_stats(first, 2, 1)
+    history = store.get_broadcast_history(limit=5)
+    c.expect(all(isinstance(record, BroadcastRecord) for record in history), "история - записи BroadcastRecord")
+    c.expect([record.message_text for record in history] == ['second', 'first'], "рассылки от новых к старым")
+    if len(history) == 2:
+        c.expect((history[1].sent_count, history[1].failed_count, history[1].status) == (2, 1, 'completed'),
+                 "update_broadcast_stats сохраняется")
+        c.expect((history[0].status, history[0].total_users) == ('sending', 5), "новая рассылка в статусе sending")
+
+
+def check_settings(store, c):
+    c.expect(store.get_bot_setting('missing') is None, "нет настройки - None")
+    c.expect(store.set_bot_setting('version', '1.0') is True, "set_bot_setting возвращает True при успехе")
+    store.set_bot_setting('version', '2.0')
+    c.expect(store.get_bot_setting('version') == '2.0', "set_bot_setting перезаписывает значение")
+    store.set_bot_setting('channel', '@channel')
+    c.expect(store.get_bot_settings() == {'version': '2.0', 'channel': '@channel'},
+             "get_bot_settings возвращает все настройки")
+    store.add_update_history('1.0', 'first')
+    store.add_update_history('2.0', 'second')
+    updates = store.get_update_history(limit=5)
+    c.expect(all(isinstance(record, UpdateRecord) for record in updates), "история - записи UpdateRecord")
+    c.expect([record.version for record in updates] == ['2.0', '1.0'], "обновления от новых к старым")
+    c.expect(len(store.get_update_history(limit=1)) == 1, "история обновлений ограничена limit")
+    c.expect(store.upsert_update_history('1.0', 'first') is False, "upsert_update_history без изменений не пишет")
+    c.expect(store.upsert_update_history('1.0', 'first, fixed') is True, "upsert_update_history меняет текст")
+    c.expect(store.upsert_update_history('3.0', 'third') is True, "upsert_update_history добавляет версию")
+    updates = {record.version: record.changes_text for record in store.get_update_history(limit=5)}
+    c.expect(updates == {'1.0': 'first, fixed', '2.0': 'second', '3.0': 'third'},
+             "upsert_update_history не создает дубликатов версий")
+
+
+CHECKS = (check_users, check_sessions, check_history, check_broadcasts, check_settings)
+
+
+def run_conformance(kind, workdir):
+    c = Conformance()
+    for check in CHECKS:
+        # Каждая проверка на чистом хранилище
+        store = open_backend(kind, os.path.join(workdir, f'conformance_{kind}_{check.__name__}'))
+        try:
+            check(store, c)
+        except Exception as e:
+            c.failures.append(f"{check.__name__}: исключение {e!r}")
+        finally:
+            store.close()
+    return c.failures
+
+
+# Нагрузки: имя -> функция одного шага (store, rng, users)
+def step_keypress(store, rng, users):
+    # Нажатие кнопки калькулятора: чтение сессии и запись ввода
+    user_id = rng.randrange(users)
+    session = store.get_calculator_session(user_id)
+    value = (session.value if session else '')[-20:] + str(rng.randrange(10))
+    store.update_calculator_session(user_id, value, value, 1)
+
+
+def step_settings(store, rng, users):
+    if rng.random() < 0.05:
+        store.set_bot_setting(f'setting_{rng.randrange(20)}', str(rng.random()))
+    else:
+        store.get_bot_setting(f'setting_{rng.randrange(20)}')
+
+
+def step_profile(store, rng, users):
+    store.get_user_profile(rng.randrange(users))
+
+
+def step_calculation(store, rng, users):
+    store.record_calculation(rng.randrange(users), '12+3*4', '24')
+
+
+def step_broadcast_scan(store, rng, users):
+    store.get_users_for_broadcast()
+
+
+WORKLOADS = {
+    'keypress': step_keypress,
+    'settings': step_settings,
+    'profile': step_profile,
+    'calculation': step_calculation,
+    'broadcast_scan': step_broadcast_scan,
+}
+
+
+def populate(store, users, seed):
+    rng = random.Random(seed)
+    for user_id in range(users):
+        store.create_user(user_id, f'user{user_id}', f'User{user_id}', None)
+        if rng.random() < 0.7:
+            store.update_subscription_status(user_id, True)
+        if rng.random() < 0.2:
+            store.update_calculator_session(user_id, '12+3', '12+', user_id)
+    for index in range(20):
+        store.set_bot_setting(f'setting_{index}', str(index))
+
+
+def measure(step, store, users, duration, seed):
+    rng = random.Random(seed)
+    operations = 0
+    started = time.perf_counter()
+    deadline = started + duration
+    while time.perf_counter() < deadline:
+        step(store, rng, users)
+        operations += 1
+    return round(operations / (time.perf_counter() - started), 1)
+
+
+def bench_backend(kind, workdir, args):
+    store = open_backend(kind, os.path.join(workdir, f'bench_{kind}'))
+    try:
+        started = time.perf_counter()
+        populate(store, args.users, args.seed)
+        print(f"   заполнение {args.users} пользователей: {time.perf_counter() - started:.1f}с")
+        results = {}
+        for name in args.workloads:
+            results[name] = measure(WORKLOADS[name], store, args.users, args.duration, args.seed)
+            print(f"   {name:16} {results[name]:>12.1f} ops/s")
+        return results
+    finally:
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка и бенчмарк хранилищ бота')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--workloads', nargs='+', choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--duration', type=float, default=1.0, help='длительность замера каждой нагрузки, сек')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--check-only', action='store_true', help='только проверка интерфейса')
+    parser.add_argument('--output', help='сохранить результаты в JSON')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    report = {'conformance': {}, 'ops_per_s': {}}
+    with tempfile.TemporaryDirectory(prefix='bench_storage_') as workdir:
+        # Глобальный db из bot_database создаст свой файл во временном каталоге
+        os.chdir(workdir)
+        try:
+            for kind in args.backends:
+                failures = run_conformance(kind, workdir)
+                report['conformance'][kind] = failures
+                print(f"{'✅' if not failures else '❌'} {kind}: проверка интерфейса"
+                      f"{'' if not failures else f' - {len(failures)} расхождений'}")
+                for failure in failures:
+                    print(f"   • {failure}")
+            if not args.check_only:
+                for kind in args.backends:
+                    print(f"\n📦 {kind}")
+                    report['ops_per_s'][kind] = bench_backend(kind, workdir, args)
+        finally:
+            os.chdir(BASE_DIR)
+
+    if report['ops_per_s']:
+        print("\n🏁 Самое быстрое хранилище:")
+        for name in args.workloads:
+            best = max(report['ops_per_s'], key=lambda kind: report['ops_per_s'][kind][name])
+            print(f"   {name:16} {best} ({report['ops_per_s'][best][name]:.0f} ops/s)")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'timestamp': datetime.now().isoformat(), 'results': report},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {output}")
+
+    return 1 if any(report['conformance'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
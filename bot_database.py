@@ -1,16 +1,87 @@
 import sqlite3
+import json
 import logging
+import os
 import threading
 import time
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from contextlib import contextmanager
 
+from storage_backends import (StorageBackend, UserProfile, CalculatorSession, CalculationRecord,
+                              BroadcastRecord, UpdateRecord)
+
 logger = logging.getLogger(__name__)
 
-class Database:
-    def __init__(self, db_name='calculator_bot.db'):
+# Таблицы и столбцы, доступные для выгрузки админом (имена в SQL берутся только отсюда)
+EXPORT_TABLES = {
+    'users': ('user_id', 'username', 'first_name', 'last_name', 'subscribed', 'notifications_enabled',
+              'calculations_count', 'created_at', 'last_activity', 'last_calculation'),
+    'calculation_history': ('id', 'user_id', 'expression', 'result', 'calculation_date'),
+    'broadcasts': ('id', 'admin_id', 'message_text', 'sent_count', 'failed_count', 'total_users',
+                   'created_at', 'status'),
+}
+
+def snapshot_database(source_path, target_path, pages_per_step=1024, step_pause=0.001, progress=None):
+    """Согласованная копия БД через SQLite backup API; возвращает (шагов, перезапусков)
+    
+    Все шаги копирования идут внутри одной читающей транзакции: в режиме WAL
+    она не мешает записи, а копия соответствует одному моменту и не начинается
+    заново после каждой записи из других соединений.
+    """
+    state = {'steps': 0, 'restarts': 0, 'remaining': None}
+    
+    def on_progress(status, remaining, total):
+        state['steps'] += 1
+        # Оставшихся страниц стало больше - источник изменился и копирование пошло заново
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+        state['remaining'] = remaining
+        if progress is not None:
+            progress(remaining, total)
+        if remaining:
+            # Пауза между шагами: отдаем диск и GIL остальной работе бота
+            time.sleep(step_pause)
+    
+    source = sqlite3.connect(source_path, timeout=30.0, isolation_level=None)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        destination = sqlite3.connect(target_path)
+        try:
+            source.backup(destination, pages=pages_per_step, progress=on_progress)
+            # Копия - самостоятельный файл без -wal, ее можно открыть только для чтения
+            destination.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            destination.close()
+        source.execute("COMMIT")
+    finally:
+        source.close()
+    return state['steps'], state['restarts']
+
+class Database(StorageBackend):
+    """Хранилище на SQLite - основное для бота (интерфейс в storage_backends.py)"""
+
+    def __init__(self, db_name='calculator_bot.db', profile_cache_size=10000, stats_snapshot_ttl=60):
         self.db_name = db_name
         self._lock = threading.Lock()
+        # LRU-кэш профилей: user_id -> UserProfile, сбрасывается при записи в users
+        self._profile_cache = OrderedDict()
+        self._profile_cache_size = profile_cache_size
+        self._cache_lock = threading.Lock()
+        # Общий снимок статистики бота: (время, stats)
+        self._stats_snapshot = None
+        self._stats_snapshot_ttl = stats_snapshot_ttl
+        # Реплика для отчетов админа: снимок БД только для чтения (enable_replica)
+        self.replica_path = None
+        self.replica_max_age = 0
+        self._replica_refreshed = None
+        self._replica_lock = threading.Lock()
+        self.replica_refreshes = 0
+        self.replica_failures = 0
+        self.replica_reads = 0
+        self.replica_fallbacks = 0
+        self.replica_last_duration = 0.0
         self._init_db()
     
     @contextmanager
@@ -41,6 +112,85 @@ class Database:
                 if conn:
                     conn.close()
     
+    def enable_replica(self, path=None, max_age=300):
+        """Включает реплику: отчеты читают снимок БД, пока он не старше max_age секунд"""
+        self.replica_path = path or self.db_name + '.replica'
+        self.replica_max_age = max_age
+    
+    def refresh_replica(self):
+        """Обновляет снимок реплики; выполняется в рабочем потоке, возвращает успех"""
+        if self.replica_path is None or not self._replica_lock.acquire(blocking=False):
+            return False
+        partial = self.replica_path + '.part'
+        try:
+            started = time.perf_counter()
+            snapshot_database(self.db_name, partial)
+            # Читатели старого снимка дочитывают его, новые соединения открывают новый
+            os.replace(partial, self.replica_path)
+            self._replica_refreshed = time.monotonic()
+            self.replica_last_duration = time.perf_counter() - started
+            self.replica_refreshes += 1
+            return True
+        except Exception as e:
+            self.replica_failures += 1
+            logger.error(f"❌ Ошибка обновления реплики: {e}")
+            if os.path.exists(partial):
+                os.remove(partial)
+            return False
+        finally:
+            self._replica_lock.release()
+    
+    def get_replica_age(self):
+        """Сколько секунд назад обновлена реплика; None - реплика выключена или еще не готова"""
+        if self.replica_path is None or self._replica_refreshed is None:
+            return None
+        return time.monotonic() - self._replica_refreshed
+    
+    def get_read_age(self):
+        """Возраст данных, которые сейчас получат отчеты: возраст реплики или 0 для основной БД"""
+        age = self.get_replica_age()
+        if age is None or age > self.replica_max_age:
+            return 0.0
+        return age
+    
+    def _replica_source(self):
+        """Путь к реплике, если она не старше replica_max_age, иначе None"""
+        age = self.get_replica_age()
+        if age is None:
+            return None
+        if age > self.replica_max_age:
+            self.replica_fallbacks += 1
+            return None
+        self.replica_reads += 1
+        return self.replica_path
+    
+    @contextmanager
+    def _get_read_connection(self):
+        """Соединение для отчетов: реплика только для чтения без общей блокировки или основная БД"""
+        path = self._replica_source()
+        if path is None:
+            with self._get_connection() as conn:
+                yield conn
+            return
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    def get_replica_stats(self):
+        age = self.get_replica_age()
+        return {
+            'enabled': self.replica_path is not None,
+            'age_s': round(age, 1) if age is not None else '-',
+            'max_age_s': self.replica_max_age,
+            'refreshes': self.replica_refreshes,
+            'failures': self.replica_failures,
+            'last_refresh_ms': round(self.replica_last_duration * 1000, 1),
+            'replica_reads': self.replica_reads,
+            'primary_fallbacks': self.replica_fallbacks,
+        }
+    
     def _init_db(self):
         """Внутренняя инициализация базы данных"""
         try:
@@ -72,7 +222,9 @@ class Database:
                         value TEXT DEFAULT '',
                         old_value TEXT DEFAULT '',
                         message_id INTEGER,
-                        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        memory TEXT DEFAULT '',
+                        scientific INTEGER DEFAULT 0
                     )
                 ''')
                 
@@ -119,12 +271,107 @@ class Database:
                     )
                 ''')
                 
+                # Накопительная статистика вычислений по дням
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS user_calc_daily (
+                        user_id INTEGER,
+                        day TEXT,
+                        calculations INTEGER DEFAULT 0,
+                        errors INTEGER DEFAULT 0,
+                        PRIMARY KEY (user_id, day)
+                    ) WITHOUT ROWID
+                ''')
+                
+                # Накопительная статистика вычислений пользователя за все время
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS user_calc_stats (
+                        user_id INTEGER PRIMARY KEY,
+                        calculations INTEGER DEFAULT 0,
+                        errors INTEGER DEFAULT 0,
+                        op_add INTEGER DEFAULT 0,
+                        op_sub INTEGER DEFAULT 0,
+                        op_mul INTEGER DEFAULT 0,
+                        op_div INTEGER DEFAULT 0,
+                        longest_expression TEXT DEFAULT '',
+                        last_calculation TIMESTAMP
+                    )
+                ''')
+                
+                # Состояния FSM (рассылка и т.п.), переживают перезапуск бота
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS fsm_states (
+                        storage_key TEXT PRIMARY KEY,
+                        state TEXT,
+                        data TEXT,
+                        expires_at REAL
+                    )
+                ''')
+                
+                # Дневные скетчи HyperLogLog уникальных пользователей (activity.py)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS activity_sketches (
+                        day TEXT,
+                        metric TEXT,
+                        sketch BLOB,
+                        PRIMARY KEY (day, metric)
+                    )
+                ''')
+                
                 conn.commit()
                 logger.info("✅ База данных инициализирована")
+            
+            self._migrate_database()
+            self._backfill_calculation_rollups()
                 
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации БД: {e}")
     
+    def _backfill_calculation_rollups(self):
+        """Однократно заполняет накопительную статистику из истории вычислений"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1 FROM user_calc_stats LIMIT 1')
+                if cursor.fetchone():
+                    return
+                cursor.execute('SELECT 1 FROM calculation_history LIMIT 1')
+                if not cursor.fetchone():
+                    return
+                
+                cursor.execute('''
+                    INSERT OR IGNORE INTO user_calc_daily (user_id, day, calculations, errors)
+                    SELECT user_id, date(calculation_date), COUNT(*), 0
+                    FROM calculation_history
+                    GROUP BY user_id, date(calculation_date)
+                ''')
+                # SQLite возвращает expression той строки, на которой достигнут MAX
+                cursor.execute('''
+                    INSERT OR IGNORE INTO user_calc_stats
+                    (user_id, calculations, op_add, op_sub, op_mul, op_div, longest_expression)
+                    SELECT user_id, calculations, op_add, op_sub, op_mul, op_div, longest_expression
+                    FROM (
+                        SELECT user_id, COUNT(*) AS calculations,
+                               SUM(length(expression) - length(replace(expression, '+', ''))) AS op_add,
+                               SUM(length(expression) - length(replace(expression, '-', ''))) AS op_sub,
+                               SUM(length(expression) - length(replace(expression, '*', ''))) AS op_mul,
+                               SUM(length(expression) - length(replace(expression, '/', ''))) AS op_div,
+                               expression AS longest_expression, MAX(length(expression))
+                        FROM calculation_history
+                        GROUP BY user_id
+                    )
+                ''')
+                # История хранится 7 дней, общий счетчик и время берем из users
+                cursor.execute('''
+                    UPDATE user_calc_stats
+                    SET calculations = MAX(calculations, COALESCE(
+                            (SELECT calculations_count FROM users WHERE users.user_id = user_calc_stats.user_id), 0)),
+                        last_calculation = (SELECT last_calculation FROM users WHERE users.user_id = user_calc_stats.user_id)
+                ''')
+                conn.commit()
+                logger.info("✅ Статистика вычислений заполнена из истории")
+        except Exception as e:
+            logger.error(f"❌ Ошибка заполнения статистики вычислений: {e}")
+    
     def _migrate_database(self):
         """Миграция базы данных - добавляет новые столбцы при обновлении"""
         try:
@@ -147,10 +394,55 @@ class Database:
                         cursor.execute(f"ALTER TABLE users ADD COLUMN {column_name} {column_type}")
                         logger.info(f"✅ Добавлен столбец {column_name} в таблицу users")
                 
+                # Память и режим калькулятора хранятся в сессии
+                cursor.execute("PRAGMA table_info(calculator_sessions)")
+                existing_columns = [column[1] for column in cursor.fetchall()]
+                
+                new_columns = [
+                    ('memory', "TEXT DEFAULT ''"),
+                    ('scientific', 'INTEGER DEFAULT 0')
+                ]
+                
+                for column_name, column_type in new_columns:
+                    if column_name not in existing_columns:
+                        cursor.execute(f"ALTER TABLE calculator_sessions ADD COLUMN {column_name} {column_type}")
+                        logger.info(f"✅ Добавлен столбец {column_name} в таблицу calculator_sessions")
+
                 conn.commit()
         except Exception as e:
             logger.error(f"❌ Ошибка миграции базы данных: {e}")
     
+    def _invalidate_profile(self, user_id):
+        with self._cache_lock:
+            self._profile_cache.pop(user_id, None)
+    
+    def get_user_profile(self, user_id):
+        """Профиль пользователя одним запросом через LRU-кэш"""
+        with self._cache_lock:
+            profile = self._profile_cache.get(user_id)
+            if profile is not None:
+                self._profile_cache.move_to_end(user_id)
+                return profile
+        
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'SELECT {UserProfile.COLUMNS} FROM users WHERE user_id = ?', (user_id,))
+                row = cursor.fetchone()
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения профиля {user_id}: {e}")
+            return None
+        
+        if row is None:
+            return None
+        
+        profile = UserProfile(*row)
+        with self._cache_lock:
+            self._profile_cache[user_id] = profile
+            if len(self._profile_cache) > self._profile_cache_size:
+                self._profile_cache.popitem(last=False)
+        return profile
+    
     def get_user(self, user_id):
         """Безопасное получение пользователя"""
         try:
@@ -177,16 +469,21 @@ class Database:
             logger.error(f"❌ Ошибка создания пользователя {user_id}: {e}")
     
     def update_subscription_status(self, user_id, subscribed):
-        """Безопасное обновление статуса подписки"""
+        """Безопасное обновление статуса подписки
+        
+        last_activity здесь не пишется: активность считает ActivityTracker,
+        а время последней активности обновляет record_calculation.
+        """
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     UPDATE users 
-                    SET subscribed = ?, last_subscription_check = ?, last_activity = ?
+                    SET subscribed = ?, last_subscription_check = ?
                     WHERE user_id = ?
-                ''', (subscribed, datetime.now(), datetime.now(), user_id))
+                ''', (subscribed, datetime.now(), user_id))
                 conn.commit()
+            self._invalidate_profile(user_id)
         except Exception as e:
             logger.error(f"❌ Ошибка обновления подписки {user_id}: {e}")
     
@@ -201,6 +498,7 @@ class Database:
                     WHERE user_id = ?
                 ''', (datetime.now(), user_id))
                 conn.commit()
+            self._invalidate_profile(user_id)
         except Exception as e:
             logger.error(f"❌ Ошибка обновления активности {user_id}: {e}")
     
@@ -233,6 +531,7 @@ class Database:
                     cursor.execute(query, params)
                 
                 conn.commit()
+            self._invalidate_profile(user_id)
         except Exception as e:
             logger.error(f"❌ Ошибка обновления профиля {user_id}: {e}")
     
@@ -247,6 +546,7 @@ class Database:
                     WHERE user_id = ?
                 ''', (datetime.now(), datetime.now(), user_id))
                 conn.commit()
+            self._invalidate_profile(user_id)
         except Exception as e:
             logger.error(f"❌ Ошибка увеличения счетчика {user_id}: {e}")
     
@@ -255,9 +555,10 @@ class Database:
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM calculator_sessions WHERE user_id = ?', (user_id,))
-                session = cursor.fetchone()
-                return session
+                cursor.execute(f'SELECT {CalculatorSession.COLUMNS} FROM calculator_sessions WHERE user_id = ?',
+                               (user_id,))
+                row = cursor.fetchone()
+                return CalculatorSession(*row) if row else None
         except Exception as e:
             logger.error(f"❌ Ошибка получения сессии {user_id}: {e}")
             return None
@@ -267,15 +568,53 @@ class Database:
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
+                # UPSERT вместо INSERT OR REPLACE, чтобы не сбрасывать память и режим
                 cursor.execute('''
-                    INSERT OR REPLACE INTO calculator_sessions 
+                    INSERT INTO calculator_sessions
                     (user_id, value, old_value, message_id, last_activity)
                     VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        value = excluded.value,
+                        old_value = excluded.old_value,
+                        message_id = excluded.message_id,
+                        last_activity = excluded.last_activity
                 ''', (user_id, value, old_value, message_id, datetime.now()))
                 conn.commit()
         except Exception as e:
             logger.error(f"❌ Ошибка обновления сессии {user_id}: {e}")
     
+    def update_calculator_memory(self, user_id, memory):
+        """Сохраняет память калькулятора (M+, M-, MC)"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO calculator_sessions (user_id, memory, last_activity)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        memory = excluded.memory,
+                        last_activity = excluded.last_activity
+                ''', (user_id, memory, datetime.now()))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения памяти калькулятора {user_id}: {e}")
+    
+    def set_calculator_mode(self, user_id, scientific):
+        """Включает или выключает научную раскладку калькулятора"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO calculator_sessions (user_id, scientific, last_activity)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        scientific = excluded.scientific,
+                        last_activity = excluded.last_activity
+                ''', (user_id, 1 if scientific else 0, datetime.now()))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Ошибка переключения режима калькулятора {user_id}: {e}")
+
     def reset_calculator_session(self, user_id):
         """Безопасный сброс сессии калькулятора"""
         try:
@@ -286,10 +625,34 @@ class Database:
         except Exception as e:
             logger.error(f"❌ Ошибка сброса сессии {user_id}: {e}")
     
+    def count_calculator_sessions(self):
+        """Число сохраненных сессий калькулятора"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT COUNT(*) FROM calculator_sessions')
+                return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"❌ Ошибка подсчета сессий: {e}")
+            return 0
+    
+    def cleanup_calculator_sessions(self, days=30):
+        """Удаляет сессии без активности дольше days дней; возвращает число удаленных"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM calculator_sessions WHERE last_activity < ?',
+                               (datetime.now() - timedelta(days=days),))
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"❌ Ошибка очистки сессий: {e}")
+            return 0
+    
     def get_user_stats(self):
         """Безопасное получение статистики"""
         try:
-            with self._get_connection() as conn:
+            with self._get_read_connection() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('SELECT COUNT(*) FROM users')
@@ -301,12 +664,7 @@ class Database:
                 cursor.execute('SELECT COUNT(*) FROM calculator_sessions')
                 active_sessions = cursor.fetchone()[0]
                 
-                # Активные пользователи за последние 7 дней
-                cursor.execute('''
-                    SELECT COUNT(*) FROM users 
-                    WHERE last_activity > datetime('now', '-7 days')
-                ''')
-                active_week = cursor.fetchone()[0]
+                # Активных за период считает ActivityTracker по скетчам, без сканирования users
                 
                 # Общее количество вычислений
                 cursor.execute('SELECT SUM(calculations_count) FROM users')
@@ -316,7 +674,6 @@ class Database:
                     'total_users': total_users,
                     'subscribed_users': subscribed_users,
                     'active_sessions': active_sessions,
-                    'active_week': active_week,
                     'total_calculations': total_calculations
                 }
         except Exception as e:
@@ -325,10 +682,17 @@ class Database:
                 'total_users': 0,
                 'subscribed_users': 0,
                 'active_sessions': 0,
-                'active_week': 0,
                 'total_calculations': 0
             }
     
+    def get_stats_snapshot(self):
+        """Статистика бота, пересчитываемая не чаще раза в stats_snapshot_ttl секунд"""
+        snapshot = self._stats_snapshot
+        if snapshot is None or time.time() - snapshot[0] > self._stats_snapshot_ttl:
+            snapshot = (time.time(), self.get_user_stats())
+            self._stats_snapshot = snapshot
+        return snapshot[1]
+    
     def get_users_for_broadcast(self, only_subscribed=True):
         """Безопасное получение пользователей для рассылки"""
         try:
@@ -379,31 +743,33 @@ class Database:
     def get_broadcast_history(self, limit=5):
         """Безопасное получение истории рассылок"""
         try:
-            with self._get_connection() as conn:
+            with self._get_read_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT * FROM broadcasts 
-                    ORDER BY created_at DESC 
-                    LIMIT ?
-                ''', (limit,))
-                broadcasts = cursor.fetchall()
-                return broadcasts
+                cursor.execute(f'SELECT {BroadcastRecord.COLUMNS} FROM broadcasts ORDER BY created_at DESC LIMIT ?',
+                               (limit,))
+                return [BroadcastRecord(*row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"❌ Ошибка получения истории рассылок: {e}")
             return []
     
+    def get_recent_users(self, limit=5):
+        """Последние зарегистрированные пользователи"""
+        try:
+            with self._get_read_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'SELECT {UserProfile.COLUMNS} FROM users ORDER BY created_at DESC LIMIT ?', (limit,))
+                return [UserProfile(*row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения последних пользователей: {e}")
+            return []
+    
     def get_all_users(self):
         """Безопасное получение всех пользователей"""
         try:
-            with self._get_connection() as conn:
+            with self._get_read_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT user_id, username, first_name, last_name, subscribed, created_at, last_activity, calculations_count, last_calculation
-                    FROM users 
-                    ORDER BY created_at DESC
-                ''')
-                users = cursor.fetchall()
-                return users
+                cursor.execute(f'SELECT {UserProfile.COLUMNS} FROM users ORDER BY created_at DESC')
+                return [UserProfile(*row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"❌ Ошибка получения всех пользователей: {e}")
             return []
@@ -420,8 +786,19 @@ class Database:
             logger.error(f"❌ Ошибка получения настройки {key}: {e}")
             return None
     
+    def get_bot_settings(self):
+        """Все настройки бота одним запросом: {key: value}"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT key, value FROM bot_settings')
+                return dict(cursor.fetchall())
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения настроек: {e}")
+            return {}
+    
     def set_bot_setting(self, key, value):
-        """Безопасная установка настройки бота"""
+        """Безопасная установка настройки бота; возвращает успех"""
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
@@ -430,8 +807,10 @@ class Database:
                     VALUES (?, ?)
                 ''', (key, value))
                 conn.commit()
+                return True
         except Exception as e:
             logger.error(f"❌ Ошибка установки настройки {key}: {e}")
+            return False
     
     def add_update_history(self, version, changes_text):
         """Безопасное добавление истории обновлений"""
@@ -446,18 +825,40 @@ class Database:
         except Exception as e:
             logger.error(f"❌ Ошибка добавления истории обновлений: {e}")
     
+    def upsert_update_history(self, version, changes_text):
+        """Добавляет версию или меняет ее текст; сравнивает со всей таблицей, а не с последними записями
+        
+        Возвращает True, если в таблицу что-то записано.
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT changes_text FROM update_history WHERE version = ?', (version,))
+                texts = [row[0] for row in cursor.fetchall()]
+                if texts and all(text == changes_text for text in texts):
+                    return False
+                if texts:
+                    cursor.execute('UPDATE update_history SET changes_text = ? WHERE version = ?',
+                                   (changes_text, version))
+                else:
+                    cursor.execute('''
+                        INSERT INTO update_history (version, changes_text, release_date)
+                        VALUES (?, ?, ?)
+                    ''', (version, changes_text, datetime.now()))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи версии {version} в историю обновлений: {e}")
+            return False
+
     def get_update_history(self, limit=5):
         """Безопасное получение истории обновлений"""
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT * FROM update_history 
-                    ORDER BY release_date DESC 
-                    LIMIT ?
-                ''', (limit,))
-                updates = cursor.fetchall()
-                return updates
+                cursor.execute(f'SELECT {UpdateRecord.COLUMNS} FROM update_history ORDER BY release_date DESC LIMIT ?',
+                               (limit,))
+                return [UpdateRecord(*row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"❌ Ошибка получения истории обновлений: {e}")
             return []
@@ -473,6 +874,7 @@ class Database:
                     WHERE user_id = ?
                 ''', (enabled, user_id))
                 conn.commit()
+            self._invalidate_profile(user_id)
         except Exception as e:
             logger.error(f"❌ Ошибка переключения уведомлений {user_id}: {e}")
     
@@ -483,7 +885,7 @@ class Database:
                 cursor = conn.cursor()
                 cursor.execute('SELECT notifications_enabled FROM users WHERE user_id = ?', (user_id,))
                 result = cursor.fetchone()
-                return result[0] if result else True
+                return bool(result[0]) if result else True
         except Exception as e:
             logger.error(f"❌ Ошибка получения статуса уведомлений {user_id}: {e}")
             return True
@@ -501,20 +903,105 @@ class Database:
         except Exception as e:
             logger.error(f"❌ Ошибка добавления истории вычислений {user_id}: {e}")
     
+    def record_calculation(self, user_id, expression, result, is_error=False):
+        """Записывает вычисление одной транзакцией: счетчик, история и накопительная статистика"""
+        now = datetime.now()
+        day = now.strftime('%Y-%m-%d')
+        ok = 0 if is_error else 1
+        errors = 1 if is_error else 0
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                
+                if not is_error:
+                    cursor.execute('''
+                        UPDATE users 
+                        SET calculations_count = calculations_count + 1, last_calculation = ?, last_activity = ?
+                        WHERE user_id = ?
+                    ''', (now, now, user_id))
+                    cursor.execute('''
+                        INSERT INTO calculation_history (user_id, expression, result, calculation_date)
+                        VALUES (?, ?, ?, ?)
+                    ''', (user_id, expression, result, now))
+                
+                cursor.execute('''
+                    INSERT INTO user_calc_daily (user_id, day, calculations, errors)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user_id, day) DO UPDATE SET
+                        calculations = calculations + excluded.calculations,
+                        errors = errors + excluded.errors
+                ''', (user_id, day, ok, errors))
+                
+                cursor.execute('''
+                    INSERT INTO user_calc_stats
+                    (user_id, calculations, errors, op_add, op_sub, op_mul, op_div, longest_expression, last_calculation)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        calculations = calculations + excluded.calculations,
+                        errors = errors + excluded.errors,
+                        op_add = op_add + excluded.op_add,
+                        op_sub = op_sub + excluded.op_sub,
+                        op_mul = op_mul + excluded.op_mul,
+                        op_div = op_div + excluded.op_div,
+                        longest_expression = CASE
+                            WHEN length(excluded.longest_expression) > length(longest_expression)
+                            THEN excluded.longest_expression ELSE longest_expression END,
+                        last_calculation = COALESCE(excluded.last_calculation, last_calculation)
+                ''', (user_id, ok, errors,
+                      expression.count('+'), expression.count('-'), expression.count('*'), expression.count('/'),
+                      '' if is_error else expression, None if is_error else now))
+                
+                conn.commit()
+            self._invalidate_profile(user_id)
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи вычисления {user_id}: {e}")
+    
+    def get_calculation_stats(self, user_id, days=7):
+        """Накопительная статистика вычислений пользователя и разбивка по последним дням"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT calculations, errors, op_add, op_sub, op_mul, op_div, longest_expression, last_calculation
+                    FROM user_calc_stats WHERE user_id = ?
+                ''', (user_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                
+                cursor.execute('''
+                    SELECT day, calculations, errors FROM user_calc_daily
+                    WHERE user_id = ? AND day > date('now', 'localtime', ?)
+                    ORDER BY day DESC
+                ''', (user_id, f'-{days} days'))
+                daily = cursor.fetchall()
+                
+                calculations, errors, op_add, op_sub, op_mul, op_div, longest_expression, last_calculation = row
+                return {
+                    'calculations': calculations,
+                    'errors': errors,
+                    'operators': {'+': op_add, '-': op_sub, '*': op_mul, '/': op_div},
+                    'longest_expression': longest_expression,
+                    'last_calculation': last_calculation,
+                    'daily': daily
+                }
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения статистики вычислений {user_id}: {e}")
+            return None
+    
     def get_user_calculation_history(self, user_id, limit=10):
         """Безопасное получение истории вычислений пользователя"""
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT expression, result, calculation_date 
+                cursor.execute(f'''
+                    SELECT {CalculationRecord.COLUMNS}
                     FROM calculation_history 
                     WHERE user_id = ?
                     ORDER BY calculation_date DESC 
                     LIMIT ?
                 ''', (user_id, limit))
-                history = cursor.fetchall()
-                return history
+                return [CalculationRecord(*row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"❌ Ошибка получения истории вычислений {user_id}: {e}")
             return []
@@ -541,6 +1028,19 @@ class Database:
                 
                 history_deleted = cursor.rowcount
                 
+                # Дневная статистика живет дольше истории, но не бесконечно
+                cursor.execute('''
+                    DELETE FROM user_calc_daily 
+                    WHERE day < date('now', '-365 days')
+                ''')
+                
+                cursor.execute('DELETE FROM fsm_states WHERE expires_at < ?', (time.time(),))
+                
+                cursor.execute('''
+                    DELETE FROM activity_sketches 
+                    WHERE day < date('now', '-365 days')
+                ''')
+                
                 conn.commit()
                 
                 if sessions_deleted > 0 or history_deleted > 0:
@@ -554,5 +1054,140 @@ class Database:
         except Exception as e:
             logger.error(f"❌ Ошибка очистки старых данных: {e}")
 
+    def load_fsm_states(self, now):
+        """Неистекшие состояния FSM: [(storage_key, state, data, expires_at)]"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT storage_key, state, data, expires_at FROM fsm_states
+                    WHERE expires_at > ?
+                ''', (now,))
+                return [(key, state, json.loads(data) if data else None, expires_at)
+                        for key, state, data, expires_at in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки состояний FSM: {e}")
+            return []
+    
+    def save_fsm_states(self, upserts, deletes):
+        """Записывает накопленные изменения состояний FSM одной транзакцией
+        
+        Каждая запись сериализуется отдельно: запись с данными, которые нельзя
+        сохранить в JSON, пропускается и не мешает остальным.
+        Возвращает True, если транзакция записана.
+        """
+        rows = []
+        for key, state, data, expires_at in upserts:
+            try:
+                rows.append((key, state, json.dumps(data, ensure_ascii=False) if data else None, expires_at))
+            except (TypeError, ValueError) as e:
+                logger.error(f"❌ Состояние FSM {key} не сохранено: {e}")
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                if rows:
+                    cursor.executemany('''
+                        INSERT INTO fsm_states (storage_key, state, data, expires_at)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(storage_key) DO UPDATE SET
+                            state = excluded.state,
+                            data = excluded.data,
+                            expires_at = excluded.expires_at
+                    ''', rows)
+                if deletes:
+                    cursor.executemany('DELETE FROM fsm_states WHERE storage_key = ?',
+                                       [(key,) for key in deletes])
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения состояний FSM: {e}")
+            return False
+    
+    def _iter_chunks(self, query, params=(), chunk_size=100000):
+        """Читает результат запроса пачками по chunk_size строк
+        
+        Отдельное соединение без общей блокировки: в режиме WAL долгое чтение
+        не мешает записи, а пачки ограничивают память при любом размере таблицы.
+        Если включена свежая реплика, читается она.
+        """
+        path = self._replica_source()
+        if path is None:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False, timeout=30.0)
+        else:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+    
+    def iter_calculation_times(self, chunk_size=100000):
+        """Час недели каждого вычисления из истории (день недели * 24 + час, 0 - воскресенье), пачками"""
+        return self._iter_chunks('''
+            SELECT CAST(strftime('%w', calculation_date) AS INTEGER) * 24
+                   + CAST(strftime('%H', calculation_date) AS INTEGER)
+            FROM calculation_history
+            WHERE calculation_date IS NOT NULL
+        ''', chunk_size=chunk_size)
+    
+    def iter_user_calculation_counts(self, chunk_size=100000):
+        """Число вычислений каждого пользователя, пачками"""
+        return self._iter_chunks('SELECT COALESCE(calculations_count, 0) FROM users', chunk_size=chunk_size)
+    
+    def iter_export_rows(self, table, chunk_size=10000):
+        """Все строки таблицы из EXPORT_TABLES в порядке вставки, пачками"""
+        columns = EXPORT_TABLES[table]
+        return self._iter_chunks(f"SELECT {', '.join(columns)} FROM {table} ORDER BY rowid",
+                                 chunk_size=chunk_size)
+    
+    def get_daily_calculation_totals(self, days=14):
+        """Вычисления и ошибки по дням за последние days дней: [(day, calculations, errors)]"""
+        try:
+            with self._get_read_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT day, SUM(calculations), SUM(errors) FROM user_calc_daily
+                    WHERE day > date('now', ?)
+                    GROUP BY day ORDER BY day
+                ''', (f'-{days} days',))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения статистики по дням: {e}")
+            return []
+    
+    def load_activity_sketches(self, since_day):
+        """Скетчи активности начиная с дня since_day: [(day, metric, sketch)]"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT day, metric, sketch FROM activity_sketches
+                    WHERE day >= ?
+                ''', (since_day,))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки скетчей активности: {e}")
+            return []
+    
+    def save_activity_sketches(self, rows):
+        """Записывает скетчи активности [(day, metric, sketch)] одной транзакцией; возвращает успех"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO activity_sketches (day, metric, sketch)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(day, metric) DO UPDATE SET sketch = excluded.sketch
+                ''', [(day, metric, sqlite3.Binary(sketch)) for day, metric, sketch in rows])
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения скетчей активности: {e}")
+            return False
+
 # Создаем глобальный экземпляр БД
 db = Database()
\ No newline at end of file
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Вычисление выражений калькулятора
+
+Выражение разбирается через ast и вычисляется только по белому списку
+узлов (числа, + - * /, степень, sqrt, процент, унарный минус, скобки),
+поэтому произвольный текст из инлайн-запросов нельзя использовать для
+выполнения кода. Степень и корень проходят через модель стоимости:
+показатель и число цифр результата ограничены до вычисления, поэтому
+подобранное выражение не может надолго занять цикл событий.
+
+Числовой режим задается в config.py: "float" или "decimal". В режиме
+decimal дробные числа и деление считаются в decimal.Decimal с точностью
+DECIMAL_PRECISION, а целые без деления остаются int и не теряют точность.
+До DISPLAY_DIGITS цифр результат округляется только при показе: в сессии
+калькулятора хранится полное значение (format_input), и цепочка 1/3=, *3=
+считается от него, а не от округленной строки.
+"""
+
+import ast
+import decimal
+import math
+import operator
+import re
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from config import NUMERIC_BACKEND, DECIMAL_PRECISION, DISPLAY_DIGITS
+
+MAX_EXPRESSION_LENGTH = 100
+# Точность ограничена, чтобы вычисление укладывалось в бюджет времени (см. bench_calculator.py)
+MAX_DECIMAL_PRECISION = 1000
+# Целые длиннее этого показываются в научной записи
+MAX_INTEGER_DISPLAY_DIGITS = 30
+# Модель стоимости: модуль показателя степени и размер целого результата
+MAX_EXPONENT = 10000
+MAX_RESULT_BITS = 4000
+
+DECIMAL_CONTEXT = decimal.Context(
+    prec=max(1, min(DECIMAL_PRECISION, MAX_DECIMAL_PRECISION)),
+    rounding=decimal.ROUND_HALF_EVEN,
+    Emax=10 ** 6,
+    Emin=-10 ** 6,
+    traps=[decimal.DivisionByZero, decimal.InvalidOperation, decimal.Overflow],
+)
+DISPLAY_CONTEXT = decimal.Context(prec=DISPLAY_DIGITS, rounding=decimal.ROUND_HALF_UP, Emax=10 ** 6, Emin=-10 ** 6)
+
+
+class CalculationError(ValueError):
+    """Выражение не удалось разобрать или вычислить"""
+
+
+def _decimal_div(left, right):
+    return Decimal(left) / Decimal(right)
+
+
+def _estimate_bits(base, exponent):
+    """Верхняя оценка размера base ** exponent в битах без вычисления"""
+    return int(abs(base)).bit_length() * exponent
+
+
+def _power(base, exponent):
+    if abs(exponent) > MAX_EXPONENT:
+        raise CalculationError("Слишком большой показатель степени")
+    if type(base) is int and type(exponent) is int and exponent >= 0:
+        if _estimate_bits(base, exponent) > MAX_RESULT_BITS:
+            raise CalculationError("Слишком большой результат степени")
+        return base ** exponent
+    if exponent < 0 and base == 0:
+        raise ZeroDivisionError("0 в отрицательной степени")
+    if NUMERIC_BACKEND == 'decimal':
+        # Decimal считает с точностью контекста, порядок ограничен ловушкой Overflow
+        return Decimal(base) ** Decimal(exponent)
+    result = float(base) ** exponent
+    if isinstance(result, complex):
+        raise CalculationError("Дробная степень отрицательного числа")
+    return result
+
+
+def _sqrt(value):
+    if value < 0:
+        raise CalculationError("Корень из отрицательного числа")
+    if NUMERIC_BACKEND == 'decimal':
+        return Decimal(value).sqrt()
+    return math.sqrt(value)
+
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: _power,
+}
+
+# В режиме decimal деление всегда дает Decimal, остальные операции над int остаются целыми
+DECIMAL_BINARY_OPERATORS = dict(BINARY_OPERATORS)
+DECIMAL_BINARY_OPERATORS[ast.Div] = _decimal_div
+
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+# Разрешенные функции одного аргумента
+FUNCTIONS = {
+    'sqrt': _sqrt,
+}
+
+# Число во вводе калькулятора: 12, 0.333, 1.5E+40
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?(?:[eE][+-]?\d+)?')
+
+# Постфиксный процент: 50% -> 50/100
+PERCENT_PATTERN = re.compile(r'(?<=[\d.)])%(?![\d.(])')
+
+# Символы, которые пользователи вводят вместо стандартных операторов
+REPLACEMENTS = str.maketrans({',': '.', '×': '*', 'x': '*', 'х': '*', '÷': '/', ':': '/', '−': '-',
+                               '^': '**', '√': 'sqrt'})
+
+
+def normalize_expression(text):
+    """Каноническая форма выражения: без пробелов, с точкой и стандартными операторами"""
+    return ''.join(text.split()).translate(REPLACEMENTS)
+
+
+def _eval_node(node, operators, source=None):
+    """source задан в режиме decimal: дробные литералы читаются из исходного текста"""
+    if isinstance(node, ast.Expression):
+        return _eval_node(node.body, operators, source)
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        if source is not None and type(node.value) is float:
+            # Текст литерала, а не float: 0.1 и 1,5E+40 из прошлого результата читаются без потерь
+            return Decimal(ast.get_source_segment(source, node))
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in operators:
+        result = operators[type(node.op)](_eval_node(node.left, operators, source),
+                                          _eval_node(node.right, operators, source))
+        # Цепочка умножений больших степеней тоже упирается в лимит цифр
+        if type(result) is int and result.bit_length() > MAX_RESULT_BITS:
+            raise CalculationError("Слишком большой результат")
+        return result
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS
+            and len(node.args) == 1 and not node.keywords):
+        return FUNCTIONS[node.func.id](_eval_node(node.args[0], operators, source))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        return UNARY_OPERATORS[type(node.op)](_eval_node(node.operand, operators, source))
+    raise CalculationError(f"Недопустимый элемент выражения: {type(node).__name__}")
+
+
+def evaluate(expression):
+    """Вычисляет нормализованное выражение; ZeroDivisionError пробрасывается как есть"""
+    if not expression or len(expression) > MAX_EXPRESSION_LENGTH:
+        raise CalculationError("Пустое или слишком длинное выражение")
+    source = PERCENT_PATTERN.sub('/100', expression)
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError as e:
+        raise CalculationError("Синтаксическая ошибка") from e
+
+    if NUMERIC_BACKEND != 'decimal':
+        return _eval_node(tree, BINARY_OPERATORS)
+
+    with decimal.localcontext(DECIMAL_CONTEXT):
+        try:
+            return _eval_node(tree, DECIMAL_BINARY_OPERATORS, source)
+        except ZeroDivisionError:
+            raise
+        except decimal.DecimalException as e:
+            raise CalculationError("Ошибка десятичной арифметики") from e
+
+
+def _group_digits(text):
+    """1234567.5 -> 1 234 567,5"""
+    return text.replace(',', ' ').replace('.', ',')
+
+
+def format_result(result):
+    """Результат для показа в Telegram: округление, группы разрядов, запятая"""
+    if isinstance(result, int):
+        if -10 ** MAX_INTEGER_DISPLAY_DIGITS < result < 10 ** MAX_INTEGER_DISPLAY_DIGITS:
+            # Быстрый путь: группировка целых средствами format без Decimal
+            return _group_digits(f"{result:,}")
+        result = Decimal(result)
+    elif isinstance(result, float):
+        if result != result or result in (float('inf'), float('-inf')):
+            return str(result)
+        result = Decimal(repr(result))
+
+    if not result.is_finite():
+        return str(result)
+
+    rounded = DISPLAY_CONTEXT.plus(result)
+    if rounded.is_zero():
+        return '0'
+    rounded = rounded.normalize(DISPLAY_CONTEXT)
+    exponent = rounded.adjusted()
+    if -7 < exponent < MAX_INTEGER_DISPLAY_DIGITS:
+        return _group_digits(format(rounded, ',f'))
+    return format(rounded, 'E').replace('.', ',')
+
+
+def format_input(result):
+    """Полное значение результата для продолжения вычислений: без округления до DISPLAY_DIGITS и групп"""
+    if isinstance(result, float):
+        if not math.isfinite(result):
+            return format_result(result)
+        # 1.0 -> 1: целые без хвоста, точные для float до 2^53
+        return str(int(result)) if result.is_integer() and abs(result) < 2 ** 53 else repr(result)
+    if isinstance(result, int):
+        if -10 ** MAX_INTEGER_DISPLAY_DIGITS < result < 10 ** MAX_INTEGER_DISPLAY_DIGITS:
+            return str(result)
+        result = Decimal(result)
+    if not result.is_finite():
+        return format_result(result)
+    # Точность вычислений, без хвостовых нулей; очень длинные числа - в научной записи
+    result = DECIMAL_CONTEXT.plus(result)
+    if result == result.to_integral_value() and result.adjusted() < MAX_INTEGER_DISPLAY_DIGITS:
+        return str(int(result))
+    return str(result.normalize(DECIMAL_CONTEXT))
+
+
+def _display_number(match):
+    token = match.group()
+    if len(token) <= DISPLAY_DIGITS + 1 and 'e' not in token.lower():
+        return token
+    return format_result(int(token) if token.isdigit() else Decimal(token))
+
+
+def display_expression(text):
+    """Ввод калькулятора для показа: длинные числа округлены и сгруппированы, как результат"""
+    return NUMBER_PATTERN.sub(_display_number, text)
+
+
+def memory_add(memory, expression, sign=1):
+    """M+ / M-: прибавляет к памяти значение выражения, возвращает полное значение памяти"""
+    current = evaluate(normalize_expression(memory)) if memory else 0
+    value = evaluate(normalize_expression(expression))
+    if NUMERIC_BACKEND != 'decimal':
+        return format_input(current + sign * value)
+    with decimal.localcontext(DECIMAL_CONTEXT):
+        try:
+            return format_input(current + sign * value)
+        except decimal.DecimalException as e:
+            raise CalculationError("Ошибка десятичной арифметики") from e
+
+
+class ResultCache:
+    """Общий кэш результатов: нормализованное выражение -> результат или ошибка
+
+    Ограничен числом записей и суммарным размером. При переполнении из самых
+    давно использованных записей вытесняется та, что дешевле всего вычислить
+    заново на байт занимаемой памяти. Ошибки (деление на 0, некорректное
+    выражение) кэшируются так же, как успешные результаты.
+    """
+
+    ENTRY_OVERHEAD = 64
+
+    def __init__(self, maxsize=5000, max_bytes=1024 * 1024, eviction_sample=8):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.eviction_sample = eviction_sample
+        # expression -> (result, error, cost, size)
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.error_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, expression):
+        """(result, error) из кэша или None"""
+        with self._lock:
+            entry = self._data.get(expression)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(expression)
+            self.hits += 1
+            if entry[1] is not None:
+                self.error_hits += 1
+            return entry[0], entry[1]
+
+    def peek(self, expression):
+        """Проверка наличия без учета в статистике и порядке вытеснения"""
+        with self._lock:
+            return expression in self._data
+
+    def put(self, expression, result, error=None, cost=0.0):
+        """result - (текст для показа, полное значение) или None для ошибок"""
+        size = len(expression) + (len(result[0]) + len(result[1]) if result else 0) + self.ENTRY_OVERHEAD
+        with self._lock:
+            old = self._data.pop(expression, None)
+            if old is not None:
+                self._bytes -= old[3]
+            self._data[expression] = (result, error, cost, size)
+            self._bytes += size
+            while len(self._data) > self.maxsize or self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Кандидаты - самые давно использованные записи, из них выбрасываем самую дешевую на байт
+        candidates = []
+        for key in self._data:
+            candidates.append(key)
+            if len(candidates) >= self.eviction_sample:
+                break
+        victim = min(candidates, key=lambda key: self._data[key][2] / self._data[key][3])
+        self._bytes -= self._data.pop(victim)[3]
+        self.evictions += 1
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'error_hits': self.error_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Виды ошибок, которые кэшируются вместе с результатами
+ERROR_ZERO_DIVISION = 'zero_division'
+ERROR_INVALID = 'invalid'
+
+
+def calculate_value(text):
+    """Нормализует, вычисляет и форматирует выражение с использованием кэша
+    
+    Возвращает (expression, result, value): result - текст для показа,
+    value - полное значение для сессии калькулятора. ZeroDivisionError и
+    CalculationError выбрасываются и для закэшированных ошибок.
+    """
+    expression = normalize_expression(text)
+    cached = result_cache.get(expression)
+    if cached is None:
+        started = time.perf_counter()
+        try:
+            value = evaluate(expression)
+            result, error = (format_result(value), format_input(value)), None
+        except ZeroDivisionError:
+            result, error = None, ERROR_ZERO_DIVISION
+        except (CalculationError, OverflowError, RecursionError):
+            result, error = None, ERROR_INVALID
+        result_cache.put(expression, result, error, time.perf_counter() - started)
+    else:
+        result, error = cached
+
+    if error == ERROR_ZERO_DIVISION:
+        raise ZeroDivisionError(expression)
+    if error == ERROR_INVALID:
+        raise CalculationError(expression)
+    return expression, result[0], result[1]
+
+
+def calculate(text):
+    """(expression, result) - как calculate_value, но только текст для показа"""
+    expression, result, _ = calculate_value(text)
+    return expression, result
+
+
+# Глобальный кэш результатов
+result_cache = ResultCache()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Протокол callback_data и таблица маршрутизации callback-запросов
+
+Формат callback_data: однобуквенный префикс группы + короткий код действия
+(например, "k7" - клавиша 7, "pn" - переключить уведомления). Все
+callback-запросы проходят через один обработчик aiogram, который находит
+нужную функцию одним поиском в словаре вместо перебора цепочки фильтров.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Префиксы групп
+CALC = "k"
+PROFILE = "p"
+ADMIN = "a"
+SUBSCRIPTION = "s"
+
+# Клавиши калькулятора: клавиша -> callback_data
+CALC_KEY_CODES = {key: CALC + key for key in "0123456789.+-*/="}
+CALC_KEY_CODES["C"] = CALC + "C"
+CALC_KEY_CODES["<="] = CALC + "B"
+
+# Научная раскладка: клавиша -> callback_data
+SCIENTIFIC_KEY_CODES = {key: CALC + key for key in "()%^"}
+SCIENTIFIC_KEY_CODES["√"] = CALC + "r"
+SCIENTIFIC_KEY_CODES["M+"] = CALC + "mp"
+SCIENTIFIC_KEY_CODES["M-"] = CALC + "mm"
+SCIENTIFIC_KEY_CODES["MR"] = CALC + "mr"
+SCIENTIFIC_KEY_CODES["MC"] = CALC + "mc"
+
+# Переключение обычной и научной раскладки
+CALC_MODE = CALC + "s"
+
+# Профиль
+PROFILE_TOGGLE_NOTIFICATIONS = PROFILE + "n"
+PROFILE_CALCULATION_STATS = PROFILE + "s"
+PROFILE_WHATS_NEW = PROFILE + "w"
+PROFILE_REFRESH = PROFILE + "r"
+
+# Админ панель
+ADMIN_STATS = ADMIN + "s"
+ADMIN_BROADCAST = ADMIN + "b"
+ADMIN_BROADCAST_CONFIRM = ADMIN + "y"
+ADMIN_BROADCAST_CANCEL = ADMIN + "n"
+ADMIN_USERS = ADMIN + "u"
+ADMIN_BROADCAST_HISTORY = ADMIN + "h"
+ADMIN_EXPORT = ADMIN + "e"
+
+# Подписка
+SUBSCRIPTION_CHECK = SUBSCRIPTION + "c"
+
+# Старые значения callback_data: кнопки под уже отправленными сообщениями продолжают работать
+LEGACY_CALLBACKS = {
+    "toggle_notifications": PROFILE_TOGGLE_NOTIFICATIONS,
+    "calculation_stats": PROFILE_CALCULATION_STATS,
+    "whats_new": PROFILE_WHATS_NEW,
+    "refresh_profile": PROFILE_REFRESH,
+    "admin_stats": ADMIN_STATS,
+    "admin_broadcast": ADMIN_BROADCAST,
+    "admin_users": ADMIN_USERS,
+    "admin_broadcast_history": ADMIN_BROADCAST_HISTORY,
+    "check_subscription": SUBSCRIPTION_CHECK,
+}
+LEGACY_CALLBACKS.update(CALC_KEY_CODES)
+
+
+class CallbackTable:
+    """Таблица callback_data -> обработчик(query, state)"""
+
+    def __init__(self):
+        self._routes = {}
+
+    def register(self, code, handler):
+        if code in self._routes:
+            raise ValueError(f"callback_data {code!r} уже зарегистрирован")
+        self._routes[code] = handler
+        return handler
+
+    def route(self, code):
+        """Декоратор регистрации обработчика"""
+        def decorator(handler):
+            return self.register(code, handler)
+        return decorator
+
+    def resolve(self, data):
+        if data is None:
+            return None
+        handler = self._routes.get(data)
+        if handler is None:
+            code = LEGACY_CALLBACKS.get(data)
+            if code is not None:
+                handler = self._routes.get(code)
+        return handler
+
+    async def dispatch(self, query, state):
+        """Вызывает обработчик; False, если callback_data неизвестен"""
+        handler = self.resolve(query.data)
+        if handler is None:
+            logger.warning(f"⚠️ Неизвестный callback_data: {query.data!r}")
+            return False
+        await handler(query, state)
+        return True
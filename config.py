@@ -3,3 +3,27 @@ ADMIN_ID = 1234567890 # Айди профиль телеграм
 CHANNEL_USERNAME = "@NAME CHANNEL TELEGRAM"
 BOT_VERSION = "2.3.1"
 DEBUG_MODE = True
+NUMERIC_BACKEND = "float" # "float" - прежняя арифметика, "decimal" - точная десятичная
+DECIMAL_PRECISION = 28 # Значащих цифр в вычислениях (не больше 1000)
+DISPLAY_DIGITS = 12 # Значащих цифр при показе результата
+LOG_FILE = "bot_debug.log"
+LOG_ROTATION = "size" # "size" - по размеру, "time" - каждую полночь
+LOG_MAX_BYTES = 10 * 1024 * 1024 # Размер файла лога до ротации
+LOG_BACKUP_COUNT = 5 # Сколько старых файлов лога хранить
+LOG_JSON = False # True - JSON-строки вместо текста
+LOG_SAMPLING = {"bot.subscription": 100, "aiogram.event": 100} # Логгер -> пишется каждая N-я INFO запись
+HTTP_POOL_SIZE = 100 # Максимум одновременных соединений с Bot API
+HTTP_KEEPALIVE_TIMEOUT = 60 # Сколько секунд держать простаивающее соединение открытым
+HTTP_DNS_CACHE_TTL = 300 # Время жизни кэша DNS, сек
+FSM_TTL = 3600 # Через сколько секунд без активности сбрасывается состояние диалога
+FSM_MAX_RECORDS = 10000 # Максимум состояний FSM в памяти
+FSM_PERSIST = True # Сохранять состояния FSM в БД между перезапусками
+FLOOD_RATE = 2.0 # Сколько сообщений и нажатий в секунду разрешено одному пользователю
+FLOOD_BURST = 10 # Сколько апдейтов подряд пользователь может прислать без ожидания
+BACKUP_DIR = "backups" # Каталог снимков БД
+BACKUP_KEEP = 7 # Сколько последних снимков хранить
+BACKUP_INTERVAL = 24 * 60 * 60 # Как часто делать снимок, сек (0 - только по команде /backup)
+ANALYTICS_REPLICA = True # Отчеты админа читают снимок БД, а не основную базу
+REPLICA_REFRESH_INTERVAL = 60 # Снимок старше этого обновляется перед следующим отчетом админа, сек
+REPLICA_MAX_AGE = 300 # Снимок старше этого не используется, отчеты идут в основную БД, сек
+SESSION_STORAGE = "sqlite" # Где хранить сессии калькулятора: "sqlite" - в основной БД, "dbm" - в calculator_bot.dbm
@@ -2,8 +2,14 @@
 import sys
 import subprocess
 import importlib.util
+import hashlib
 import os
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUIRED_PACKAGES = ["aiogram==3.2.0", "aiofiles==23.2.1"]
+# Отметка об успешной проверке зависимостей для текущего интерпретатора
+DEPS_STAMP_FILE = os.path.join(BASE_DIR, ".deps_stamp")
+
 def check_python_version():
     version = sys.version_info
     if version.major < 3 or (version.major == 3 and version.minor < 8):
@@ -26,18 +32,40 @@ def install_package(package):
         print(f"❌ Ошибка установки {package}: {e}")
         return False
 
+def get_deps_stamp():
+    """Отпечаток окружения: интерпретатор и список требуемых пакетов"""
+    source = "|".join([sys.executable, sys.version] + REQUIRED_PACKAGES)
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+def is_stamp_valid():
+    try:
+        with open(DEPS_STAMP_FILE, encoding="utf-8") as f:
+            return f.read().strip() == get_deps_stamp()
+    except OSError:
+        return False
+
+def write_stamp():
+    try:
+        with open(DEPS_STAMP_FILE, "w", encoding="utf-8") as f:
+            f.write(get_deps_stamp())
+    except OSError as e:
+        print(f"⚠️ Не удалось сохранить отметку зависимостей: {e}")
+
 def main():
     print("🔍 Проверяю систему...")
     
     if not check_python_version():
         return False
     
+    if is_stamp_valid():
+        print("✅ Зависимости уже проверены для этого окружения")
+        return True
+    
     print("\n🔍 Проверяю зависимости...")
     
-    required_packages = ["aiogram==3.2.0", "aiofiles==23.2.1"]
     all_installed = True
     
-    for package in required_packages:
+    for package in REQUIRED_PACKAGES:
         package_name = package.split('==')[0]
         if not is_module_available(package_name):
             if not install_package(package):
@@ -47,6 +75,7 @@ def main():
     
     if all_installed:
         print("\n🎉 Все зависимости установлены!")
+        write_stamp()
         return True
     else:
         print("\n❌ Ошибка установки зависимостей!")
@@ -57,8 +86,11 @@ if __name__ == "__main__":
     if main():
         print("🚀 Запускаю бота...")
         try:
-            # Прямой запуск main.py чтобы избежать циклических импортов
-            os.system(f'"{sys.executable}" main.py')
+            # Запускаем бота в этом же процессе, без повторного старта интерпретатора
+            sys.path.insert(0, BASE_DIR)
+            os.chdir(BASE_DIR)
+            import main as bot_main
+            bot_main.run()
         except Exception as e:
             print(f"❌ Ошибка запуска: {e}")
             input("Нажмите Enter для выхода...")
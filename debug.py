@@ -4,32 +4,98 @@
 """
 
 import logging
+import os
 import traceback
 import sys
 import sqlite3
+import time
+from collections import OrderedDict
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+class ErrorGroup:
+    """Все повторения одной ошибки: тип исключения + место вызова"""
+    
+    __slots__ = ('error_type', 'function', 'location', 'message', 'count', 'first_seen', 'last_seen', 'traceback')
+    
+    def __init__(self, error_type, function, location, message, traceback_text):
+        now = datetime.now()
+        self.error_type = error_type
+        self.function = function
+        self.location = location
+        self.message = message
+        self.count = 1
+        self.first_seen = now
+        self.last_seen = now
+        self.traceback = traceback_text
+
 class DebugSystem:
-    def __init__(self):
-        self.errors = []
+    def __init__(self, max_error_groups=500, alert_interval=60):
+        # Отпечаток -> ErrorGroup, порядок - по последнему появлению
+        self.error_groups = OrderedDict()
+        self.max_error_groups = max_error_groups
+        self.total_errors = 0
         self.warnings = []
         self.performance_data = {}
+        self.metrics_providers = {}
         self.start_time = datetime.now()
+        # Уведомление админа о новых ошибках: не чаще одного раза в alert_interval секунд
+        self.alert_handler = None
+        self.alert_interval = alert_interval
+        self._last_alert = 0.0
+        self._suppressed_alerts = 0
     
-    def log_error(self, error_msg, function_name, line_number):
-        """Логирует ошибку с деталями"""
-        error_data = {
-            'timestamp': datetime.now(),
-            'message': error_msg,
-            'function': function_name,
-            'line': line_number,
-            'traceback': traceback.format_exc()
-        }
-        self.errors.append(error_data)
-        logger.error(f"Ошибка в {function_name}:{line_number} - {error_msg}")
+    def set_alert_handler(self, handler):
+        """handler(text) вызывается при появлении ошибки с новым отпечатком"""
+        self.alert_handler = handler
     
+    def log_error(self, error_msg, function_name, line_number=0):
+        """Логирует ошибку, объединяя повторения по типу исключения и месту вызова"""
+        # Место вызова берем из кадра: вызывающие передают line_number=0
+        frame = sys._getframe(1)
+        location = f"{os.path.basename(frame.f_code.co_filename)}:{line_number or frame.f_lineno}"
+        exc_type = sys.exc_info()[0]
+        error_type = exc_type.__name__ if exc_type else "Error"
+        fingerprint = f"{error_type}@{location}"
+        
+        self.total_errors += 1
+        group = self.error_groups.get(fingerprint)
+        if group is not None:
+            group.count += 1
+            group.last_seen = datetime.now()
+            group.message = error_msg
+            self.error_groups.move_to_end(fingerprint)
+            logger.error(f"Ошибка в {function_name} ({location}, x{group.count}) - {error_msg}")
+            return
+        
+        # Traceback форматируем только для первого появления
+        group = ErrorGroup(error_type, function_name, location, error_msg,
+                           traceback.format_exc() if exc_type else '')
+        self.error_groups[fingerprint] = group
+        if len(self.error_groups) > self.max_error_groups:
+            self.error_groups.popitem(last=False)
+        logger.error(f"Ошибка в {function_name} ({location}) - {error_msg}")
+        self._alert_new_error(group)
+    
+    def _alert_new_error(self, group):
+        if self.alert_handler is None:
+            return
+        now = time.monotonic()
+        if now - self._last_alert < self.alert_interval:
+            self._suppressed_alerts += 1
+            return
+        self._last_alert = now
+        text = (f"🚨 Новая ошибка: {group.error_type} в {group.function} ({group.location})\n"
+                f"💬 {group.message}")
+        if self._suppressed_alerts:
+            text += f"\n\n➕ Еще новых ошибок с прошлого уведомления: {self._suppressed_alerts}"
+            self._suppressed_alerts = 0
+        try:
+            self.alert_handler(text)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось отправить уведомление об ошибке: {e}")
+
     def log_warning(self, warning_msg, function_name):
         """Логирует предупреждение"""
         warning_data = {
@@ -46,20 +112,47 @@ class DebugSystem:
             self.performance_data[operation_name] = []
         self.performance_data[operation_name].append(execution_time)
     
+    def register_metrics(self, name, provider):
+        """Регистрирует функцию, возвращающую словарь метрик подсистемы"""
+        self.metrics_providers[name] = provider
+    
+    def get_metrics_report(self):
+        """Генерирует отчет по зарегистрированным метрикам"""
+        if not self.metrics_providers:
+            return ""
+        
+        report = "📐 **Метрики:**\n\n"
+        for name, provider in self.metrics_providers.items():
+            try:
+                metrics = provider()
+            except Exception as e:
+                report += f"**{name}:** ошибка - {e}\n\n"
+                continue
+            report += f"**{name}:**\n"
+            for key, value in metrics.items():
+                if isinstance(value, float):
+                    value = f"{value * 100:.1f}%" if key.endswith('rate') else f"{value:.3f}"
+                report += f"   • {key}: {value}\n"
+            report += "\n"
+        
+        return report
+    
     def get_error_report(self):
-        """Генерирует отчет об ошибках"""
-        if not self.errors:
+        """Генерирует отчет об ошибках: по одной строке на отпечаток, последние сверху"""
+        if not self.error_groups:
             return "✅ Ошибок не обнаружено"
         
         report = "🚨 **Отчет об ошибках:**\n\n"
-        for i, error in enumerate(self.errors[-10:], 1):
-            report += f"{i}. **{error['function']}** (строка {error['line']})\n"
-            report += f"   🕒 {error['timestamp'].strftime('%H:%M:%S')}\n"
-            report += f"   💬 {error['message']}\n"
-            if error['traceback'] and "NoneType" in error['traceback']:
+        groups = list(self.error_groups.values())[-10:]
+        for i, group in enumerate(reversed(groups), 1):
+            report += f"{i}. **{group.function}** ({group.location}) - {group.error_type} x{group.count}\n"
+            report += (f"   🕒 {group.first_seen.strftime('%d.%m %H:%M:%S')} - "
+                       f"{group.last_seen.strftime('%d.%m %H:%M:%S')}\n")
+            report += f"   💬 {group.message}\n"
+            if group.traceback and "NoneType" in group.traceback:
                 report += f"   🔧 **Исправление:** Проверьте наличие None значений\n"
             report += "\n"
-        
+
         return report
     
     def get_performance_report(self):
@@ -111,10 +204,14 @@ class DebugSystem:
         
         # Статистика ошибок
         status_report += f"\n📈 **Статистика:**\n"
-        status_report += f"• Ошибок: {len(self.errors)}\n"
+        status_report += f"• Ошибок: {self.total_errors} (уникальных: {len(self.error_groups)})\n"
         status_report += f"• Предупреждений: {len(self.warnings)}\n"
         status_report += f"• Время работы: {(datetime.now() - self.start_time).total_seconds() / 60:.1f} мин\n"
         
+        metrics_report = self.get_metrics_report()
+        if metrics_report:
+            status_report += "\n" + metrics_report
+        
         return status_report
 
 # Глобальный экземпляр системы отладки
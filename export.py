@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Выгрузка таблиц для админа
+
+Строки читаются курсором пачками (Database.iter_export_rows) и сразу
+пишутся в сжатый gzip файл CSV или JSONL во временном каталоге, поэтому
+память не зависит от размера таблицы. Запись идет в отдельном потоке,
+цикл событий продолжает обрабатывать апдейты. Готовый файл отправляется
+документом и удаляется.
+"""
+
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+
+from bot_database import EXPORT_TABLES
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+# Короткие имена для команды /export
+TABLE_ALIASES = {
+    'users': 'users',
+    'history': 'calculation_history',
+    'calculation_history': 'calculation_history',
+    'broadcasts': 'broadcasts',
+}
+
+
+def write_export(database, table, fmt, chunk_size=10000):
+    """Пишет таблицу в временный .gz файл; возвращает (путь, число строк)"""
+    columns = EXPORT_TABLES[table]
+    handle, path = tempfile.mkstemp(prefix=f'export_{table}_', suffix=f'.{fmt}.gz')
+    os.close(handle)
+    rows_written = 0
+    try:
+        # Уровень 6 вместо 9: файл почти того же размера, запись в несколько раз быстрее
+        with gzip.open(path, 'wt', compresslevel=6, encoding='utf-8', newline='') as f:
+            if fmt == 'csv':
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                for rows in database.iter_export_rows(table, chunk_size):
+                    writer.writerows(rows)
+                    rows_written += len(rows)
+            else:
+                for rows in database.iter_export_rows(table, chunk_size):
+                    f.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n'
+                                 for row in rows)
+                    rows_written += len(rows)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, rows_written
+
+
+async def export_table(database, table, fmt):
+    """write_export в отдельном потоке"""
+    return await asyncio.get_running_loop().run_in_executor(None, write_export, database, table, fmt)
+
+
+def export_filename(table, fmt):
+    return f"{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}.gz"
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Ограниченное хранилище FSM
+
+Замена MemoryStorage из aiogram, который заводит запись на каждого
+пользователя при первом же get_state и не удаляет ее никогда:
+- запись создается только при установке состояния или данных и удаляется,
+  когда состояние сброшено и данных нет;
+- записи без обращений дольше ttl удаляются, общее число ограничено;
+- запись - объект со __slots__, ключ - кортеж, имена состояний интернированы;
+- при желании состояния сохраняются в SQLite: изменения копятся в памяти
+  и записываются одной транзакцией раз в flush_interval секунд.
+"""
+
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+logger = logging.getLogger(__name__)
+
+
+class FSMRecord:
+    __slots__ = ('state', 'data', 'expires_at')
+
+    def __init__(self, state=None, data=None, expires_at=0.0):
+        self.state = state
+        self.data = data
+        self.expires_at = expires_at
+
+    def is_empty(self):
+        return self.state is None and not self.data
+
+
+def _compact_key(key):
+    return (key.bot_id, key.chat_id, key.user_id, key.thread_id, key.destiny)
+
+
+def _key_to_text(compact):
+    return ':'.join('' if part is None else str(part) for part in compact)
+
+
+def _key_from_text(text):
+    bot_id, chat_id, user_id, thread_id, destiny = text.split(':', 4)
+    return (int(bot_id), int(chat_id), int(user_id), int(thread_id) if thread_id else None, destiny)
+
+
+class BoundedMemoryStorage(BaseStorage):
+    def __init__(self, ttl=3600, max_records=10000, persistence=None, flush_interval=5.0):
+        self.ttl = ttl
+        self.max_records = max_records
+        self.persistence = persistence
+        self.flush_interval = flush_interval
+        # Ключ -> FSMRecord, порядок - по последнему обращению (в начале самые старые)
+        self._records = OrderedDict()
+        # Ключи, измененные после последней записи в БД
+        self._dirty = set()
+        self._flush_task = None
+        self.expired = 0
+        self.evicted = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        if persistence is not None:
+            self._load()
+
+    def _load(self):
+        now = time.time()
+        for key_text, state, data, expires_at in self.persistence.load_fsm_states(now):
+            expires_at = time.monotonic() + (expires_at - now)
+            self._records[_key_from_text(key_text)] = FSMRecord(
+                sys.intern(state) if state else None, data or None, expires_at)
+        if self._records:
+            logger.info(f"✅ Восстановлено состояний FSM: {len(self._records)}")
+
+    def _mark_dirty(self, compact):
+        if self.persistence is not None:
+            self._dirty.add(compact)
+    
+    def _get(self, compact, now):
+        record = self._records.get(compact)
+        if record is None:
+            return None
+        if record.expires_at <= now:
+            del self._records[compact]
+            self._mark_dirty(compact)
+            self.expired += 1
+            return None
+        return record
+
+    def _touch(self, compact, record, now):
+        record.expires_at = now + self.ttl
+        self._records.move_to_end(compact)
+        if record.is_empty():
+            # Пустые записи не храним: память растет только с числом активных диалогов
+            del self._records[compact]
+        self._mark_dirty(compact)
+        self._evict(now)
+        self._schedule_flush()
+
+    def _evict(self, now):
+        records = self._records
+        while records:
+            compact, record = next(iter(records.items()))
+            if record.expires_at <= now:
+                self.expired += 1
+            elif len(records) > self.max_records:
+                self.evicted += 1
+            else:
+                break
+            del records[compact]
+            self._mark_dirty(compact)
+
+    def _record_for_write(self, compact, now):
+        record = self._get(compact, now)
+        if record is None:
+            record = self._records[compact] = FSMRecord()
+        return record
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        now = time.monotonic()
+        compact = _compact_key(key)
+        state = state.state if isinstance(state, State) else state
+        record = self._record_for_write(compact, now)
+        record.state = sys.intern(state) if state is not None else None
+        self._touch(compact, record, now)
+
+    async def get_state(self, key: StorageKey):
+        record = self._get(_compact_key(key), time.monotonic())
+        return record.state if record is not None else None
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        now = time.monotonic()
+        compact = _compact_key(key)
+        record = self._record_for_write(compact, now)
+        record.data = data.copy() if data else None
+        self._touch(compact, record, now)
+
+    async def get_data(self, key: StorageKey):
+        record = self._get(_compact_key(key), time.monotonic())
+        return record.data.copy() if record is not None and record.data else {}
+
+    def _schedule_flush(self):
+        if self.persistence is None:
+            return
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+            except RuntimeError:
+                self.flush()
+
+    async def _delayed_flush(self):
+        # Все изменения за flush_interval уходят в БД одной транзакцией;
+        # при ошибке записи повтор через тот же интервал
+        await asyncio.sleep(self.flush_interval)
+        while not self.flush():
+            await asyncio.sleep(self.flush_interval)
+
+    def flush(self):
+        """Записывает накопленные изменения в БД
+        
+        Ключи остаются помеченными, пока БД не подтвердит запись, и уходят
+        в следующую попытку.
+        """
+        if self.persistence is None or not self._dirty:
+            return True
+        now_monotonic = time.monotonic()
+        now = time.time()
+        upserts = []
+        deletes = []
+        for compact in self._dirty:
+            record = self._records.get(compact)
+            if record is None or record.expires_at <= now_monotonic:
+                deletes.append(_key_to_text(compact))
+            else:
+                upserts.append((_key_to_text(compact), record.state, record.data,
+                                now + (record.expires_at - now_monotonic)))
+        if not self.persistence.save_fsm_states(upserts, deletes):
+            self.flush_errors += 1
+            return False
+        self._dirty.clear()
+        self.flushes += 1
+        return True
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        self.flush()
+
+    def get_stats(self):
+        return {
+            'records': len(self._records),
+            'dirty': len(self._dirty),
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'flushes': self.flushes,
+            'flush_errors': self.flush_errors,
+        }
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Настроенная HTTP-сессия для Bot API
+
+Надстройка над AiohttpSession из aiogram:
+- пул соединений с keep-alive: нажатия кнопок идут по уже открытым
+  TLS-соединениям, без повторного handshake;
+- кэш DNS на время жизни процесса (ttl_dns_cache);
+- таймауты по классам методов: короткий для answerCallbackQuery,
+  обычный для сообщений, длинный для загрузки файлов;
+- быстрая сериализация JSON через orjson, если он установлен.
+"""
+
+import json
+import logging
+from collections import Counter
+
+from aiohttp import ClientSession, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import AnswerCallbackQuery, AnswerInlineQuery, GetUpdates
+from aiogram.types import InputFile
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Классы таймаутов, сек
+TIMEOUT_FAST = 'fast'
+TIMEOUT_DEFAULT = 'default'
+TIMEOUT_UPLOAD = 'upload'
+
+DEFAULT_METHOD_TIMEOUTS = {
+    TIMEOUT_FAST: 5.0,
+    TIMEOUT_DEFAULT: 15.0,
+    TIMEOUT_UPLOAD: 120.0,
+}
+
+FAST_METHODS = (AnswerCallbackQuery, AnswerInlineQuery)
+
+
+def json_dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf-8')
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def json_loads(content):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class TunedAiohttpSession(AiohttpSession):
+    def __init__(self, pool_size=100, pool_size_per_host=0, keepalive_timeout=60, dns_cache_ttl=300,
+                 method_timeouts=None, **kwargs):
+        kwargs.setdefault('json_dumps', json_dumps)
+        kwargs.setdefault('json_loads', json_loads)
+        super().__init__(**kwargs)
+        self._connector_init.update(
+            limit=pool_size,
+            limit_per_host=pool_size_per_host,
+            keepalive_timeout=keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=dns_cache_ttl,
+        )
+        self.method_timeouts = dict(DEFAULT_METHOD_TIMEOUTS)
+        if method_timeouts:
+            self.method_timeouts.update(method_timeouts)
+        self.stats = Counter()
+
+    def _trace_config(self):
+        """Счетчики новых и переиспользованных соединений пула"""
+        trace = TraceConfig()
+
+        async def on_create(session, context, params):
+            self.stats['connections_created'] += 1
+
+        async def on_reuse(session, context, params):
+            self.stats['connections_reused'] += 1
+
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+    async def create_session(self):
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+                json_serialize=self.json_dumps,
+                trace_configs=[self._trace_config()],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    def timeout_class(self, method):
+        if isinstance(method, FAST_METHODS):
+            return TIMEOUT_FAST
+        # Файл в любом поле запроса - загрузка
+        for value in method.__dict__.values():
+            if isinstance(value, InputFile):
+                return TIMEOUT_UPLOAD
+        return TIMEOUT_DEFAULT
+
+    async def make_request(self, bot, method, timeout=None):
+        # У getUpdates свой таймаут long polling, явно заданный таймаут тоже не трогаем
+        if timeout is None and not isinstance(method, GetUpdates):
+            timeout = self.method_timeouts[self.timeout_class(method)]
+        self.stats['requests'] += 1
+        return await super().make_request(bot, method, timeout)
+
+    def get_stats(self):
+        connector = self._session.connector if self._session is not None and not self._session.closed else None
+        created = self.stats['connections_created']
+        reused = self.stats['connections_reused']
+        return {
+            'requests': self.stats['requests'],
+            'connections_created': created,
+            'connections_reused': reused,
+            'reuse_rate': reused / (created + reused) if created + reused else 0.0,
+            'pool_limit': connector.limit if connector else 0,
+        }
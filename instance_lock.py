@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Блокировка единственного экземпляра бота
+
+Вместо перебора всех процессов системы используется advisory-блокировка
+файла (fcntl.flock). Ядро само снимает ее при падении процесса, поэтому
+файл блокировки больше не «залипает». В файле хранятся PID владельца и
+время последнего heartbeat: если владелец жив, но завис и перестал
+обновлять heartbeat, новый экземпляр завершает именно этот PID и
+забирает блокировку.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class InstanceLock:
+    def __init__(self, path="bot.lock", stale_after=120, heartbeat_interval=30, takeover_timeout=10):
+        self.path = path
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval
+        self.takeover_timeout = takeover_timeout
+        self._file = None
+        self._started_at = None
+
+    @property
+    def is_acquired(self):
+        return self._file is not None
+
+    def _try_lock(self, f):
+        """Неблокирующая попытка взять блокировку на открытом файле"""
+        try:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(self, f):
+        try:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+
+    def read_owner(self):
+        """Метаданные текущего владельца блокировки или None"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.loads(f.read() or "null")
+        except (OSError, ValueError):
+            return None
+
+    def _write_metadata(self):
+        metadata = {
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "started_at": self._started_at,
+            "heartbeat": time.time(),
+        }
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(json.dumps(metadata))
+        self._file.flush()
+
+    def _is_stale(self, owner):
+        if not owner or "heartbeat" not in owner:
+            return False
+        return time.time() - owner["heartbeat"] > self.stale_after
+
+    def _takeover(self, f, owner):
+        """Завершает зависшего владельца и ждет освобождения блокировки"""
+        pid = owner.get("pid")
+        if not pid or owner.get("host") != socket.gethostname():
+            return False
+
+        logger.warning(f"⚠️ Экземпляр бота (PID: {pid}) не обновлял heartbeat "
+                       f"{time.time() - owner['heartbeat']:.0f} сек, завершаем его")
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        except OSError as e:
+            logger.error(f"❌ Не удалось завершить процесс {pid}: {e}")
+            return False
+
+        deadline = time.monotonic() + self.takeover_timeout
+        while time.monotonic() < deadline:
+            if self._try_lock(f):
+                return True
+            time.sleep(0.2)
+        return False
+
+    def acquire(self):
+        """Берет блокировку; False, если работает другой живой экземпляр"""
+        if self.is_acquired:
+            return True
+
+        f = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644), "r+", encoding="utf-8")
+        if not self._try_lock(f):
+            owner = self.read_owner()
+            if not (self._is_stale(owner) and self._takeover(f, owner)):
+                f.close()
+                if owner:
+                    logger.error(f"❌ Бот уже запущен (PID: {owner.get('pid')})")
+                return False
+            logger.info("✅ Блокировка перехвачена у зависшего экземпляра")
+
+        self._file = f
+        self._started_at = time.time()
+        self._write_metadata()
+        return True
+
+    def heartbeat(self):
+        """Обновляет отметку времени, подтверждая, что экземпляр жив"""
+        if self.is_acquired:
+            self._write_metadata()
+
+    async def heartbeat_loop(self):
+        """Фоновая задача периодического heartbeat"""
+        while self.is_acquired:
+            try:
+                self.heartbeat()
+            except OSError as e:
+                logger.error(f"❌ Ошибка обновления heartbeat: {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    def release(self):
+        """Снимает блокировку; файл не удаляем, чтобы не было гонки с новым экземпляром"""
+        if not self.is_acquired:
+            return
+        try:
+            self._file.seek(0)
+            self._file.truncate()
+            self._file.flush()
+        except OSError:
+            pass
+        self._unlock(self._file)
+        self._file.close()
+        self._file = None
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Неблокирующее логирование
+
+Обработчики в цикле событий только кладут запись в очередь (QueueHandler),
+а форматирование и запись на диск выполняет фоновый поток QueueListener.
+Файл лога ротируется по размеру или по времени, формат может быть
+текстовым или JSON (одна запись на строку). Частые сообщения горячего
+пути (проверка подписки, «Update id=... is handled» от aiogram)
+прореживаются по логгерам еще до постановки в очередь.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        sampled = getattr(record, 'sample_rate', None)
+        if sampled:
+            data['sample_rate'] = sampled
+        return json.dumps(data, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает каждую N-ю запись ниже WARNING для заданных логгеров
+
+    rates: имя логгера -> N. Правило действует и на дочерние логгеры.
+    Предупреждения и ошибки не прореживаются никогда.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = dict(rates)
+        self._counters = {}
+        self._resolved = {}
+        self.sampled_out = 0
+
+    def _rate_for(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1
+            for prefix, value in self.rates.items():
+                if name == prefix or name.startswith(prefix + '.'):
+                    rate = value
+                    break
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate_for(record.name)
+        if rate <= 1:
+            return True
+        count = self._counters.get(record.name, 0)
+        self._counters[record.name] = count + 1
+        if count % rate:
+            self.sampled_out += 1
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler с ограниченной очередью: при переполнении запись отбрасывается, а не блокирует цикл"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.enqueued = 0
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+class LoggingPipeline:
+    """Очередь, фоновый поток записи и счетчики для отчетов дебага"""
+
+    def __init__(self, queue_handler, listener, sampling_filter):
+        self.queue_handler = queue_handler
+        self.listener = listener
+        self.sampling_filter = sampling_filter
+        self._stopped = False
+
+    def stop(self):
+        """Дописывает оставшиеся записи и останавливает поток"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+    def get_stats(self):
+        return {
+            'enqueued': self.queue_handler.enqueued,
+            'queue_size': self.queue_handler.queue.qsize(),
+            'dropped': self.queue_handler.dropped,
+            'sampled_out': self.sampling_filter.sampled_out,
+        }
+
+
+def build_file_handler(path, rotation='size', max_bytes=10 * 1024 * 1024, backup_count=5, when='midnight'):
+    if rotation == 'time':
+        return logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backup_count,
+                                                         encoding='utf-8')
+    return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                encoding='utf-8')
+
+
+def setup_logging(path='bot_debug.log', level=logging.INFO, rotation='size', max_bytes=10 * 1024 * 1024,
+                  backup_count=5, json_format=False, sampling=None, queue_size=10000, console=True):
+    """Настраивает корневой логгер на очередь и запускает фоновый поток записи"""
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+    handlers = [build_file_handler(path, rotation, max_bytes, backup_count)]
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    sampling_filter = SamplingFilter(sampling or {})
+    queue_handler.addFilter(sampling_filter)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    pipeline = LoggingPipeline(queue_handler, listener, sampling_filter)
+    atexit.register(pipeline.stop)
+    return pipeline
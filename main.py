@@ -7,47 +7,136 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Сначала импортируем конфиг
 from config import BOT_TOKEN, ADMIN_ID, CHANNEL_USERNAME, BOT_VERSION, DEBUG_MODE
+from config import LOG_FILE, LOG_ROTATION, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_JSON, LOG_SAMPLING
+from config import HTTP_POOL_SIZE, HTTP_KEEPALIVE_TIMEOUT, HTTP_DNS_CACHE_TTL
+from config import FSM_TTL, FSM_MAX_RECORDS, FSM_PERSIST
+from config import FLOOD_RATE, FLOOD_BURST
+from config import BACKUP_DIR, BACKUP_KEEP, BACKUP_INTERVAL
+from config import ANALYTICS_REPLICA, REPLICA_REFRESH_INTERVAL, REPLICA_MAX_AGE
+from config import SESSION_STORAGE
 
 # Затем импортируем остальные модули
 import asyncio
 import logging
 import signal
-import psutil
 import time
+import hashlib
+from functools import partial
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import InlineQueryResultArticle, InputTextMessageContent, InlineQueryResultsButton, FSInputFile
 from aiogram.enums import ParseMode
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter, TelegramConflictError
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 
 # Импортируем наши модули
-from bot_database import db
+from bot_database import db, EXPORT_TABLES
 from debug import debug_system
+from instance_lock import InstanceLock
+from api_retry import RetryMiddleware, backoff_delay
+from api_scheduler import OutboundScheduler, PRIORITY_ADMIN, PRIORITY_BULK, with_priority
+from http_session import TunedAiohttpSession
+from fsm_storage import BoundedMemoryStorage
+from antiflood import AntiFloodMiddleware
+from activity import ActivityTracker, METRIC_USERS, METRIC_CALCULATORS
+from analytics import UsageAnalytics
+from export import EXPORT_FORMATS, TABLE_ALIASES, export_filename, export_table
+from backup import BackupManager, list_snapshots, read_checksum
+from storage_backends import open_backend
+from settings_service import SettingsService
+import callbacks as cb
+from calculator import (CalculationError, calculate, calculate_value, display_expression, memory_add,
+                        normalize_expression, result_cache)
+from logging_setup import setup_logging
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO, 
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot_debug.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+# Настройка логирования: запись на диск в фоновом потоке, цикл событий только ставит записи в очередь
+logging_pipeline = setup_logging(
+    path=LOG_FILE,
+    rotation=LOG_ROTATION,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    json_format=LOG_JSON,
+    sampling=LOG_SAMPLING
 )
 logger = logging.getLogger(__name__)
+# Логгер горячего пути, прореживается через LOG_SAMPLING
+subscription_logger = logging.getLogger("bot.subscription")
+
+# Метрики кэша вычислений и логирования в отчетах дебага
+debug_system.register_metrics("Кэш вычислений", result_cache.get_stats)
+debug_system.register_metrics("Логирование", logging_pipeline.get_stats)
 
-# Инициализация бота и диспетчера с MemoryStorage
-storage = MemoryStorage()
-bot = Bot(token=BOT_TOKEN)
+# Инициализация бота и диспетчера; FSM хранит только активные диалоги и переживает перезапуск
+storage = BoundedMemoryStorage(ttl=FSM_TTL, max_records=FSM_MAX_RECORDS, persistence=db if FSM_PERSIST else None)
+# Пул соединений с keep-alive и таймаутами по классам методов
+http_session = TunedAiohttpSession(
+    pool_size=HTTP_POOL_SIZE,
+    keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    dns_cache_ttl=HTTP_DNS_CACHE_TTL
+)
+bot = Bot(token=BOT_TOKEN, session=http_session)
+# Порядок важен: повторы снаружи, планировщик внутри - каждая попытка заново проходит очередь и лимиты
+outbound_scheduler = OutboundScheduler()
+bot.session.middleware(RetryMiddleware())
+bot.session.middleware(outbound_scheduler)
+debug_system.register_metrics("Исходящие запросы", outbound_scheduler.get_stats)
+debug_system.register_metrics("HTTP-сессия", http_session.get_stats)
+debug_system.register_metrics("Состояния FSM", storage.get_stats)
 dp = Dispatcher(storage=storage)
+# Лимит апдейтов на пользователя: лишние отбрасываются до фильтров, БД и Bot API
+antiflood = AntiFloodMiddleware(rate=FLOOD_RATE, burst=FLOOD_BURST, exempt_ids=(ADMIN_ID,))
+dp.message.outer_middleware(antiflood)
+dp.callback_query.outer_middleware(antiflood)
+debug_system.register_metrics("Антифлуд", antiflood.get_stats)
+# Уникальные пользователи за день/неделю/месяц по скетчам HyperLogLog, без записи в users на каждый апдейт
+activity = ActivityTracker(persistence=db)
+debug_system.register_metrics("Активность", activity.get_stats)
+# Отчет по истории вычислений для «📊 Статистика»: пачками в NumPy, в отдельном потоке, с кэшем
+usage_analytics = UsageAnalytics(db)
+debug_system.register_metrics("Аналитика", usage_analytics.get_stats)
+# Снимки БД через SQLite backup API: по расписанию и по команде /backup
+backup_manager = BackupManager(db.db_name, backup_dir=BACKUP_DIR, keep=BACKUP_KEEP, interval=BACKUP_INTERVAL)
+debug_system.register_metrics("Резервные копии", backup_manager.get_stats)
+# Реплика для статистики, аналитики и выгрузок: тяжелые чтения не держат блокировку основной БД
+if ANALYTICS_REPLICA:
+    db.enable_replica(max_age=REPLICA_MAX_AGE)
+    debug_system.register_metrics("Реплика", db.get_replica_stats)
+# Сессии калькулятора - самый частый запрос; хранилище выбирается по замерам bench_storage.py
+sessions = db if SESSION_STORAGE == "sqlite" else open_backend(SESSION_STORAGE)
+
+# Уведомления админа о новых ошибках (частоту ограничивает debug_system)
+async def send_error_alert(text):
+    try:
+        await bot.send_message(ADMIN_ID, text)
+    except Exception as e:
+        # Не через debug_system: ошибка уведомления не должна порождать новое уведомление
+        logger.error(f"❌ Ошибка отправки уведомления об ошибке: {e}")
+
+# Ссылки на задачи уведомлений, чтобы их не собрал сборщик мусора до завершения
+alert_tasks = set()
+
+def schedule_error_alert(text):
+    try:
+        task = asyncio.get_running_loop().create_task(send_error_alert(text))
+        alert_tasks.add(task)
+        task.add_done_callback(alert_tasks.discard)
+    except RuntimeError:
+        # Вне цикла событий (запуск, завершение) уведомление не отправляем
+        pass
+
+debug_system.set_alert_handler(schedule_error_alert)
 
 # Конфигурация
 CHANNEL_URL = f"https://t.me/{CHANNEL_USERNAME.replace('@', '')}"
 SESSION_TIMEOUT = 15 * 60
+MAX_CONFLICT_RESTARTS = 5
+INLINE_CACHE_TIME = 300
+INLINE_DEBOUNCE = 0.4
 
-# История обновлений
+# История обновлений: при запуске недостающие версии добавляются в таблицу update_history,
+# а измененные тексты уже записанных версий перезаписываются (поиск по всей таблице)
 UPDATE_HISTORY = {
     "2.3.1": """
 🆕 **Версия 2.3.1** - *Ноябрь 2024*
@@ -71,6 +160,12 @@ UPDATE_HISTORY = {
     """
 }
 
+# Настройки и история обновлений в памяти: запись сразу в БД, тексты кэшируются до изменения настроек
+settings = SettingsService(db)
+settings.sync_update_history(UPDATE_HISTORY)
+settings.set("bot_version", BOT_VERSION)
+debug_system.register_metrics("Настройки", settings.get_stats)
+
 # Состояния
 class BroadcastState(StatesGroup):
     waiting_for_message = State()
@@ -79,9 +174,15 @@ class BroadcastState(StatesGroup):
 # Кэш для проверки подписки
 subscription_cache = {}
 
+# Номер последнего инлайн-запроса каждого пользователя (для подавления промежуточных)
+inline_query_sequence = {}
+
 # Флаг для graceful shutdown
 is_shutting_down = False
 
+# Блокировка единственного экземпляра бота
+instance_lock = InstanceLock("bot.lock")
+
 # Клавиатуры
 def get_main_keyboard(user_id):
     """Основная клавиатура с командами"""
@@ -98,104 +199,68 @@ def get_main_keyboard(user_id):
 
 def get_profile_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔔 Вкл/Выкл уведомления", callback_data="toggle_notifications")],
-        [InlineKeyboardButton(text="📊 Статистика вычислений", callback_data="calculation_stats")],
-        [InlineKeyboardButton(text="🆕 Что нового", callback_data="whats_new")],
-        [InlineKeyboardButton(text="🔄 Обновить профиль", callback_data="refresh_profile")]
+        [InlineKeyboardButton(text="🔔 Вкл/Выкл уведомления", callback_data=cb.PROFILE_TOGGLE_NOTIFICATIONS)],
+        [InlineKeyboardButton(text="📊 Статистика вычислений", callback_data=cb.PROFILE_CALCULATION_STATS)],
+        [InlineKeyboardButton(text="🆕 Что нового", callback_data=cb.PROFILE_WHATS_NEW)],
+        [InlineKeyboardButton(text="🔄 Обновить профиль", callback_data=cb.PROFILE_REFRESH)]
     ])
 
-def get_calculator_keyboard():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text='C', callback_data='C'),
-            InlineKeyboardButton(text='<=', callback_data='<='),
-            InlineKeyboardButton(text='/', callback_data='/')
-        ],
-        [
-            InlineKeyboardButton(text='7', callback_data='7'),
-            InlineKeyboardButton(text='8', callback_data='8'),
-            InlineKeyboardButton(text='9', callback_data='9'),
-            InlineKeyboardButton(text='*', callback_data='*')
-        ],
-        [
-            InlineKeyboardButton(text='4', callback_data='4'),
-            InlineKeyboardButton(text='5', callback_data='5'),
-            InlineKeyboardButton(text='6', callback_data='6'),
-            InlineKeyboardButton(text='-', callback_data='-')
-        ],
-        [
-            InlineKeyboardButton(text='1', callback_data='1'),
-            InlineKeyboardButton(text='2', callback_data='2'),
-            InlineKeyboardButton(text='3', callback_data='3'),
-            InlineKeyboardButton(text='+', callback_data='+')
-        ],
-        [
-            InlineKeyboardButton(text='0', callback_data='0'),
-            InlineKeyboardButton(text=',', callback_data='.'),
-            InlineKeyboardButton(text='=', callback_data='=')
-        ]
-    ])
+# Раскладки калькулятора: клавиша или (надпись, callback_data)
+BASIC_CALCULATOR_LAYOUT = [
+    ['C', '<=', '/'],
+    ['7', '8', '9', '*'],
+    ['4', '5', '6', '-'],
+    ['1', '2', '3', '+'],
+    ['0', '.', '='],
+    [('🔬 Научный', cb.CALC_MODE)],
+]
+
+SCIENTIFIC_CALCULATOR_LAYOUT = [
+    ['MC', 'MR', 'M+', 'M-'],
+    ['(', ')', '%', '^', '√'],
+    ['C', '<=', '/'],
+    ['7', '8', '9', '*'],
+    ['4', '5', '6', '-'],
+    ['1', '2', '3', '+'],
+    ['0', '.', '='],
+    [('🔢 Обычный', cb.CALC_MODE)],
+]
+
+CALC_KEY_LABELS = {'.': ','}
+
+def build_calculator_keyboard(layout):
+    codes = {**cb.CALC_KEY_CODES, **cb.SCIENTIFIC_KEY_CODES}
+    rows = []
+    for row in layout:
+        buttons = []
+        for key in row:
+            text, data = key if isinstance(key, tuple) else (CALC_KEY_LABELS.get(key, key), codes[key])
+            buttons.append(InlineKeyboardButton(text=text, callback_data=data))
+        rows.append(buttons)
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+# Клавиатуры неизменяемы, поэтому строятся один раз, а не на каждое нажатие
+BASIC_CALCULATOR_KEYBOARD = build_calculator_keyboard(BASIC_CALCULATOR_LAYOUT)
+SCIENTIFIC_CALCULATOR_KEYBOARD = build_calculator_keyboard(SCIENTIFIC_CALCULATOR_LAYOUT)
+
+def get_calculator_keyboard(scientific=False):
+    return SCIENTIFIC_CALCULATOR_KEYBOARD if scientific else BASIC_CALCULATOR_KEYBOARD
 
 def get_admin_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
-        [InlineKeyboardButton(text="📢 Создать рассылку", callback_data="admin_broadcast")],
-        [InlineKeyboardButton(text="👥 Список пользователей", callback_data="admin_users")],
-        [InlineKeyboardButton(text="📋 История рассылок", callback_data="admin_broadcast_history")]
+        [InlineKeyboardButton(text="📊 Статистика", callback_data=cb.ADMIN_STATS)],
+        [InlineKeyboardButton(text="📢 Создать рассылку", callback_data=cb.ADMIN_BROADCAST)],
+        [InlineKeyboardButton(text="👥 Список пользователей", callback_data=cb.ADMIN_USERS)],
+        [InlineKeyboardButton(text="📋 История рассылок", callback_data=cb.ADMIN_BROADCAST_HISTORY)],
+        [InlineKeyboardButton(text="📤 Выгрузка данных", callback_data=cb.ADMIN_EXPORT)]
     ])
 
 def get_subscription_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📢 Подписаться", url=CHANNEL_URL)],
-        [InlineKeyboardButton(text="🔄 Проверить подписку", callback_data="check_subscription")]
+        [InlineKeyboardButton(text="🔄 Проверить подписку", callback_data=cb.SUBSCRIPTION_CHECK)]
     ])
 
-def check_other_bot_instances():
-    """Проверяет, не запущены ли другие экземпляры бота"""
-    current_pid = os.getpid()
-    current_script = os.path.basename(__file__)
-    
-    for process in psutil.process_iter(['pid', 'name', 'cmdline']):
-        try:
-            if (process.info['pid'] != current_pid and 
-                process.info['cmdline'] and 
-                current_script in ' '.join(process.info['cmdline']) and
-                'python' in process.info['name'].lower()):
-                
-                logger.warning(f"⚠️ Обнаружен другой запущенный процесс бота (PID: {process.info['pid']})")
-                return True
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-    
-    return False
-
-async def kill_other_bot_instances():
-    """Завершает другие экземпляры бота"""
-    current_pid = os.getpid()
-    current_script = os.path.basename(__file__)
-    killed_count = 0
-    
-    for process in psutil.process_iter(['pid', 'name', 'cmdline']):
-        try:
-            if (process.info['pid'] != current_pid and 
-                process.info['cmdline'] and 
-                current_script in ' '.join(process.info['cmdline']) and
-                'python' in process.info['name'].lower()):
-                
-                logger.info(f"🛑 Завершаем процесс бота (PID: {process.info['pid']})")
-                process.terminate()
-                killed_count += 1
-                
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-    
-    if killed_count > 0:
-        logger.info(f"✅ Завершено {killed_count} процессов бота")
-        # Даем время для завершения процессов
-        await asyncio.sleep(2)
-    
-    return killed_count
-
 # Улучшенная проверка подписки с обработкой ошибок
 async def check_user_subscription(user_id):
     """Проверяет подписку пользователя на канал с обработкой ошибок"""
@@ -212,7 +277,7 @@ async def check_user_subscription(user_id):
         # Сохраняем в кэш с временной меткой
         subscription_cache[user_id] = (is_subscribed, time.time())
         
-        logger.info(f"✅ Пользователь {user_id} подписка: {is_subscribed} (статус: {chat_member.status})")
+        subscription_logger.info("✅ Пользователь %s подписка: %s (статус: %s)", user_id, is_subscribed, chat_member.status)
         return is_subscribed
         
     except TelegramBadRequest as e:
@@ -231,10 +296,10 @@ async def check_user_subscription(user_id):
         return True
         
     except TelegramRetryAfter as e:
-        logger.warning(f"⚠️ Лимит запросов, ждем {e.retry_after} сек")
-        await asyncio.sleep(e.retry_after)
-        # Повторная попытка после ожидания
-        return await check_user_subscription(user_id)
+        # Повторы и ожидание уже выполнил RetryMiddleware, здесь бюджет исчерпан
+        logger.warning(f"⚠️ Лимит запросов при проверке подписки {user_id}, retry_after={e.retry_after}")
+        # При лимите временно разрешаем доступ
+        return True
         
     except Exception as e:
         logger.error(f"❌ Неизвестная ошибка проверки подписки {user_id}: {e}")
@@ -257,8 +322,8 @@ async def check_user_access(user_id, username=None, first_name=None, last_name=N
         is_subscribed = await check_user_subscription(user_id)
         db.update_subscription_status(user_id, is_subscribed)
         
-        # Обновляем активность
-        db.update_user_activity(user_id)
+        # Отмечаем активность в скетче за сегодня (в БД скетчи пишет фоновая задача)
+        activity.record(user_id)
         
         return is_subscribed
         
@@ -268,32 +333,119 @@ async def check_user_access(user_id, username=None, first_name=None, last_name=N
         # При ошибке разрешаем доступ
         return True
 
+def get_calculator_text(session):
+    value = session.value if session else ''
+    memory = session.memory if session else ''
+    # В сессии полные значения, на экране длинные числа округлены
+    text = f"🧮 **Калькулятор**\n\n`{display_expression(value) or '0'}`"
+    if memory:
+        text += f"\n\nM = `{display_expression(memory)}`"
+    return text
+
 # Отправка калькулятора
 async def send_calculator(chat_id, user_id):
-    session = db.get_calculator_session(user_id)
-    value = session[1] if session else ''
+    session = sessions.get_calculator_session(user_id)
+    value = session.value if session else ''
+    scientific = session.scientific if session else False
     
     try:
-        text = f"🧮 **Калькулятор**\n\n`{value or '0'}`"
-        message = await bot.send_message(chat_id, text, parse_mode=ParseMode.MARKDOWN, reply_markup=get_calculator_keyboard())
-        db.update_calculator_session(user_id, value or '', value or '', message.message_id)
+        text = get_calculator_text(session)
+        message = await bot.send_message(chat_id, text, parse_mode=ParseMode.MARKDOWN, reply_markup=get_calculator_keyboard(scientific))
+        sessions.update_calculator_session(user_id, value or '', value or '', message.message_id)
     except Exception as e:
         logger.error(f"❌ Ошибка отправки калькулятора: {e}")
         debug_system.log_error(str(e), "send_calculator", 0)
 
 # Обновление калькулятора
 async def update_calculator(chat_id, user_id, message_id):
-    session = db.get_calculator_session(user_id)
-    value = session[1] if session else ''
+    session = sessions.get_calculator_session(user_id)
+    scientific = session.scientific if session else False
     
     try:
-        text = f"🧮 **Калькулятор**\n\n`{value or '0'}`"
-        await bot.edit_message_text(text, chat_id, message_id, parse_mode=ParseMode.MARKDOWN, reply_markup=get_calculator_keyboard())
+        text = get_calculator_text(session)
+        await bot.edit_message_text(text, chat_id, message_id, parse_mode=ParseMode.MARKDOWN, reply_markup=get_calculator_keyboard(scientific))
     except Exception as e:
         logger.error(f"❌ Ошибка обновления калькулятора: {e}")
         debug_system.log_error(str(e), "update_calculator", 0)
 
+def get_activity_text():
+    """Строки админской статистики с уникальными пользователями за день/неделю/месяц"""
+    summary = activity.get_summary()
+    users = summary[METRIC_USERS]
+    calculators = summary[METRIC_CALCULATORS]
+    return (
+        f"• Активных за день/неделю/месяц: ≈{users['day']} / ≈{users['week']} / ≈{users['month']}\n"
+        f"• Считали за день/неделю/месяц: ≈{calculators['day']} / ≈{calculators['week']} / ≈{calculators['month']}\n"
+    )
+
+def get_bot_stats():
+    """Статистика БД; сессии считает хранилище, в котором они лежат (SESSION_STORAGE)"""
+    stats = db.get_user_stats()
+    if sessions is not db:
+        stats['active_sessions'] = sessions.count_calculator_sessions()
+    return stats
+
+def get_staleness_text(analytics_age=None):
+    """Строка админской статистики о возрасте данных отчетов
+    
+    analytics_age - возраст кэшированного отчета аналитики: он может быть
+    построен по более старому снимку, чем остальная статистика.
+    """
+    age = db.get_read_age()
+    if analytics_age is not None:
+        return (f"🗂 Данные отчетов на {int(max(age, analytics_age))} сек назад "
+                f"(статистика - {int(age)} сек, аналитика - {int(analytics_age)} сек)")
+    if not age:
+        return "🗂 Данные отчетов: основная БД (актуальные)"
+    return f"🗂 Данные отчетов на {int(age)} сек назад (не старше {db.replica_max_age} сек)"
+
+async def refresh_replica_if_stale():
+    """Перед отчетами админа обновляет реплику, если она старше REPLICA_REFRESH_INTERVAL
+    
+    Снимок БД делается только когда отчеты смотрят, а не по таймеру.
+    """
+    if db.replica_path is None:
+        return
+    age = db.get_replica_age()
+    if age is not None and age <= REPLICA_REFRESH_INTERVAL:
+        return
+    await asyncio.get_running_loop().run_in_executor(None, db.refresh_replica)
+
+# Лимит Bot API на размер отправляемого документа
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+
+@with_priority(PRIORITY_ADMIN)
+async def send_export(chat_id, tables, fmt='csv'):
+    """Выгружает таблицы в сжатые файлы и отправляет их документами"""
+    await refresh_replica_if_stale()
+    for table in tables:
+        try:
+            path, rows = await export_table(db, table, fmt)
+        except Exception as e:
+            logger.error(f"❌ Ошибка выгрузки {table}: {e}")
+            debug_system.log_error(str(e), "send_export", 0)
+            await bot.send_message(chat_id, f"❌ Не удалось выгрузить {table}")
+            continue
+        try:
+            size = os.path.getsize(path)
+            if size > MAX_DOCUMENT_SIZE:
+                await bot.send_message(chat_id, f"❌ {table}: файл {size // (1024 * 1024)} МБ больше лимита Telegram")
+                continue
+            await bot.send_document(
+                chat_id,
+                FSInputFile(path, filename=export_filename(table, fmt)),
+                caption=f"📤 {table}: {rows} строк"
+            )
+        except Exception as e:
+            # Ошибка отправки одной таблицы не отменяет выгрузку остальных
+            logger.error(f"❌ Ошибка отправки выгрузки {table}: {e}")
+            debug_system.log_error(str(e), "send_export", 0)
+            await bot.send_message(chat_id, f"❌ Не удалось отправить выгрузку {table}")
+        finally:
+            os.remove(path)
+
 # Функция для открытия админ панели
+@with_priority(PRIORITY_ADMIN)
 async def show_admin_panel(chat_id, user_id):
     """Показывает админ панель"""
     try:
@@ -301,7 +453,8 @@ async def show_admin_panel(chat_id, user_id):
             await bot.send_message(chat_id, "❌ У вас нет доступа к админ панели")
             return False
         
-        stats = db.get_user_stats()
+        await refresh_replica_if_stale()
+        stats = get_bot_stats()
         admin_text = (
             f"👑 **Админ панель**\n\n"
             f"📊 **Статистика бота:**\n"
@@ -309,9 +462,10 @@ async def show_admin_panel(chat_id, user_id):
             f"• Всего пользователей: {stats['total_users']}\n"
             f"• Подписанных пользователей: {stats['subscribed_users']}\n"
             f"• Активных сессий: {stats['active_sessions']}\n"
-            f"• Активных за неделю: {stats['active_week']}\n"
+            f"{get_activity_text()}"
             f"• Всего вычислений: {stats['total_calculations']}\n"
-            f"• Охват: {(stats['subscribed_users']/stats['total_users']*100) if stats['total_users'] > 0 else 0:.1f}%"
+            f"• Охват: {(stats['subscribed_users']/stats['total_users']*100) if stats['total_users'] > 0 else 0:.1f}%\n\n"
+            f"{get_staleness_text()}"
         )
         
         await bot.send_message(chat_id, admin_text, reply_markup=get_admin_keyboard(), parse_mode=ParseMode.MARKDOWN)
@@ -327,23 +481,22 @@ async def show_admin_panel(chat_id, user_id):
 async def show_user_profile(chat_id, user_id):
     """Показывает профиль пользователя"""
     try:
-        user = db.get_user(user_id)
-        if not user:
+        profile = db.get_user_profile(user_id)
+        if not profile:
             await bot.send_message(chat_id, "❌ Профиль не найден")
             return
         
-        notifications_status = db.get_user_notifications_status(user_id)
-        stats = db.get_user_stats()
+        stats = db.get_stats_snapshot()
         
         profile_text = (
             f"👤 **Ваш профиль**\n\n"
             f"🆔 ID: `{user_id}`\n"
-            f"👤 Имя: {user[2]} {user[3] or ''}\n"
-            f"📊 Статус подписки: {'✅ Активна' if user[4] else '❌ Не активна'}\n"
-            f"🔔 Уведомления: {'✅ Включены' if notifications_status else '❌ Выключены'}\n"
-            f"🧮 Вычислений: {user[9] or 0}\n"
-            f"📅 Зарегистрирован: {user[6][:16] if user[6] else 'Неизвестно'}\n"
-            f"🕒 Последняя активность: {user[7][:16] if user[7] else 'Неизвестно'}\n"
+            f"👤 Имя: {profile.first_name} {profile.last_name or ''}\n"
+            f"📊 Статус подписки: {'✅ Активна' if profile.subscribed else '❌ Не активна'}\n"
+            f"🔔 Уведомления: {'✅ Включены' if profile.notifications_enabled else '❌ Выключены'}\n"
+            f"🧮 Вычислений: {profile.calculations_count}\n"
+            f"📅 Зарегистрирован: {profile.created_at[:16] if profile.created_at else 'Неизвестно'}\n"
+            f"🕒 Последняя активность: {profile.last_activity[:16] if profile.last_activity else 'Неизвестно'}\n"
         )
         
         profile_text += f"\n📈 **Статистика бота:**\n"
@@ -357,21 +510,45 @@ async def show_user_profile(chat_id, user_id):
         debug_system.log_error(str(e), "show_user_profile", 0)
         await bot.send_message(chat_id, "❌ Ошибка загрузки профиля")
 
-# Обработчики команд
-@dp.message(Command(commands=['start']))
-async def start_command(message: Message):
-    user_id = message.from_user.id
-    has_access = await check_user_access(user_id, message.from_user.username, message.from_user.first_name, message.from_user.last_name)
-    
-    welcome_text = (
+# Тексты меню: собираются из настроек и кэшируются в settings до их изменения
+def build_welcome_text():
+    return (
         f"🚀 **Добро пожаловать в калькулятор!**\n\n"
-        f"**Версия {BOT_VERSION}**\n\n"
+        f"**Версия {settings.get('bot_version', BOT_VERSION)}**\n\n"
         "Используйте кнопки ниже для навигации:\n"
         "• 🧮 Калькулятор - открыть калькулятор\n"
         "• ℹ️ Помощь - получить справку\n"
         "• 👤 Профиль - настройки и статистика\n"
         "• 📢 Подписаться - получить доступ к боту"
     )
+
+def build_help_text():
+    return (
+        f"ℹ️ **Помощь по боту** (v{settings.get('bot_version', BOT_VERSION)})\n\n"
+        "🧮 **Калькулятор:**\n"
+        "• Используйте кнопки для ввода\n"
+        "• C - очистить\n"
+        "• <= - удалить символ\n"
+        "• = - вычислить\n"
+        "• В любом чате: @имя_бота 2+2*3\n\n"
+        "🔧 **Основные команды:**\n"
+        "/start - перезапустить бота\n"
+        "/help - эта справка\n"
+        "/profile - ваш профиль\n\n"
+        "⚠️ **Важно:** Бот работает только с кнопками!"
+    )
+
+def build_whats_new_text():
+    changes = settings.get_changes(settings.get('bot_version', BOT_VERSION))
+    return changes or "Описание изменений пока не добавлено"
+
+# Обработчики команд
+@dp.message(Command(commands=['start']))
+async def start_command(message: Message):
+    user_id = message.from_user.id
+    has_access = await check_user_access(user_id, message.from_user.username, message.from_user.first_name, message.from_user.last_name)
+    
+    welcome_text = settings.render("welcome", build_welcome_text)
     
     if not has_access:
         welcome_text += f"\n\n🔒 **Требуется подписка на канал:** {CHANNEL_URL}"
@@ -394,20 +571,7 @@ async def calculator_button(message: Message):
 
 @dp.message(F.text == "ℹ️ Помощь")
 async def help_button(message: Message):
-    help_text = (
-        f"ℹ️ **Помощь по боту** (v{BOT_VERSION})\n\n"
-        "🧮 **Калькулятор:**\n"
-        "• Используйте кнопки для ввода\n"
-        "• C - очистить\n"
-        "• <= - удалить символ\n"
-        "• = - вычислить\n\n"
-        "🔧 **Основные команды:**\n"
-        "/start - перезапустить бота\n"
-        "/help - эта справка\n"
-        "/profile - ваш профиль\n\n"
-        "⚠️ **Важно:** Бот работает только с кнопками!"
-    )
-    await message.answer(help_text, parse_mode=ParseMode.MARKDOWN)
+    await message.answer(settings.render("help", build_help_text), parse_mode=ParseMode.MARKDOWN)
 
 @dp.message(F.text == "📢 Подписаться на канал")
 async def subscribe_button(message: Message):
@@ -427,6 +591,21 @@ async def admin_button(message: Message):
     user_id = message.from_user.id
     await show_admin_panel(message.chat.id, user_id)
 
+@dp.message(F.text == "🔧 Дебаг")
+@with_priority(PRIORITY_ADMIN)
+async def debug_button(message: Message):
+    """Отчет системы отладки для админа"""
+    if str(message.from_user.id) != str(ADMIN_ID):
+        await message.answer("❌ У вас нет доступа к дебагу")
+        return
+    
+    report = debug_system.get_system_status() + "\n" + debug_system.get_error_report()
+    try:
+        await message.answer(report, parse_mode=ParseMode.MARKDOWN)
+    except TelegramBadRequest:
+        # В тексте ошибок могут быть символы разметки
+        await message.answer(report)
+
 @dp.message(Command(commands=['help']))
 async def help_command(message: Message):
     await help_button(message)
@@ -437,15 +616,120 @@ async def admin_command(message: Message):
     user_id = message.from_user.id
     await show_admin_panel(message.chat.id, user_id)
 
+@dp.message(Command(commands=['export']))
+async def export_command(message: Message):
+    """Обработчик команды /export [users|history|broadcasts] [csv|jsonl]"""
+    if str(message.from_user.id) != str(ADMIN_ID):
+        return
+    
+    tables = []
+    fmt = 'csv'
+    for arg in (message.text or '').lower().split()[1:]:
+        if arg in EXPORT_FORMATS:
+            fmt = arg
+        elif arg in TABLE_ALIASES:
+            tables.append(TABLE_ALIASES[arg])
+        else:
+            await message.answer("Использование: /export [users|history|broadcasts] [csv|jsonl]")
+            return
+    
+    await send_export(message.chat.id, tables or list(EXPORT_TABLES), fmt)
+
+@dp.message(Command(commands=['backup']))
+@with_priority(PRIORITY_ADMIN)
+async def backup_command(message: Message):
+    """Обработчик команды /backup - внеочередной снимок БД"""
+    if str(message.from_user.id) != str(ADMIN_ID):
+        return
+    
+    await message.answer("⏳ Создаем резервную копию...")
+    try:
+        path = await backup_manager.backup()
+    except Exception as e:
+        logger.error(f"❌ Ошибка резервного копирования: {e}")
+        debug_system.log_error(str(e), "backup_command", 0)
+        await message.answer(f"❌ Резервная копия не создана: {e}")
+        return
+    
+    stats = backup_manager.get_stats()
+    await message.answer(
+        f"✅ Резервная копия создана\n\n"
+        f"• Файл: {os.path.basename(path)}\n"
+        f"• Размер: {stats['last_size_kb']} КБ\n"
+        f"• Время: {stats['last_duration_s']} сек, шагов: {stats['last_steps']}\n"
+        f"• SHA-256: {read_checksum(path)[:16]}...\n"
+        f"• Хранится снимков: {len(list_snapshots(BACKUP_DIR))}\n\n"
+        f"Восстановление: python restore_backup.py"
+    )
+
 @dp.message(Command(commands=['profile']))
 async def profile_command(message: Message):
     """Обработчик команды /profile"""
     user_id = message.from_user.id
     await show_user_profile(message.chat.id, user_id)
 
-# Callback обработчики
-@dp.callback_query(F.data == "check_subscription")
-async def check_subscription_callback(query: types.CallbackQuery):
+# Инлайн-режим: @bot 2+2*3
+async def answer_inline_calculation(query: types.InlineQuery):
+    """Отвечает на инлайн-запрос результатом вычисления"""
+    try:
+        expression, result = calculate(query.query)
+    except ZeroDivisionError:
+        expression, result = normalize_expression(query.query), 'Ошибка: деление на 0!'
+    except CalculationError:
+        # Незаконченное выражение: пустой ответ
+        await query.answer([], cache_time=INLINE_CACHE_TIME, is_personal=True)
+        return
+    
+    text = f"{expression} = {result}"
+    article = InlineQueryResultArticle(
+        id=hashlib.md5(expression.encode('utf-8')).hexdigest(),
+        title=text,
+        description="Нажмите, чтобы отправить результат",
+        input_message_content=InputTextMessageContent(message_text=f"🧮 {text}")
+    )
+    # Ответ персональный: общий кэш Telegram отдал бы результат и неподписанным пользователям
+    await query.answer([article], cache_time=INLINE_CACHE_TIME, is_personal=True)
+
+@dp.inline_query()
+async def inline_calculator(query: types.InlineQuery):
+    """Инлайн-калькулятор с подавлением промежуточных запросов"""
+    user_id = query.from_user.id
+    has_query = bool(query.query.strip())
+    
+    # Готовый результат отдаем сразу, без задержки
+    if has_query and not result_cache.peek(normalize_expression(query.query)):
+        # Telegram присылает запрос на каждый введенный символ: отвечаем только на последний
+        sequence = inline_query_sequence.get(user_id, 0) + 1
+        inline_query_sequence[user_id] = sequence
+        await asyncio.sleep(INLINE_DEBOUNCE)
+        if inline_query_sequence.get(user_id) != sequence:
+            return
+        del inline_query_sequence[user_id]
+    
+    if not await check_user_subscription(user_id):
+        await query.answer(
+            [],
+            cache_time=0,
+            is_personal=True,
+            button=InlineQueryResultsButton(text="🔒 Подпишитесь на канал", start_parameter="subscribe")
+        )
+        return
+    
+    if not has_query:
+        await query.answer([], cache_time=INLINE_CACHE_TIME, is_personal=True)
+        return
+
+    try:
+        await answer_inline_calculation(query)
+    except Exception as e:
+        logger.error(f"❌ Ошибка инлайн-запроса: {e}")
+        debug_system.log_error(str(e), "inline_calculator", 0)
+
+# Callback обработчики: все callback-запросы маршрутизируются через таблицу callbacks.CallbackTable
+callback_table = cb.CallbackTable()
+
+@callback_table.route(cb.SUBSCRIPTION_CHECK)
+async def check_subscription_callback(query: types.CallbackQuery, state: FSMContext):
     user_id = query.from_user.id
     
     # Очищаем кэш для принудительной проверки
@@ -460,8 +744,8 @@ async def check_subscription_callback(query: types.CallbackQuery):
     else:
         await query.answer("❌ Вы еще не подписались или подписка не обнаружена!", show_alert=True)
 
-@dp.callback_query(F.data == "toggle_notifications")
-async def toggle_notifications_callback(query: types.CallbackQuery):
+@callback_table.route(cb.PROFILE_TOGGLE_NOTIFICATIONS)
+async def toggle_notifications_callback(query: types.CallbackQuery, state: FSMContext):
     user_id = query.from_user.id
     current_status = db.get_user_notifications_status(user_id)
     new_status = not current_status
@@ -472,8 +756,8 @@ async def toggle_notifications_callback(query: types.CallbackQuery):
     await query.answer(f"🔔 Уведомления {status_text}!", show_alert=True)
     await show_user_profile(query.message.chat.id, user_id)
 
-@dp.callback_query(F.data == "refresh_profile")
-async def refresh_profile_callback(query: types.CallbackQuery):
+@callback_table.route(cb.PROFILE_REFRESH)
+async def refresh_profile_callback(query: types.CallbackQuery, state: FSMContext):
     user_id = query.from_user.id
     
     # Очищаем кэш подписки для обновления статуса
@@ -481,68 +765,256 @@ async def refresh_profile_callback(query: types.CallbackQuery):
         del subscription_cache[user_id]
     
     await show_user_profile(query.message.chat.id, user_id)
+    await query.answer()
 
-@dp.callback_query(F.data.startswith("admin_"))
-async def admin_callback_handler(query: types.CallbackQuery):
+@callback_table.route(cb.PROFILE_CALCULATION_STATS)
+async def calculation_stats_callback(query: types.CallbackQuery, state: FSMContext):
+    """Статистика вычислений пользователя"""
+    user_id = query.from_user.id
+    
+    try:
+        stats = db.get_calculation_stats(user_id)
+        
+        if not stats:
+            await query.answer("📭 Вы еще ничего не вычисляли", show_alert=True)
+            return
+        
+        operators = ' '.join(f"`{op}` {count}" for op, count in stats['operators'].items())
+        stats_text = (
+            f"📊 **Статистика вычислений**\n\n"
+            f"🧮 Всего вычислений: {stats['calculations']}\n"
+            f"❌ Ошибок: {stats['errors']}\n"
+            f"➗ Операторы: {operators}\n"
+            f"📏 Самое длинное выражение: `{stats['longest_expression'] or '-'}`\n"
+            f"🕒 Последнее вычисление: {stats['last_calculation'][:16] if stats['last_calculation'] else 'нет'}\n"
+        )
+        
+        if stats['daily']:
+            stats_text += "\n📅 **По дням:**\n"
+            for day, calculations, errors in stats['daily']:
+                stats_text += f"• {day}: {calculations} (ошибок: {errors})\n"
+        
+        await query.message.answer(stats_text, parse_mode=ParseMode.MARKDOWN)
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка статистики вычислений: {e}")
+        debug_system.log_error(str(e), "calculation_stats_callback", 0)
+        await query.answer("❌ Ошибка загрузки статистики", show_alert=True)
+        return
+    
+    await query.answer()
+
+@callback_table.route(cb.PROFILE_WHATS_NEW)
+async def whats_new_callback(query: types.CallbackQuery, state: FSMContext):
+    """Список изменений текущей версии"""
+    await query.message.answer(settings.render("whats_new", build_whats_new_text), parse_mode=ParseMode.MARKDOWN)
+    await query.answer()
+
+def get_broadcast_confirm_keyboard():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="✅ Отправить", callback_data=cb.ADMIN_BROADCAST_CONFIRM),
+            InlineKeyboardButton(text="❌ Отмена", callback_data=cb.ADMIN_BROADCAST_CANCEL)
+        ]
+    ])
+
+@with_priority(PRIORITY_BULK)
+async def send_broadcast(admin_id, message_text):
+    """Рассылка сообщения пользователям с включенными уведомлениями"""
+    users = db.get_users_for_broadcast()
+    broadcast_id = db.create_broadcast(admin_id, message_text, len(users))
+    sent_count = 0
+    failed_count = 0
+    
+    try:
+        for user_id in users:
+            if is_shutting_down:
+                break
+            try:
+                # Темп задает планировщик: рассылка получает токены после интерактивных запросов
+                await bot.send_message(user_id, message_text)
+                sent_count += 1
+            except (TelegramForbiddenError, TelegramBadRequest):
+                failed_count += 1
+            except Exception as e:
+                failed_count += 1
+                logger.error(f"❌ Ошибка рассылки пользователю {user_id}: {e}")
+    finally:
+        # Итог сохраняется и у прерванной рассылки, иначе она навсегда останется в статусе sending
+        if broadcast_id:
+            db.update_broadcast_stats(broadcast_id, sent_count, failed_count,
+                                      'interrupted' if is_shutting_down else 'completed')
+    return sent_count, failed_count
+
+# Идущие рассылки: graceful_shutdown дожидается, пока они сохранят итог
+broadcast_tasks = set()
+BROADCAST_SHUTDOWN_TIMEOUT = 30
+# Сколько ждать рассылки после закрытия очереди планировщика
+BROADCAST_CLOSE_TIMEOUT = 5
+
+@with_priority(PRIORITY_ADMIN)
+async def run_broadcast(chat_id, admin_id, message_text):
+    """Рассылка в фоне; итог приходит админу отдельным сообщением"""
+    try:
+        sent_count, failed_count = await send_broadcast(admin_id, message_text)
+        status = "⚠️ Рассылка прервана остановкой бота" if is_shutting_down else "✅ Рассылка завершена"
+        await bot.send_message(chat_id, f"{status}\n\n• Отправлено: {sent_count}\n• Ошибок: {failed_count}")
+    except Exception as e:
+        logger.error(f"❌ Ошибка рассылки: {e}")
+        debug_system.log_error(str(e), "run_broadcast", 0)
+        await bot.send_message(chat_id, "❌ Рассылка завершилась с ошибкой")
+
+def start_broadcast(chat_id, admin_id, message_text):
+    task = asyncio.create_task(run_broadcast(chat_id, admin_id, message_text))
+    broadcast_tasks.add(task)
+    task.add_done_callback(broadcast_tasks.discard)
+
+@with_priority(PRIORITY_ADMIN)
+async def admin_callback_handler(query: types.CallbackQuery, state: FSMContext, action):
     user_id = query.from_user.id
     if str(user_id) != str(ADMIN_ID):
         await query.answer("❌ Доступ запрещен", show_alert=True)
         return
     
-    action = query.data
-    
     try:
-        if action == "admin_stats":
-            stats = db.get_user_stats()
+        if action == cb.ADMIN_STATS:
+            await refresh_replica_if_stale()
+            stats = get_bot_stats()
             stats_text = (
                 f"📊 **Статистика:**\n"
                 f"• Версия: {BOT_VERSION}\n"
                 f"• Всего пользователей: {stats['total_users']}\n"
                 f"• Подписанных: {stats['subscribed_users']}\n"
                 f"• Активных сессий: {stats['active_sessions']}\n"
-                f"• Активных за неделю: {stats['active_week']}\n"
+                f"{get_activity_text()}"
                 f"• Всего вычислений: {stats['total_calculations']}\n"
-                f"• Охват: {(stats['subscribed_users']/stats['total_users']*100) if stats['total_users'] > 0 else 0:.1f}%"
+                f"• Охват: {(stats['subscribed_users']/stats['total_users']*100) if stats['total_users'] > 0 else 0:.1f}%\n\n"
+                f"{await usage_analytics.get_report_text()}\n\n"
+                f"{get_staleness_text(usage_analytics.get_data_age())}"
             )
             await query.message.edit_text(stats_text, parse_mode=ParseMode.MARKDOWN)
             
-        elif action == "admin_users":
-            users = db.get_all_users()
+        elif action == cb.ADMIN_USERS:
+            await refresh_replica_if_stale()
+            users = db.get_recent_users(limit=5)
             
             if not users:
                 await query.message.edit_text("📭 В базе данных нет пользователей.")
                 return
             
+            total_users = db.get_stats_snapshot()['total_users']
             users_text = "👥 **Последние пользователи:**\n\n"
-            for user in users[:5]:
-                user_id, username, first_name, last_name, subscribed, created_at, last_activity, calculations_count, last_calculation = user
-                users_text += f"• {first_name} {last_name or ''} (@{username or 'нет'})\n  ID: {user_id} - {'✅' if subscribed else '❌'} - 🧮 {calculations_count or 0}\n\n"
+            for user in users:
+                users_text += (
+                    f"• {user.first_name} {user.last_name or ''} (@{user.username or 'нет'})\n"
+                    f"  ID: {user.user_id} - {'✅' if user.subscribed else '❌'} - 🧮 {user.calculations_count}\n\n"
+                )
             
-            if len(users) > 5:
-                users_text += f"... и еще {len(users) - 5} пользователей"
+            if total_users > len(users):
+                users_text += f"... и еще {total_users - len(users)} пользователей\n"
+            users_text += "📤 Полный список: /export users"
             
             await query.message.edit_text(users_text, parse_mode=ParseMode.MARKDOWN)
             
+        elif action == cb.ADMIN_BROADCAST_HISTORY:
+            await refresh_replica_if_stale()
+            broadcasts = db.get_broadcast_history(limit=5)
+            
+            if not broadcasts:
+                await query.message.edit_text("📭 Рассылок еще не было.")
+                return
+            
+            history_text = "📋 **История рассылок:**\n\n"
+            for broadcast in broadcasts:
+                message_text = broadcast.message_text or ''
+                preview = message_text[:40] + ('...' if len(message_text) > 40 else '')
+                history_text += (
+                    f"• #{broadcast.id} {str(broadcast.created_at)[:16]} - {broadcast.status}\n"
+                    f"  ✅ {broadcast.sent_count} / ❌ {broadcast.failed_count} из {broadcast.total_users}\n"
+                    f"  💬 {preview}\n\n"
+                )
+            
+            await query.message.edit_text(history_text)
+            
+        elif action == cb.ADMIN_EXPORT:
+            # Выгрузка может идти долго: отвечаем на callback сразу, файлы придут отдельными сообщениями
+            await query.answer("⏳ Готовим выгрузку...")
+            await send_export(query.message.chat.id, list(EXPORT_TABLES))
+            return
+        
+        elif action == cb.ADMIN_BROADCAST:
+            await state.set_state(BroadcastState.waiting_for_message)
+            await query.message.edit_text("📢 Отправьте текст рассылки одним сообщением.\n\n/cancel - отмена")
+            
+        elif action == cb.ADMIN_BROADCAST_CONFIRM:
+            data = await state.get_data()
+            message_text = data.get('broadcast_text')
+            await state.clear()
+            
+            if not message_text:
+                await query.answer("❌ Текст рассылки не найден", show_alert=True)
+                return
+            
+            # При темпе ~30 сообщений/сек рассылка идет минутами: отвечаем на callback сразу
+            await query.answer("⏳ Рассылка запущена")
+            await query.message.edit_text("⏳ Рассылка запущена, итог придет отдельным сообщением")
+            start_broadcast(query.message.chat.id, user_id, message_text)
+            return
+            
+        elif action == cb.ADMIN_BROADCAST_CANCEL:
+            await state.clear()
+            await query.message.edit_text("❌ Рассылка отменена")
+            
     except Exception as e:
         logger.error(f"❌ Ошибка в админ callback: {e}")
         debug_system.log_error(str(e), "admin_callback_handler", 0)
         await query.answer("❌ Ошибка выполнения", show_alert=True)
+        return
+    
+    await query.answer()
+
+for admin_action in (cb.ADMIN_STATS, cb.ADMIN_USERS, cb.ADMIN_BROADCAST_HISTORY, cb.ADMIN_BROADCAST,
+                     cb.ADMIN_BROADCAST_CONFIRM, cb.ADMIN_BROADCAST_CANCEL, cb.ADMIN_EXPORT):
+    callback_table.register(admin_action, partial(admin_callback_handler, action=admin_action))
+
+@dp.message(BroadcastState.waiting_for_message)
+@with_priority(PRIORITY_ADMIN)
+async def broadcast_message_handler(message: Message, state: FSMContext):
+    """Получает текст рассылки от админа"""
+    if str(message.from_user.id) != str(ADMIN_ID):
+        await state.clear()
+        return
+    
+    if message.text == '/cancel' or not message.text:
+        await state.clear()
+        await message.answer("❌ Рассылка отменена")
+        return
+    
+    await state.update_data(broadcast_text=message.text)
+    await state.set_state(BroadcastState.waiting_for_confirmation)
+    
+    total_users = len(db.get_users_for_broadcast())
+    await message.answer(
+        f"📢 Предпросмотр рассылки ({total_users} получателей):\n\n{message.text}",
+        reply_markup=get_broadcast_confirm_keyboard()
+    )
 
 # Обработчик калькулятора
-@dp.callback_query()
-async def calculator_callback_handler(query: types.CallbackQuery):
+async def calculator_callback_handler(query: types.CallbackQuery, state: FSMContext, key):
     user_id = query.from_user.id
     
     if not await check_user_access(user_id):
         await query.answer("❌ Подпишитесь на канал!", show_alert=True)
         return
     
-    session = db.get_calculator_session(user_id)
-    value = session[1] if session else ''
-    old_value = session[2] if session else ''
-    
-    data = query.data
+    session = sessions.get_calculator_session(user_id)
+    value = session.value if session else ''
+    old_value = session.old_value if session else ''
+    memory = session.memory if session else ''
+    scientific = session.scientific if session else False
     
+    data = key
+
     try:
         if data == 'C':
             value = ''
@@ -550,30 +1022,51 @@ async def calculator_callback_handler(query: types.CallbackQuery):
             value = value[:-1] if value else ''
         elif data == '=':
             try:
-                # Заменяем запятые на точки для вычисления
-                expression = value.replace(',', '.')
-                result = eval(expression)
-                value = str(result).replace('.', ',') if isinstance(result, float) else str(result)
-                # Увеличиваем счетчик вычислений
-                db.increment_calculation_count(user_id)
-                # Сохраняем в историю
-                db.add_calculation_history(user_id, value, str(result))
+                # Результаты и ошибки повторяющихся выражений берутся из общего кэша
+                # В сессию попадает полное значение, округляется только показ
+                expression, result, value = calculate_value(value)
+                # Счетчик, история и статистика вычислений одной транзакцией
+                db.record_calculation(user_id, expression, result)
+                activity.record(user_id, METRIC_CALCULATORS)
             except ZeroDivisionError:
+                db.record_calculation(user_id, normalize_expression(value), 'Ошибка: деление на 0!', is_error=True)
                 value = 'Ошибка: деление на 0!'
-            except:
+            except Exception:
+                db.record_calculation(user_id, normalize_expression(value), 'Ошибка вычисления!', is_error=True)
                 value = 'Ошибка вычисления!'
+        elif data == 'mode':
+            sessions.set_calculator_mode(user_id, not scientific)
+            await update_calculator(query.message.chat.id, user_id, query.message.message_id)
+        elif data in ('M+', 'M-'):
+            # Память меняется через тот же вычислитель с лимитами стоимости
+            try:
+                memory = memory_add(memory, value or '0', 1 if data == 'M+' else -1)
+                sessions.update_calculator_memory(user_id, memory)
+                await update_calculator(query.message.chat.id, user_id, query.message.message_id)
+            except ZeroDivisionError:
+                value = 'Ошибка: деление на 0!'
+            except Exception:
+                value = 'Ошибка вычисления!'
+        elif data == 'MR':
+            value += memory
+        elif data == 'MC':
+            if memory:
+                sessions.update_calculator_memory(user_id, '')
+                await update_calculator(query.message.chat.id, user_id, query.message.message_id)
+        elif data == '√':
+            value += '√('
         else:
             value += data
 
         if value != old_value:
             await update_calculator(query.message.chat.id, user_id, query.message.message_id)
-            db.update_calculator_session(user_id, value, value, query.message.message_id)
+            sessions.update_calculator_session(user_id, value, value, query.message.message_id)
 
         if 'Ошибка' in value:
             # Сбрасываем значение после показа ошибки
             await asyncio.sleep(1)
             value = ''
-            db.update_calculator_session(user_id, value, value, query.message.message_id)
+            sessions.update_calculator_session(user_id, value, value, query.message.message_id)
             await update_calculator(query.message.chat.id, user_id, query.message.message_id)
 
     except Exception as e:
@@ -583,13 +1076,25 @@ async def calculator_callback_handler(query: types.CallbackQuery):
 
     await query.answer()
 
+for calc_key, calc_code in {**cb.CALC_KEY_CODES, **cb.SCIENTIFIC_KEY_CODES}.items():
+    callback_table.register(calc_code, partial(calculator_callback_handler, key=calc_key))
+callback_table.register(cb.CALC_MODE, partial(calculator_callback_handler, key='mode'))
+
+@dp.callback_query()
+async def callback_dispatcher(query: types.CallbackQuery, state: FSMContext):
+    """Единая точка входа для всех callback-запросов"""
+    if not await callback_table.dispatch(query, state):
+        # Неизвестный callback отвечаем сразу, без обращений к БД
+        await query.answer()
+
 @dp.message()
 async def any_message_handler(message: Message):
     """Обработчик любого текстового сообщения"""
     user_id = message.from_user.id
     
     if message.text and not message.text.startswith('/'):
-        if not await check_user_access(user_id):
+        # Только проверка подписки (с кэшем): случайный текст не должен писать в БД
+        if not await check_user_subscription(user_id):
             await message.answer(
                 "🔒 Для использования калькулятора необходимо подписаться на наш канал!",
                 reply_markup=get_subscription_keyboard()
@@ -623,12 +1128,20 @@ async def background_maintenance():
             # Очищаем старые данные (с обработкой возможных блокировок)
             try:
                 db.cleanup_old_data(days=7)
+                # Сессии из SQLite чистит cleanup_old_data, из другого хранилища - само хранилище
+                if sessions is not db:
+                    deleted = sessions.cleanup_calculator_sessions(days=7)
+                    if deleted:
+                        logger.info(f"✅ Очищено {deleted} сессий в хранилище {SESSION_STORAGE}")
             except Exception as e:
                 if "locked" in str(e):
                     logger.warning("📝 База данных временно заблокирована, пропускаем очистку")
                 else:
                     logger.error(f"❌ Ошибка при очистке данных: {e}")
             
+            # Сохраняем скетчи активности
+            activity.flush()
+
             if DEBUG_MODE:
                 logger.info("✅ Фоновая задача обслуживания выполнена")
             
@@ -646,7 +1159,25 @@ async def graceful_shutdown():
     
     logger.info("🛑 Завершение работы бота...")
     
-    # Закрываем сессию бота
+    # Флаг уже поднят: рассылки останавливаются после текущего сообщения,
+    # сохраняют итог и сообщают админу «⚠️ Рассылка прервана»
+    if broadcast_tasks:
+        await asyncio.wait(set(broadcast_tasks), timeout=BROADCAST_SHUTDOWN_TIMEOUT)
+    
+    # Запросы, оставшиеся в очереди планировщика, уходят сразу, пока сессия открыта;
+    # рассылки, которые еще ждали токенов, после этого быстро дописывают итог
+    outbound_scheduler.close()
+    if broadcast_tasks:
+        await asyncio.wait(set(broadcast_tasks), timeout=BROADCAST_CLOSE_TIMEOUT)
+
+    # Дописываем изменения состояний FSM и скетчи активности в БД
+    await storage.close()
+    activity.flush()
+    if sessions is not db:
+        sessions.close()
+    
+    # Закрываем сессию бота (пул соединений)
+    logger.info(f"📊 HTTP-сессия: {http_session.get_stats()}")
     await bot.session.close()
     
     logger.info("✅ Бот корректно завершил работу")
@@ -662,33 +1193,33 @@ async def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
-    # Проверяем и завершаем другие экземпляры бота
-    if check_other_bot_instances():
-        logger.warning("⚠️ Обнаружены другие запущенные экземпляры бота")
-        killed_count = await kill_other_bot_instances()
-        if killed_count > 0:
-            logger.info("⏳ Ждем завершения процессов...")
-            await asyncio.sleep(3)
-    
     # Запускаем фоновые задачи
     maintenance_task = asyncio.create_task(background_maintenance())
+    heartbeat_task = asyncio.create_task(instance_lock.heartbeat_loop())
+    background_tasks = [maintenance_task, heartbeat_task]
+    if BACKUP_INTERVAL:
+        background_tasks.append(asyncio.create_task(backup_manager.schedule_loop()))
+    
+    logger.info(f"🚀 Бот запущен (версия {BOT_VERSION})")
+    logger.info(f"📢 Канал для подписки: {CHANNEL_USERNAME}")
+    logger.info(f"👑 Админ ID: {ADMIN_ID}")
+    if DEBUG_MODE:
+        logger.info("🔧 Режим отладки включен")
     
     try:
-        logger.info(f"🚀 Бот запущен (версия {BOT_VERSION})")
-        logger.info(f"📢 Канал для подписки: {CHANNEL_USERNAME}")
-        logger.info(f"👑 Админ ID: {ADMIN_ID}")
-        if DEBUG_MODE:
-            logger.info("🔧 Режим отладки включен")
-        
-        # Запускаем опрос с обработкой конфликтов
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
-        
-    except TelegramConflictError as e:
-        logger.error(f"❌ Конфликт бота: {e}")
-        logger.info("🔄 Попытка перезапуска через 10 секунд...")
-        await asyncio.sleep(10)
-        # Перезапускаем бота
-        await main()
+        # Запускаем опрос с обработкой конфликтов, без рекурсии и повторного запуска фоновых задач
+        for attempt in range(MAX_CONFLICT_RESTARTS + 1):
+            try:
+                await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+                break
+            except TelegramConflictError as e:
+                logger.error(f"❌ Конфликт бота: {e}")
+                if attempt == MAX_CONFLICT_RESTARTS or is_shutting_down:
+                    logger.error("❌ Превышено число перезапусков после конфликтов")
+                    break
+                delay = 10 + backoff_delay(attempt, base=5.0, cap=60.0)
+                logger.info(f"🔄 Попытка перезапуска через {delay:.0f} секунд...")
+                await asyncio.sleep(delay)
         
     except Exception as e:
         logger.error(f"❌ Критическая ошибка бота: {e}")
@@ -696,34 +1227,31 @@ async def main():
         
     finally:
         # Отменяем фоновые задачи
-        maintenance_task.cancel()
-        try:
-            await maintenance_task
-        except asyncio.CancelledError:
-            pass
-            
+        for task in background_tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        
         await graceful_shutdown()
 
-if __name__ == "__main__":
-    # Создаем файл блокировки
-    lock_file = "bot.lock"
+def run():
+    """Точка входа: запускает бота в текущем процессе"""
+    # Проверяем, не запущен ли уже бот (блокировку держит ядро, после падения она снимается сама)
+    if not instance_lock.acquire():
+        sys.exit(1)
     
     try:
-        # Проверяем, не запущен ли уже бот
-        if os.path.exists(lock_file):
-            logger.error("❌ Бот уже запущен! Удалите файл bot.lock если бот не работает")
-            sys.exit(1)
-        
-        # Создаем файл блокировки
-        with open(lock_file, 'w') as f:
-            f.write(str(os.getpid()))
-        
         asyncio.run(main())
         
     except Exception as e:
         logger.error(f"❌ Ошибка запуска: {e}")
         
     finally:
-        # Удаляем файл блокировки при завершении
-        if os.path.exists(lock_file):
-            os.remove(lock_file)
\ No newline at end of file
+        instance_lock.release()
+        # Дописываем очередь логов до выхода из процесса
+        logging_pipeline.stop()
+
+if __name__ == "__main__":
+    run()
\ No newline at end of file
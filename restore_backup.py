@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Восстановление базы данных из резервной копии
+
+Проверяет контрольную сумму и целостность снимка, сохраняет текущую БД
+рядом (calculator_bot.db.before-restore) и переносит снимок в БД через
+SQLite backup API, поэтому файлы -wal и -shm остаются согласованными.
+На время восстановления берется блокировка экземпляра: бот должен быть
+остановлен.
+
+Пример:
+    python restore_backup.py --list
+    python restore_backup.py                      # последний снимок
+    python restore_backup.py backups/calculator_bot_20240101_030000.db
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+from backup import list_snapshots, verify_snapshot
+from instance_lock import InstanceLock
+
+
+def copy_database(source_path, target_path):
+    source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+    try:
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Восстановление БД бота из снимка")
+    parser.add_argument("snapshot", nargs="?", help="файл снимка (по умолчанию самый свежий)")
+    parser.add_argument("--db", default="calculator_bot.db", help="восстанавливаемая БД")
+    parser.add_argument("--backup-dir", default="backups", help="каталог снимков")
+    parser.add_argument("--list", action="store_true", help="показать снимки и их проверку")
+    args = parser.parse_args()
+
+    snapshots = list_snapshots(args.backup_dir)
+    if args.list:
+        if not snapshots:
+            print(f"📭 В {args.backup_dir} нет снимков")
+        for path in snapshots:
+            error = verify_snapshot(path)
+            print(f"{'✅' if not error else '❌'} {path} ({os.path.getsize(path) // 1024} КБ){' - ' + error if error else ''}")
+        return 0
+
+    snapshot = args.snapshot or (snapshots[0] if snapshots else None)
+    if not snapshot:
+        print(f"❌ В {args.backup_dir} нет снимков")
+        return 1
+    error = verify_snapshot(snapshot)
+    if error:
+        print(f"❌ Снимок {snapshot} поврежден: {error}")
+        return 1
+
+    lock = InstanceLock("bot.lock")
+    if not lock.acquire():
+        print("❌ Бот запущен, остановите его перед восстановлением")
+        return 1
+    try:
+        if os.path.exists(args.db):
+            before = args.db + ".before-restore"
+            copy_database(args.db, before)
+            print(f"💾 Текущая БД сохранена в {before}")
+        copy_database(snapshot, args.db)
+    finally:
+        lock.release()
+    print(f"✅ БД {args.db} восстановлена из {snapshot}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Настройки бота и история обновлений в памяти
+
+bot_settings и update_history читаются из БД один раз при запуске:
+- чтения идут из словаря и списка в памяти, без обращения к SQLite;
+- запись сразу уходит в БД (write-through) и увеличивает счетчик версии;
+- готовые тексты (приветствие, помощь, «Что нового») кэшируются
+  вместе с версией и пересобираются, только когда версия изменилась.
+Процесс бота единственный (InstanceLock), поэтому изменения в обход
+сервиса не ожидаются.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних записей истории обновлений держать в памяти
+UPDATE_HISTORY_LIMIT = 50
+
+
+class SettingsService:
+    def __init__(self, persistence, update_history_limit=UPDATE_HISTORY_LIMIT):
+        self.persistence = persistence
+        self.update_history_limit = update_history_limit
+        self._settings = {}
+        # [UpdateRecord] от новых к старым
+        self._updates = []
+        # Имя текста -> (версия, текст)
+        self._rendered = {}
+        self.version = 0
+        self.writes = 0
+        self.renders = 0
+        self.render_hits = 0
+        self.load()
+
+    def load(self):
+        """Перечитывает настройки и историю обновлений из БД"""
+        self._settings = self.persistence.get_bot_settings()
+        self._updates = self.persistence.get_update_history(self.update_history_limit)
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+
+    def get(self, key, default=None):
+        return self._settings.get(key, default)
+
+    def set(self, key, value):
+        """Записывает настройку в БД и в память; без изменений ничего не пишет
+        
+        Память меняется только после успешной записи в БД; возвращает успех.
+        """
+        if self._settings.get(key) == value:
+            return True
+        if not self.persistence.set_bot_setting(key, value):
+            return False
+        self._settings[key] = value
+        self.writes += 1
+        self._changed()
+        return True
+
+    def get_update_history(self, limit=5):
+        return self._updates[:limit]
+
+    def get_changes(self, version):
+        """Текст изменений версии или None"""
+        for update in self._updates:
+            if update.version == version:
+                return update.changes_text
+        return None
+
+    def add_update(self, version, changes_text):
+        self.persistence.add_update_history(version, changes_text)
+        self._updates = self.persistence.get_update_history(self.update_history_limit)
+        self.writes += 1
+        self._changed()
+
+    def sync_update_history(self, changes_by_version):
+        """Приводит update_history к словарю: новые версии добавляются, измененные тексты перезаписываются
+        
+        Наличие версии проверяет БД по всей таблице, а не по последним записям в памяти.
+        """
+        written = 0
+        for version, changes_text in changes_by_version.items():
+            if self.persistence.upsert_update_history(version, changes_text.strip()):
+                written += 1
+                logger.info(f"🆕 История обновлений: записана версия {version}")
+        if written:
+            self._updates = self.persistence.get_update_history(self.update_history_limit)
+            self.writes += written
+            self._changed()
+
+    def render(self, name, builder):
+        """Текст из кэша, пока не изменились настройки; иначе builder() и новый кэш"""
+        cached = self._rendered.get(name)
+        if cached is not None and cached[0] == self.version:
+            self.render_hits += 1
+            return cached[1]
+        text = builder()
+        self._rendered[name] = (self.version, text)
+        self.renders += 1
+        return text
+
+    def get_stats(self):
+        return {
+            'settings': len(self._settings),
+            'updates': len(self._updates),
+            'version': self.version,
+            'writes': self.writes,
+            'renders': self.renders,
+            'render_hits': self.render_hits,
+        }
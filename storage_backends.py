@@ -0,0 +1,682 @@
+#!/usr/bin/env python3
+"""
+Хранилища данных бота
+
+Общий интерфейс StorageBackend (abc.ABC: хранилище без какого-либо
+метода не создается) для пользователей, сессий калькулятора,
+истории вычислений, рассылок и настроек. Методы возвращают записи с
+именованными полями (UserProfile, CalculatorSession, ...), а не кортежи.
+Реализации:
+- bot_database.Database - SQLite, основное хранилище бота;
+- MemoryStorage - словари в памяти, для проверок и бенчмарков;
+- DbmStorage - ключ-значение на стандартном dbm, для горячего пути
+  сессий калькулятора; выборки по всем пользователям идут полным
+  перебором ключей.
+Все реализации проходят одну проверку bench_storage.py.
+"""
+
+import dbm
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('sqlite', 'memory', 'dbm')
+
+# Сколько последних вычислений пользователя хранят MemoryStorage и DbmStorage
+HISTORY_LIMIT = 100
+
+
+class Record:
+    """Запись с полями из __slots__; значения передаются в порядке полей"""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def as_tuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other.as_tuple() == self.as_tuple()
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class UserProfile(Record):
+    """Данные пользователя для экрана профиля"""
+    __slots__ = ('user_id', 'username', 'first_name', 'last_name', 'subscribed', 'notifications_enabled',
+                 'calculations_count', 'created_at', 'last_activity', 'last_calculation')
+
+    COLUMNS = ', '.join(__slots__)
+
+    def __init__(self, user_id, username, first_name, last_name, subscribed, notifications_enabled,
+                 calculations_count, created_at, last_activity, last_calculation):
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.subscribed = bool(subscribed)
+        self.notifications_enabled = bool(notifications_enabled)
+        self.calculations_count = calculations_count or 0
+        self.created_at = created_at
+        self.last_activity = last_activity
+        self.last_calculation = last_calculation
+
+
+class CalculatorSession(Record):
+    __slots__ = ('user_id', 'value', 'old_value', 'message_id', 'last_activity', 'memory', 'scientific')
+
+    COLUMNS = ', '.join(__slots__)
+
+    def __init__(self, user_id, value, old_value, message_id, last_activity, memory, scientific):
+        super().__init__(user_id, value or '', old_value or '', message_id, last_activity,
+                         memory or '', bool(scientific))
+
+
+class CalculationRecord(Record):
+    __slots__ = ('expression', 'result', 'calculation_date')
+
+    COLUMNS = ', '.join(__slots__)
+
+
+class BroadcastRecord(Record):
+    __slots__ = ('id', 'admin_id', 'message_text', 'sent_count', 'failed_count', 'total_users',
+                 'created_at', 'status')
+
+    COLUMNS = ', '.join(__slots__)
+
+
+class UpdateRecord(Record):
+    __slots__ = ('id', 'version', 'changes_text', 'release_date')
+
+    COLUMNS = ', '.join(__slots__)
+
+
+class StorageBackend(ABC):
+    """Интерфейс хранилища; ошибки реализации логируют и возвращают значение по умолчанию"""
+
+    # Пользователи
+    @abstractmethod
+    def create_user(self, user_id, username, first_name, last_name):
+        """Создает пользователя, существующего не трогает"""
+
+    @abstractmethod
+    def get_user_profile(self, user_id):
+        """UserProfile или None"""
+
+    @abstractmethod
+    def update_profile_data(self, user_id, username=None, first_name=None, last_name=None):
+        """Обновляет переданные (не None) поля профиля"""
+
+    @abstractmethod
+    def update_subscription_status(self, user_id, subscribed):
+        pass
+
+    @abstractmethod
+    def toggle_user_notifications(self, user_id, enabled):
+        pass
+
+    @abstractmethod
+    def get_user_notifications_status(self, user_id):
+        """Включены ли уведомления; для неизвестного пользователя True"""
+
+    @abstractmethod
+    def get_users_for_broadcast(self, only_subscribed=True):
+        """user_id пользователей с включенными уведомлениями (и подпиской)"""
+
+    @abstractmethod
+    def get_recent_users(self, limit=5):
+        """Последние зарегистрированные пользователи, [UserProfile] от новых к старым"""
+
+    # Сессии калькулятора
+    @abstractmethod
+    def get_calculator_session(self, user_id):
+        """CalculatorSession или None"""
+
+    @abstractmethod
+    def update_calculator_session(self, user_id, value, old_value, message_id):
+        """Сохраняет ввод калькулятора, не сбрасывая память и режим"""
+
+    @abstractmethod
+    def update_calculator_memory(self, user_id, memory):
+        pass
+
+    @abstractmethod
+    def set_calculator_mode(self, user_id, scientific):
+        pass
+
+    @abstractmethod
+    def reset_calculator_session(self, user_id):
+        pass
+    
+    @abstractmethod
+    def count_calculator_sessions(self):
+        """Число сохраненных сессий калькулятора"""
+    
+    @abstractmethod
+    def cleanup_calculator_sessions(self, days=30):
+        """Удаляет сессии без активности дольше days дней; возвращает число удаленных"""
+
+    # История вычислений
+    @abstractmethod
+    def record_calculation(self, user_id, expression, result, is_error=False):
+        """Учитывает вычисление; успешное увеличивает счетчик пользователя и попадает в историю"""
+
+    @abstractmethod
+    def get_user_calculation_history(self, user_id, limit=10):
+        """[CalculationRecord] от новых к старым"""
+
+    # Рассылки
+    @abstractmethod
+    def create_broadcast(self, admin_id, message_text, total_users=0):
+        """Заводит рассылку со статусом 'sending' и возвращает ее id"""
+
+    @abstractmethod
+    def update_broadcast_stats(self, broadcast_id, sent_count, failed_count, status='completed'):
+        pass
+
+    @abstractmethod
+    def get_broadcast_history(self, limit=5):
+        """[BroadcastRecord] от новых к старым"""
+
+    # Настройки и история обновлений
+    @abstractmethod
+    def get_bot_setting(self, key):
+        """Значение настройки или None"""
+
+    @abstractmethod
+    def get_bot_settings(self):
+        """Все настройки: {key: value}"""
+    
+    @abstractmethod
+    def set_bot_setting(self, key, value):
+        """Записывает настройку; True, если запись удалась"""
+
+    @abstractmethod
+    def add_update_history(self, version, changes_text):
+        pass
+    
+    @abstractmethod
+    def upsert_update_history(self, version, changes_text):
+        """Добавляет версию или меняет ее текст, проверяя всю историю; True, если что-то записано"""
+
+    @abstractmethod
+    def get_update_history(self, limit=5):
+        """[UpdateRecord] от новых к старым"""
+
+    def close(self):
+        """Освобождает ресурсы хранилища"""
+
+
+def _now():
+    # Тот же формат, в котором sqlite3 сохраняет datetime
+    return str(datetime.now())
+
+
+def _user_row(user_id, username, first_name, last_name):
+    now = _now()
+    return [user_id, username, first_name, last_name, False, True, 0, now, now, None]
+
+
+def _session_row(user_id):
+    return [user_id, '', '', None, _now(), '', False]
+
+
+def _session_cutoff(days):
+    # last_activity хранится строкой _now(), такие строки сравниваются как даты
+    return str(datetime.now() - timedelta(days=days))
+
+
+# Индексы полей в строках пользователей и сессий
+_USER_FIELDS = {name: index for index, name in enumerate(UserProfile.__slots__)}
+_SESSION_FIELDS = {name: index for index, name in enumerate(CalculatorSession.__slots__)}
+
+
+class MemoryStorage(StorageBackend):
+    """Хранилище в словарях процесса; строки хранятся списками, наружу отдаются новые записи"""
+
+    def __init__(self, history_limit=HISTORY_LIMIT):
+        self.history_limit = history_limit
+        self._lock = threading.Lock()
+        self._users = {}
+        self._sessions = {}
+        self._history = {}
+        self._broadcasts = []
+        self._settings = {}
+        self._updates = []
+
+    def create_user(self, user_id, username, first_name, last_name):
+        with self._lock:
+            if user_id not in self._users:
+                self._users[user_id] = _user_row(user_id, username, first_name, last_name)
+
+    def get_user_profile(self, user_id):
+        row = self._users.get(user_id)
+        return UserProfile(*row) if row is not None else None
+
+    def _update_user(self, user_id, **fields):
+        with self._lock:
+            row = self._users.get(user_id)
+            if row is not None:
+                for name, value in fields.items():
+                    row[_USER_FIELDS[name]] = value
+
+    def update_profile_data(self, user_id, username=None, first_name=None, last_name=None):
+        fields = {'username': username, 'first_name': first_name, 'last_name': last_name}
+        self._update_user(user_id, **{name: value for name, value in fields.items() if value is not None})
+
+    def update_subscription_status(self, user_id, subscribed):
+        self._update_user(user_id, subscribed=bool(subscribed))
+
+    def toggle_user_notifications(self, user_id, enabled):
+        self._update_user(user_id, notifications_enabled=bool(enabled))
+
+    def get_user_notifications_status(self, user_id):
+        row = self._users.get(user_id)
+        return row[_USER_FIELDS['notifications_enabled']] if row is not None else True
+
+    def get_users_for_broadcast(self, only_subscribed=True):
+        with self._lock:
+            rows = list(self._users.values())
+        return [row[0] for row in rows
+                if row[_USER_FIELDS['notifications_enabled']]
+                and (row[_USER_FIELDS['subscribed']] or not only_subscribed)]
+
+    def get_recent_users(self, limit=5):
+        with self._lock:
+            rows = sorted(self._users.values(), key=lambda row: row[_USER_FIELDS['created_at']], reverse=True)
+        return [UserProfile(*row) for row in rows[:limit]]
+
+    def get_calculator_session(self, user_id):
+        row = self._sessions.get(user_id)
+        return CalculatorSession(*row) if row is not None else None
+
+    def _update_session(self, user_id, **fields):
+        with self._lock:
+            row = self._sessions.get(user_id)
+            if row is None:
+                row = self._sessions[user_id] = _session_row(user_id)
+            for name, value in fields.items():
+                row[_SESSION_FIELDS[name]] = value
+            row[_SESSION_FIELDS['last_activity']] = _now()
+
+    def update_calculator_session(self, user_id, value, old_value, message_id):
+        self._update_session(user_id, value=value, old_value=old_value, message_id=message_id)
+
+    def update_calculator_memory(self, user_id, memory):
+        self._update_session(user_id, memory=memory)
+
+    def set_calculator_mode(self, user_id, scientific):
+        self._update_session(user_id, scientific=bool(scientific))
+
+    def reset_calculator_session(self, user_id):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+    
+    def count_calculator_sessions(self):
+        return len(self._sessions)
+    
+    def cleanup_calculator_sessions(self, days=30):
+        cutoff = _session_cutoff(days)
+        with self._lock:
+            expired = [user_id for user_id, row in self._sessions.items()
+                       if row[_SESSION_FIELDS['last_activity']] < cutoff]
+            for user_id in expired:
+                del self._sessions[user_id]
+        return len(expired)
+
+    def record_calculation(self, user_id, expression, result, is_error=False):
+        if is_error:
+            return
+        now = _now()
+        with self._lock:
+            row = self._users.get(user_id)
+            if row is not None:
+                row[_USER_FIELDS['calculations_count']] += 1
+                row[_USER_FIELDS['last_calculation']] = now
+                row[_USER_FIELDS['last_activity']] = now
+            history = self._history.setdefault(user_id, [])
+            history.append((expression, result, now))
+            if len(history) > self.history_limit:
+                del history[:-self.history_limit]
+
+    def get_user_calculation_history(self, user_id, limit=10):
+        history = self._history.get(user_id, [])
+        return [CalculationRecord(*row) for row in reversed(history[-limit:])]
+
+    def create_broadcast(self, admin_id, message_text, total_users=0):
+        with self._lock:
+            broadcast_id = len(self._broadcasts) + 1
+            self._broadcasts.append([broadcast_id, admin_id, message_text, 0, 0, total_users, _now(), 'sending'])
+            return broadcast_id
+
+    def update_broadcast_stats(self, broadcast_id, sent_count, failed_count, status='completed'):
+        with self._lock:
+            if 1 <= broadcast_id <= len(self._broadcasts):
+                self._broadcasts[broadcast_id - 1][3:5] = [sent_count, failed_count]
+                self._broadcasts[broadcast_id - 1][7] = status
+
+    def get_broadcast_history(self, limit=5):
+        return [BroadcastRecord(*row) for row in reversed(self._broadcasts[-limit:])]
+
+    def get_bot_setting(self, key):
+        return self._settings.get(key)
+
+    def get_bot_settings(self):
+        return dict(self._settings)
+    
+    def set_bot_setting(self, key, value):
+        self._settings[key] = value
+        return True
+
+    def add_update_history(self, version, changes_text):
+        with self._lock:
+            self._updates.append((len(self._updates) + 1, version, changes_text, _now()))
+    
+    def upsert_update_history(self, version, changes_text):
+        with self._lock:
+            rows = [index for index, row in enumerate(self._updates) if row[1] == version]
+            if not rows:
+                self._updates.append((len(self._updates) + 1, version, changes_text, _now()))
+                return True
+            if all(self._updates[index][2] == changes_text for index in rows):
+                return False
+            for index in rows:
+                row = self._updates[index]
+                self._updates[index] = (row[0], version, changes_text, row[3])
+            return True
+
+    def get_update_history(self, limit=5):
+        return [UpdateRecord(*row) for row in reversed(self._updates[-limit:])]
+
+
+class DbmStorage(StorageBackend):
+    """Хранилище на dbm: каждая запись - JSON-список полей под ключом вида 'session:<user_id>'"""
+
+    def __init__(self, path='calculator_bot.dbm', history_limit=HISTORY_LIMIT):
+        self.path = path
+        self.history_limit = history_limit
+        # Объекты dbm не потокобезопасны
+        self._lock = threading.Lock()
+        self._db = dbm.open(path, 'c')
+        self.flavor = dbm.whichdb(path) or 'dbm'
+
+    def _get(self, key):
+        value = self._db.get(key.encode())
+        return json.loads(value) if value is not None else None
+
+    def _put(self, key, value):
+        self._db[key.encode()] = json.dumps(value, ensure_ascii=False)
+
+    def _delete(self, key):
+        try:
+            del self._db[key.encode()]
+        except KeyError:
+            pass
+
+    def _scan(self, prefix):
+        """Все значения с ключами на prefix - полный перебор ключей"""
+        prefix = prefix.encode()
+        return [json.loads(self._db[key]) for key in self._db.keys() if key.startswith(prefix)]
+
+    def create_user(self, user_id, username, first_name, last_name):
+        try:
+            with self._lock:
+                if self._get(f'user:{user_id}') is None:
+                    self._put(f'user:{user_id}', _user_row(user_id, username, first_name, last_name))
+        except Exception as e:
+            logger.error(f"❌ Ошибка создания пользователя {user_id} в dbm: {e}")
+
+    def get_user_profile(self, user_id):
+        try:
+            with self._lock:
+                row = self._get(f'user:{user_id}')
+            return UserProfile(*row) if row is not None else None
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения профиля {user_id} из dbm: {e}")
+            return None
+
+    def _update_user(self, user_id, **fields):
+        try:
+            with self._lock:
+                row = self._get(f'user:{user_id}')
+                if row is not None:
+                    for name, value in fields.items():
+                        row[_USER_FIELDS[name]] = value
+                    self._put(f'user:{user_id}', row)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления пользователя {user_id} в dbm: {e}")
+
+    def update_profile_data(self, user_id, username=None, first_name=None, last_name=None):
+        fields = {'username': username, 'first_name': first_name, 'last_name': last_name}
+        self._update_user(user_id, **{name: value for name, value in fields.items() if value is not None})
+
+    def update_subscription_status(self, user_id, subscribed):
+        self._update_user(user_id, subscribed=bool(subscribed))
+
+    def toggle_user_notifications(self, user_id, enabled):
+        self._update_user(user_id, notifications_enabled=bool(enabled))
+
+    def get_user_notifications_status(self, user_id):
+        profile = self.get_user_profile(user_id)
+        return profile.notifications_enabled if profile is not None else True
+
+    def get_users_for_broadcast(self, only_subscribed=True):
+        try:
+            with self._lock:
+                rows = self._scan('user:')
+            return [row[0] for row in rows
+                    if row[_USER_FIELDS['notifications_enabled']]
+                    and (row[_USER_FIELDS['subscribed']] or not only_subscribed)]
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения пользователей для рассылки из dbm: {e}")
+            return []
+
+    def get_recent_users(self, limit=5):
+        try:
+            with self._lock:
+                rows = self._scan('user:')
+            rows.sort(key=lambda row: row[_USER_FIELDS['created_at']], reverse=True)
+            return [UserProfile(*row) for row in rows[:limit]]
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения последних пользователей из dbm: {e}")
+            return []
+
+    def get_calculator_session(self, user_id):
+        try:
+            with self._lock:
+                row = self._get(f'session:{user_id}')
+            return CalculatorSession(*row) if row is not None else None
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения сессии {user_id} из dbm: {e}")
+            return None
+
+    def _update_session(self, user_id, **fields):
+        try:
+            with self._lock:
+                row = self._get(f'session:{user_id}') or _session_row(user_id)
+                for name, value in fields.items():
+                    row[_SESSION_FIELDS[name]] = value
+                row[_SESSION_FIELDS['last_activity']] = _now()
+                self._put(f'session:{user_id}', row)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления сессии {user_id} в dbm: {e}")
+
+    def update_calculator_session(self, user_id, value, old_value, message_id):
+        self._update_session(user_id, value=value, old_value=old_value, message_id=message_id)
+
+    def update_calculator_memory(self, user_id, memory):
+        self._update_session(user_id, memory=memory)
+
+    def set_calculator_mode(self, user_id, scientific):
+        self._update_session(user_id, scientific=bool(scientific))
+
+    def reset_calculator_session(self, user_id):
+        with self._lock:
+            self._delete(f'session:{user_id}')
+    
+    def count_calculator_sessions(self):
+        try:
+            with self._lock:
+                return sum(1 for key in self._db.keys() if key.startswith(b'session:'))
+        except Exception as e:
+            logger.error(f"❌ Ошибка подсчета сессий в dbm: {e}")
+            return 0
+    
+    def cleanup_calculator_sessions(self, days=30):
+        cutoff = _session_cutoff(days)
+        try:
+            with self._lock:
+                expired = [row[0] for row in self._scan('session:')
+                           if row[_SESSION_FIELDS['last_activity']] < cutoff]
+                for user_id in expired:
+                    self._delete(f'session:{user_id}')
+            return len(expired)
+        except Exception as e:
+            logger.error(f"❌ Ошибка очистки сессий в dbm: {e}")
+            return 0
+
+    def record_calculation(self, user_id, expression, result, is_error=False):
+        if is_error:
+            return
+        now = _now()
+        try:
+            with self._lock:
+                row = self._get(f'user:{user_id}')
+                if row is not None:
+                    row[_USER_FIELDS['calculations_count']] += 1
+                    row[_USER_FIELDS['last_calculation']] = now
+                    row[_USER_FIELDS['last_activity']] = now
+                    self._put(f'user:{user_id}', row)
+                history = self._get(f'history:{user_id}') or []
+                history.append([expression, result, now])
+                self._put(f'history:{user_id}', history[-self.history_limit:])
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи вычисления {user_id} в dbm: {e}")
+
+    def get_user_calculation_history(self, user_id, limit=10):
+        try:
+            with self._lock:
+                history = self._get(f'history:{user_id}') or []
+            return [CalculationRecord(*row) for row in reversed(history[-limit:])]
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения истории вычислений {user_id} из dbm: {e}")
+            return []
+
+    def create_broadcast(self, admin_id, message_text, total_users=0):
+        try:
+            with self._lock:
+                broadcast_id = (self._get('broadcast_seq') or 0) + 1
+                self._put(f'broadcast:{broadcast_id}',
+                          [broadcast_id, admin_id, message_text, 0, 0, total_users, _now(), 'sending'])
+                self._put('broadcast_seq', broadcast_id)
+                return broadcast_id
+        except Exception as e:
+            logger.error(f"❌ Ошибка создания рассылки в dbm: {e}")
+            return None
+
+    def update_broadcast_stats(self, broadcast_id, sent_count, failed_count, status='completed'):
+        try:
+            with self._lock:
+                row = self._get(f'broadcast:{broadcast_id}')
+                if row is not None:
+                    row[3:5] = [sent_count, failed_count]
+                    row[7] = status
+                    self._put(f'broadcast:{broadcast_id}', row)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления статистики рассылки {broadcast_id} в dbm: {e}")
+
+    def get_broadcast_history(self, limit=5):
+        try:
+            with self._lock:
+                last = self._get('broadcast_seq') or 0
+                rows = [self._get(f'broadcast:{broadcast_id}')
+                        for broadcast_id in range(last, max(last - limit, 0), -1)]
+            return [BroadcastRecord(*row) for row in rows if row is not None]
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения истории рассылок из dbm: {e}")
+            return []
+
+    def get_bot_setting(self, key):
+        try:
+            with self._lock:
+                return self._get(f'setting:{key}')
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения настройки {key} из dbm: {e}")
+            return None
+
+    def get_bot_settings(self):
+        try:
+            with self._lock:
+                return {key.decode()[len('setting:'):]: json.loads(self._db[key])
+                        for key in self._db.keys() if key.startswith(b'setting:')}
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения настроек из dbm: {e}")
+            return {}
+    
+    def set_bot_setting(self, key, value):
+        try:
+            with self._lock:
+                self._put(f'setting:{key}', value)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка установки настройки {key} в dbm: {e}")
+            return False
+
+    def add_update_history(self, version, changes_text):
+        try:
+            with self._lock:
+                updates = self._get('updates') or []
+                updates.append([len(updates) + 1, version, changes_text, _now()])
+                self._put('updates', updates)
+        except Exception as e:
+            logger.error(f"❌ Ошибка добавления истории обновлений в dbm: {e}")
+    
+    def upsert_update_history(self, version, changes_text):
+        try:
+            with self._lock:
+                updates = self._get('updates') or []
+                rows = [row for row in updates if row[1] == version]
+                if rows and all(row[2] == changes_text for row in rows):
+                    return False
+                for row in rows:
+                    row[2] = changes_text
+                if not rows:
+                    updates.append([len(updates) + 1, version, changes_text, _now()])
+                self._put('updates', updates)
+                return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи версии {version} в историю обновлений dbm: {e}")
+            return False
+
+    def get_update_history(self, limit=5):
+        try:
+            with self._lock:
+                updates = self._get('updates') or []
+            return [UpdateRecord(*row) for row in reversed(updates[-limit:])]
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения истории обновлений из dbm: {e}")
+            return []
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_backend(kind='sqlite', path=None):
+    """Создает хранилище по имени из BACKENDS; path - файл БД (для memory не нужен)"""
+    if kind == 'sqlite':
+        from bot_database import Database
+        return Database(db_name=path or 'calculator_bot.db')
+    if kind == 'memory':
+        return MemoryStorage()
+    if kind == 'dbm':
+        return DbmStorage(path or 'calculator_bot.dbm')
+    raise ValueError(f"неизвестное хранилище: {kind}")